@@ -5,33 +5,134 @@ This module provides the application factory pattern for creating Flask app inst
 Routes are organized in separate blueprint modules in the routes package.
 """
 
+import click
 from flask import Flask
-from database import init_database, add_sample_data
+from database import (
+    init_database, add_sample_data, configure_pool, set_performance_profile, set_database_path,
+    begin_connection_scope, end_connection_scope
+)
 from routes import register_blueprints
+from services.library_service import set_search_backend
+from services.payment_jobs import payment_jobs
+from services.profiling import register_profiling
+from services.query_stats import register_query_stats
+from services.search_cache import search_cache
+from services.search_index import build_search_index
 
 
-def create_app():
+def prepare_database(sample_data: bool = False, force: bool = False) -> bool:
+    """
+    Create or migrate the schema, and optionally load the sample books.
+    Runs once per deployment, either at boot or in a preloading parent process.
+    
+    Args:
+        sample_data: Add the sample books if the catalog is empty
+        force: Re-apply the schema even if it is up to date
+    
+    Returns:
+        bool: True if the schema was (re)applied
+    """
+    applied = init_database(force)
+    if sample_data:
+        add_sample_data()
+    return applied
+
+
+def create_app(config=None):
     """
     Application factory function to create and configure Flask app.
     
+    Args:
+        config: Optional dict of settings that override the defaults
+    
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
     app.secret_key = "super secret key"
+    app.config.update(
+        DATABASE=None,
+        DB_POOL_SIZE=5,
+        DB_POOL_TIMEOUT=5.0,
+        DB_POOL_HEALTH_CHECK_INTERVAL=30.0,
+        DB_PROFILE='durable',
+        SEARCH_BACKEND='trigram',
+        SEARCH_INDEX=True,
+        SEARCH_CACHE_SIZE=1024,
+        PAYMENT_WORKERS=2,
+        INIT_DATABASE=True,
+        SAMPLE_DATA=False,
+        DB_QUERY_STATS=None,
+        DB_SLOW_QUERY_MS=100.0,
+        METRICS_DIR=None,
+        METRICS_FLUSH_INTERVAL=1.0,
+        PROFILER='cprofile',
+        PROFILE_SAMPLE_RATE=0.0,
+        PROFILE_SECRET=None,
+        PROFILE_DIR='profiles',
+        PROFILE_MAX_PER_MINUTE=6,
+    )
+    if config:
+        app.config.update(config)
+    
+    # Use another database file than database.DATABASE (e.g. one per test)
+    if app.config['DATABASE']:
+        set_database_path(app.config['DATABASE'])
     
-    # Initialize the database
-    init_database()
+    # Pick the SQLite settings ("legacy", "durable" or "fast")
+    set_performance_profile(app.config['DB_PROFILE'])
     
-    # Add sample data for testing and demonstration
-    add_sample_data()
+    # Set up the connection pool and give each request one pooled connection
+    configure_pool(
+        max_size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        health_check_interval=app.config['DB_POOL_HEALTH_CHECK_INTERVAL'],
+    )
+    app.before_request(begin_connection_scope)
+    app.teardown_request(end_connection_scope)
+    
+    # Count and time each request's queries (on in debug mode unless DB_QUERY_STATS says otherwise)
+    register_query_stats(app)
+    
+    # Profile sampled or explicitly requested (signed X-Profile header) requests
+    register_profiling(app)
+    
+    # Initialize the database; a no-op beyond one read once the schema is current.
+    # Preloading servers run prepare_database() in the parent and set INIT_DATABASE=False.
+    if app.config['INIT_DATABASE']:
+        prepare_database(app.config['SAMPLE_DATA'])
+    
+    # Search through the trigram index (substrings) or FTS5 (word prefixes)
+    set_search_backend(app.config['SEARCH_BACKEND'])
+    
+    # Load the in-memory search index; it follows new books from then on.
+    # Only the trigram backend reads it.
+    if app.config['SEARCH_INDEX'] and app.config['SEARCH_BACKEND'] == 'trigram':
+        build_search_index()
+    
+    # Cache popular search results (0 turns the cache off)
+    search_cache.maxsize = app.config['SEARCH_CACHE_SIZE']
+    search_cache.clear()
+    
+    # Run queued payments in the background, resuming any left over from the last run
+    if app.config['PAYMENT_WORKERS']:
+        payment_jobs.start(app.config['PAYMENT_WORKERS'])
     
     # Register all route blueprints
     register_blueprints(app)
     
+    @app.cli.command('init-db')
+    @click.option('--sample-data', is_flag=True, help='Also add the sample books if the catalog is empty.')
+    @click.option('--force', is_flag=True, help='Re-apply the schema even if it is up to date.')
+    def init_db_command(sample_data, force):
+        """Create or migrate the database schema: flask --app app init-db --sample-data"""
+        applied = prepare_database(sample_data, force)
+        click.echo('Schema applied.' if applied else 'Schema already up to date.')
+    
     return app
 
 
 if __name__ == '__main__':
-    app = create_app()
+    # The development server comes with the sample books
+    app = create_app({'SAMPLE_DATA': True, 'DEBUG': True})
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,4 @@
+"""
+Benchmarks Package - Performance measurements for the Library Management System
+Each module can be run directly, e.g. ``python -m benchmarks.bench_borrow_transactions``
+"""
@@ -0,0 +1,88 @@
+"""
+Async Payment Benchmark
+Pays late fees for many patrons through a local stub gateway, first one at a time with
+the blocking client and then concurrently with the asyncio client.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from services.library_service import pay_late_fees, pay_late_fees_async
+from services.payment_service import AsyncPaymentGateway, PaymentGateway
+
+
+class StubGateway(PaymentGateway):
+    """Blocking stub with a configurable round-trip time."""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.PROCESS_DELAY = self.REFUND_DELAY = self.STATUS_DELAY = latency
+
+
+class AsyncStubGateway(AsyncPaymentGateway):
+    """asyncio stub with a configurable round-trip time."""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.PROCESS_DELAY = self.REFUND_DELAY = self.STATUS_DELAY = latency
+
+
+def seed(patrons: int, first_patron: int = 100000) -> list:
+    """One overdue loan per patron; returns the (patron_id, book_id) pairs."""
+    isbn = f'{first_patron:013d}'
+    database.insert_book('Overdue Book', 'Author', isbn, patrons, 0)
+    book_id = database.get_book_by_isbn(isbn)['id']
+    due = datetime.now() - timedelta(days=10)
+    loans = [(f'{first_patron + i}', book_id) for i in range(patrons)]
+    for patron_id, _ in loans:
+        database.insert_borrow_record(patron_id, book_id, due - timedelta(days=14), due)
+    return loans
+
+
+async def pay_concurrently(loans, gateway, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def pay(patron_id, book_id):
+        async with limit:
+            return await pay_late_fees_async(patron_id, book_id, gateway)
+
+    return await asyncio.gather(*(pay(p, b) for p, b in loans))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--payments', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.1, help='stub gateway round-trip in seconds')
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.init_database()
+        # Each pass pays its own loans; fees paid by the first would leave nothing for the second
+        loans = seed(args.payments)
+        async_loans = seed(args.payments, first_patron=100000 + args.payments)
+
+        began = time.perf_counter()
+        results = [pay_late_fees(p, b, StubGateway(args.latency)) for p, b in loans]
+        blocking = time.perf_counter() - began
+        assert all(r[0] for r in results)
+
+        began = time.perf_counter()
+        results = asyncio.run(pay_concurrently(async_loans, AsyncStubGateway(args.latency), args.concurrency))
+        concurrent = time.perf_counter() - began
+        assert all(r[0] for r in results)
+        database.close_pool()
+
+    print('payments', args.payments, 'gateway_latency_s', args.latency)
+    print('blocking_seconds', round(blocking, 2), 'payments_per_sec', round(args.payments / blocking, 1))
+    print('async_seconds', round(concurrent, 2), 'payments_per_sec', round(args.payments / concurrent, 1))
+
+
+if __name__ == '__main__':
+    main()
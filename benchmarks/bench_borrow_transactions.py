@@ -0,0 +1,82 @@
+"""
+Borrow Transaction Benchmark
+Compares the old two-commit borrow path with borrow_book_transaction under concurrent borrowers.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database
+
+
+def legacy_borrow(patron_id: str, book_id: int) -> bool:
+    """The pre-transaction borrow path: check, insert record, update availability."""
+    book = database.get_book_by_id(book_id)
+    if not book or book['available_copies'] <= 0:
+        return False
+    now = datetime.now()
+    if not database.insert_borrow_record(patron_id, book_id, now, now + timedelta(days=14)):
+        return False
+    return database.update_book_availability(book_id, -1)
+
+
+def transactional_borrow(patron_id: str, book_id: int) -> bool:
+    now = datetime.now()
+    return database.borrow_book_transaction(patron_id, book_id, now, now + timedelta(days=14)) == 'borrowed'
+
+
+def run(borrow, threads: int, attempts: int, copies: int) -> dict:
+    """Hammer one book with concurrent borrows and report throughput and oversell."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.configure_pool(max_size=threads)
+        database.init_database()
+        database.insert_book('Bench', 'Author', '1234567890123', copies, copies)
+        book_id = database.get_book_by_isbn('1234567890123')['id']
+
+        successes = []
+        start = threading.Barrier(threads)
+
+        def worker(n):
+            start.wait()
+            for i in range(attempts):
+                if borrow(f"{n:03d}{i % 1000:03d}", book_id):
+                    successes.append(1)
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        began = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - began
+
+        available = database.get_book_by_id(book_id)['available_copies']
+        database.close_pool()
+
+    return {
+        'ops_per_sec': round(threads * attempts / elapsed, 1),
+        'loans': len(successes),
+        'copies': copies,
+        'available_copies': available,
+        'oversold': max(len(successes) - copies, 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=50)
+    parser.add_argument('--copies', type=int, default=200)
+    args = parser.parse_args()
+
+    for name, borrow in (('legacy', legacy_borrow), ('transactional', transactional_borrow)):
+        print(name, run(borrow, args.threads, args.attempts, args.copies))
+
+
+if __name__ == '__main__':
+    main()
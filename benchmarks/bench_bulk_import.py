@@ -0,0 +1,68 @@
+"""
+Bulk Import Benchmark
+Loads a synthetic catalog once through add_book_to_catalog, one book at a time,
+and once through the chunked bulk importer, and reports rows/sec for both.
+"""
+
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+
+import database
+from benchmarks import datagen
+from services.catalog_import import import_books, read_rows
+from services.library_service import add_book_to_catalog
+from services.search_index import build_search_index, catalog_index
+
+
+def make_csv(rows: int, seed: int) -> str:
+    rng = random.Random(seed)
+    out = io.StringIO()
+    out.write('title,author,isbn,total_copies\n')
+    for i in range(rows):
+        title = ' '.join(rng.choice(datagen.WORDS) for _ in range(rng.randint(1, 4))).title()
+        author = f'{rng.choice(datagen.FIRST_NAMES)} {rng.choice(datagen.LAST_NAMES)}'
+        out.write(f'{title} {i},{author},{9780000000000 + i},{rng.randint(1, 5)}\n')
+    return out.getvalue()
+
+
+def fresh_database(tmp: str, name: str):
+    database.DATABASE = os.path.join(tmp, name)
+    database.init_database()
+    build_search_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--single-rows', type=int, default=2000, help='rows loaded one at a time (slow)')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=327)
+    args = parser.parse_args()
+
+    text = make_csv(args.rows, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        fresh_database(tmp, 'single.db')
+        rows = list(read_rows(io.StringIO(text), 'csv'))[:args.single_rows]
+        began = time.perf_counter()
+        for _, row, _ in rows:
+            add_book_to_catalog(row['title'], row['author'], row['isbn'], int(row['total_copies']))
+        single = time.perf_counter() - began
+
+        fresh_database(tmp, 'bulk.db')
+        report = import_books(read_rows(io.StringIO(text), 'csv'), args.chunk_size)
+        assert report['imported'] == args.rows, report['errors'][:5]
+
+        database.remove_book_listener(catalog_index.add)
+        database.close_pool()
+
+    print('add_book_to_catalog rows', len(rows), 'rows_per_sec', round(len(rows) / single, 1))
+    print('bulk import         rows', report['rows'], 'rows_per_sec', report['rows_per_sec'],
+          'chunk_size', args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
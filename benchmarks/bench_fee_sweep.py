@@ -0,0 +1,92 @@
+"""
+Fee Sweep Benchmark
+Times the library-wide late fee sweep on synthetic open loans against the per-loan
+calculate_late_fee_for_book path (measured on a sample and extrapolated).
+
+    python -m benchmarks.bench_fee_sweep --loans 10000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from services import fee_sweep
+from services.library_service import calculate_late_fee_for_book
+
+
+def seed(loans: int, books: int, rng: random.Random, batch: int = 200000):
+    """Insert synthetic open loans; due dates spread from 30 days ahead to 60 days overdue."""
+    now = datetime.now()
+    conn = database.get_db_connection()
+    conn.executemany('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(f'Title {i}', 'Author', f'{i:013d}', 1, 1) for i in range(books)])
+    for start in range(0, loans, batch):
+        rows = []
+        for i in range(start, min(start + batch, loans)):
+            due = now - timedelta(minutes=rng.randint(-30 * 1440, 60 * 1440))
+            rows.append((f'{i % 900000 + 100000}', i % books + 1,
+                         (due - timedelta(days=14)).isoformat(), due.isoformat()))
+        conn.executemany('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+    conn.close()
+
+
+def per_call_seconds(loans: int, sample: int) -> float:
+    """Time calculate_late_fee_for_book on a sample of loans and scale to all of them."""
+    conn = database.get_db_connection()
+    pairs = conn.execute(
+        'SELECT patron_id, book_id FROM borrow_records LIMIT ?', (sample,)
+    ).fetchall()
+    conn.close()
+    began = time.perf_counter()
+    for patron_id, book_id in pairs:
+        calculate_late_fee_for_book(patron_id, book_id)
+    return (time.perf_counter() - began) / len(pairs) * loans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loans', type=int, default=1000000)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--sample', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=327)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.set_performance_profile('fast')
+        database.init_database()
+        began = time.perf_counter()
+        seed(args.loans, args.books, rng)
+        print('seed_seconds', round(time.perf_counter() - began, 1))
+
+        began = time.perf_counter()
+        report = fee_sweep.sweep_late_fees()
+        sweep = time.perf_counter() - began
+
+        due_dates = [d for chunk in database.iter_open_loans(args.loans) for _, _, d, _ in chunk]
+        began = time.perf_counter()
+        fee_sweep.compute_fees(due_dates, datetime.now())
+        arithmetic = time.perf_counter() - began
+
+        print('engine', 'numpy' if fee_sweep.np is not None else 'python')
+        print('loans', report['open_loans'], 'overdue', report['overdue_loans'], 'total_fees', report['total_fees'])
+        print('sweep_seconds', round(sweep, 2), 'loans_per_sec', round(args.loans / sweep))
+        print('fee_arithmetic_seconds', round(arithmetic, 2))
+        print('per_call_seconds_estimated', round(per_call_seconds(args.loans, args.sample), 1))
+        database.close_pool()
+        database.set_performance_profile(database.DEFAULT_PROFILE)
+
+
+if __name__ == '__main__':
+    main()
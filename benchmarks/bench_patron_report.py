@@ -0,0 +1,78 @@
+"""
+Patron Report Benchmark
+Compares the old N+1 patron status report with the single-query version for a patron with many loans.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from services.library_service import calculate_late_fee_for_book, get_patron_status_report
+
+PATRON = '123456'
+
+
+def legacy_report(patron_id: str) -> dict:
+    """The previous get_patron_status_report: one fee lookup (three queries) per open loan."""
+    borrowed = database.get_patron_borrowed_books(patron_id)
+    num_current_borrowed = database.get_patron_borrow_count(patron_id)
+    late_fees = 0.0
+    for book in borrowed:
+        late_fees += calculate_late_fee_for_book(patron_id, book['book_id']).get('fee_amount', 0.0)
+    return {'num_current_borrowed': num_current_borrowed, 'late_fees': round(late_fees, 2)}
+
+
+def seed(open_loans: int, returned_loans: int):
+    now = datetime.now()
+    conn = database.get_db_connection()
+    books = open_loans + returned_loans
+    conn.executemany('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(f'Title {i}', 'Author', f'{i:013d}', 1, 1) for i in range(books)])
+    loans = []
+    for i in range(books):
+        borrowed = now - timedelta(days=14 + i % 30)
+        returned = (borrowed + timedelta(days=3)).isoformat() if i >= open_loans else None
+        loans.append((PATRON, i + 1, borrowed.isoformat(), (borrowed + timedelta(days=14)).isoformat(), returned))
+    conn.executemany('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', loans)
+    conn.commit()
+    conn.close()
+
+
+def measure(report) -> dict:
+    conn = database.get_db_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    began = time.perf_counter()
+    result = report(PATRON)
+    elapsed = time.perf_counter() - began
+    conn.set_trace_callback(None)
+    conn.close()
+    return {'ms': round(elapsed * 1000, 2), 'queries': len(statements), 'late_fees': result['late_fees']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--open-loans', type=int, nargs='+', default=[5, 50, 500])
+    parser.add_argument('--returned-loans', type=int, default=2000)
+    args = parser.parse_args()
+
+    for open_loans in args.open_loans:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DATABASE = os.path.join(tmp, 'bench.db')
+            database.init_database()
+            seed(open_loans, args.returned_loans)
+            print(f'open_loans={open_loans}', 'legacy', measure(legacy_report),
+                  'single_query', measure(get_patron_status_report))
+            database.close_pool()
+
+
+if __name__ == '__main__':
+    main()
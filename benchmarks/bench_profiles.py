@@ -0,0 +1,93 @@
+"""
+Performance Profile Benchmark
+Runs concurrent catalog readers and borrow/return writers against each SQLite profile.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database
+
+
+def _seed(books: int):
+    conn = database.get_db_connection()
+    conn.executemany('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(f'Title {i}', f'Author {i % 97}', f'{i:013d}', 1000, 1000) for i in range(books)])
+    conn.commit()
+    conn.close()
+
+
+def run(profile: str, readers: int, writers: int, seconds: float, books: int) -> dict:
+    """Measure reads/sec and writes/sec with readers and writers running at once."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.set_performance_profile(profile)
+        database.configure_pool(max_size=readers + writers)
+        database.init_database()
+        _seed(books)
+
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def reader():
+            done = 0
+            while not stop.is_set():
+                database.get_all_books()
+                done += 1
+            with lock:
+                counts['reads'] += done
+
+        def writer(n):
+            done = errors = 0
+            patron = f'{n:06d}'
+            while not stop.is_set():
+                book_id = 1 + done % books
+                now = datetime.now()
+                if database.borrow_book_transaction(patron, book_id, now, now + timedelta(days=14)) != 'borrowed':
+                    errors += 1
+                if database.return_book_transaction(patron, book_id, now) != 'returned':
+                    errors += 1
+                done += 2
+            with lock:
+                counts['writes'] += done
+                counts['errors'] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        database.close_pool()
+
+    return {
+        'reads_per_sec': round(counts['reads'] / seconds, 1),
+        'writes_per_sec': round(counts['writes'] / seconds, 1),
+        'write_errors': counts['errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--books', type=int, default=500)
+    args = parser.parse_args()
+
+    for profile in database.PERFORMANCE_PROFILES:
+        print(profile, run(profile, args.readers, args.writers, args.seconds, args.books))
+    database.set_performance_profile(database.DEFAULT_PROFILE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Payment Reconciliation Benchmark
+Checks the status of many transactions through a local stub gateway: one at a time,
+concurrently, and again once the terminal statuses are cached. Reports statuses/sec.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import database
+from services.payment_service import AsyncPaymentGateway, PaymentGateway, PaymentStatusCache
+from services.reconciliation import reconcile_payments
+
+
+class StubGateway(PaymentGateway):
+    """Blocking stub with a configurable round-trip time."""
+
+    def __init__(self, latency: float, status_cache: PaymentStatusCache):
+        super().__init__(status_cache=status_cache)
+        self.STATUS_DELAY = latency
+
+
+class AsyncStubGateway(AsyncPaymentGateway):
+    """asyncio stub with a configurable round-trip time."""
+
+    def __init__(self, latency: float, status_cache: PaymentStatusCache):
+        super().__init__(status_cache=status_cache)
+        self.STATUS_DELAY = latency
+
+
+def sequential(transaction_ids, gateway) -> float:
+    """The old way: one verify_payment_status call after another."""
+    began = time.perf_counter()
+    statuses = [(txn, gateway.verify_payment_status(txn)['status'], True) for txn in transaction_ids]
+    database.record_payment_statuses(statuses)
+    return time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='stub gateway round-trip in seconds')
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    transaction_ids = [f'txn_{100000 + i}_{i}' for i in range(args.transactions)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.init_database()
+
+        rows = [('one_at_a_time', sequential(
+            transaction_ids, StubGateway(args.latency, PaymentStatusCache(maxsize=0))))]
+
+        cache = PaymentStatusCache()
+        gateway = AsyncStubGateway(args.latency, cache)
+        for name in ('concurrent', 'concurrent_cached'):
+            report = reconcile_payments(transaction_ids, gateway, args.concurrency)
+            assert report['errors'] == 0
+            rows.append((name, report['seconds']))
+        database.close_pool()
+
+    print('transactions', args.transactions, 'gateway_latency_s', args.latency, 'concurrency', args.concurrency)
+    for name, seconds in rows:
+        print(f'{name:<20} seconds {seconds:8.3f}  statuses_per_sec {args.transactions / seconds:10.1f}')
+    print('cache', cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Search Cache Benchmark
+Replays a Zipfian mix of catalog searches, with an occasional borrow or return
+in between, with the result cache off and on. Reports queries/sec and the
+cache counters.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from benchmarks import datagen
+from services.library_service import search_books_in_catalog
+from services.search_cache import search_cache
+from services.search_index import build_search_index, catalog_index
+
+
+def query_pool(distinct: int, rng: random.Random) -> list:
+    """Distinct (term, type) pairs, most popular first."""
+    pool = set()
+    while len(pool) < distinct:
+        kind = rng.random()
+        if kind < 0.6:
+            word = rng.choice(datagen.WORDS)
+            pool.add((word[:rng.randint(3, len(word))], 'title'))
+        elif kind < 0.9:
+            pool.add((rng.choice(datagen.LAST_NAMES).lower()[:rng.randint(3, 6)], 'author'))
+        else:
+            pool.add((f'97800{rng.randrange(10 ** 5):05d}', 'isbn'))
+    return sorted(pool)
+
+
+def replay(queries, writes, cache_size: int) -> float:
+    search_cache.maxsize = cache_size
+    search_cache.clear()
+    search_cache.hits = search_cache.misses = search_cache.evictions = search_cache.invalidations = 0
+    now = datetime.now()
+    began = time.perf_counter()
+    for i, (term, field) in enumerate(queries):
+        write = writes.get(i)
+        if write is not None:
+            # Borrow, then return, so the catalog ends the run unchanged
+            database.borrow_book_transaction('999999', write, now, now + timedelta(days=14))
+            database.return_book_transaction('999999', write, now)
+        search_books_in_catalog(term, field)
+    return time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=500, help='distinct queries in the mix')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of query popularity')
+    parser.add_argument('--write-every', type=int, default=100, help='queries between availability changes')
+    parser.add_argument('--cache-size', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=327)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    pool = query_pool(args.distinct, rng)
+    rng.shuffle(pool)
+    queries = rng.choices(pool, weights=datagen.zipf_weights(len(pool), args.skew), k=args.queries)
+    weights = datagen.zipf_weights(args.books)
+    writes = {i: rng.choices(range(1, args.books + 1), weights=weights)[0]
+              for i in range(0, args.queries, args.write_every)} if args.write_every else {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.init_database()
+        datagen.generate(books=args.books, patrons=max(args.books // 10, 10), loans=0, seed=args.seed)
+        build_search_index()
+
+        uncached = replay(queries, writes, 0)
+        cached = replay(queries, writes, args.cache_size)
+        stats = search_cache.stats()
+
+        database.remove_book_listener(catalog_index.add)
+        database.close_pool()
+
+    print('books', args.books, 'queries', args.queries, 'distinct', args.distinct, 'skew', args.skew,
+          'writes', len(writes))
+    print('no_cache   seconds', round(uncached, 3), 'queries_per_sec', round(args.queries / uncached, 1))
+    print('cache      seconds', round(cached, 3), 'queries_per_sec', round(args.queries / cached, 1))
+    print('cache_stats', stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Search Index Benchmark
+Reports the trigram index footprint and compares its query latency with the old linear scan.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import database
+from services.search_index import TrigramIndex
+
+WORDS = ['river', 'night', 'garden', 'empire', 'silent', 'winter', 'shadow', 'golden', 'last',
+         'journey', 'house', 'storm', 'letters', 'island', 'forgotten', 'crown', 'glass', 'fire']
+NAMES = ['Smith', 'Garcia', 'Okafor', 'Nguyen', 'Kowalski', 'Haddad', 'Tanaka', 'Silva', 'Novak']
+
+
+def linear_scan(search_term: str, field: str):
+    """The original search_books_in_catalog: load every book and test each one."""
+    term = search_term.lower()
+    return [book for book in database.get_all_books() if term in book[field].lower()]
+
+
+def seed(books: int, rng: random.Random):
+    conn = database.get_db_connection()
+    rows = []
+    for i in range(books):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title() + f' {i}'
+        author = f'{rng.choice(NAMES)} {rng.choice(NAMES)}'
+        rows.append((title, author, f'{9780000000000 + i}', 1, 1))
+    conn.executemany('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+
+def time_queries(search, queries, repeat: int) -> float:
+    """Return the mean milliseconds per query."""
+    began = time.perf_counter()
+    for _ in range(repeat):
+        for term, field in queries:
+            search(term, field)
+    return round((time.perf_counter() - began) * 1000 / (repeat * len(queries)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=327)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    queries = [('forgotten crown', 'title'), ('okafor', 'author'), ('ilent', 'title'),
+               ('9780000012', 'isbn'), (f'{args.books // 2}', 'title')]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.init_database()
+        seed(args.books, rng)
+
+        index = TrigramIndex()
+        began = time.perf_counter()
+        index.build(database.get_all_books())
+        build_seconds = round(time.perf_counter() - began, 3)
+
+        for term, field in queries:
+            assert len(index.search(term, field)) == len(linear_scan(term, field))
+
+        print('memory', index.memory_usage())
+        print('build_seconds', build_seconds)
+        print('linear_scan_ms', time_queries(linear_scan, queries, args.repeat))
+        print('trigram_index_ms', time_queries(index.search, queries, args.repeat))
+        database.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Startup Benchmark
+Starts workers the way a WSGI server would and reports the cold-start time of each
+one, from interpreter start to the first /catalog response:
+
+    first_boot  empty database, schema created and sample books added
+    full_init   the old behaviour: DDL and sample data check on every boot
+    fast_path   current schema, one read at boot
+    preload     the parent prepares the app once and forks workers (POSIX only)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import database
+from benchmarks import datagen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = r"""
+import json, sys, time
+began = time.perf_counter()
+import database
+database.DATABASE = sys.argv[1]
+mode = sys.argv[2]
+from app import create_app
+if mode == 'full_init':
+    database.init_database(force=True)
+    database.add_sample_data()
+app = create_app({'INIT_DATABASE': mode != 'full_init', 'SAMPLE_DATA': mode == 'first_boot', 'PAYMENT_WORKERS': 0})
+ready = time.perf_counter()
+app.test_client().get('/catalog')
+done = time.perf_counter()
+print(json.dumps({'ready_ms': (ready - began) * 1000, 'first_response_ms': (done - began) * 1000}))
+"""
+
+
+def spawn_worker(path: str, mode: str) -> dict:
+    result = subprocess.run([sys.executable, '-c', WORKER, path, mode], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def forked_workers(path: str, workers: int) -> tuple:
+    """Prepare the app once, then time each forked worker up to its first response."""
+    from app import create_app, prepare_database
+
+    began = time.perf_counter()
+    database.DATABASE = path
+    prepare_database()
+    app = create_app({'INIT_DATABASE': False, 'PAYMENT_WORKERS': 0})
+    database.close_pool()
+    parent_ms = (time.perf_counter() - began) * 1000
+
+    timings = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            app.test_client().get('/catalog')
+            os.write(write, str((time.perf_counter() - forked) * 1000).encode())
+            os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as pipe:
+            timings.append({'ready_ms': 0.0, 'first_response_ms': float(pipe.read())})
+        os.waitpid(pid, 0)
+    return parent_ms, timings
+
+
+def summarize(mode: str, timings: list) -> str:
+    ready = statistics.median(t['ready_ms'] for t in timings)
+    first = statistics.median(t['first_response_ms'] for t in timings)
+    return f'{mode:<11} workers {len(timings):3d}  ready_ms {ready:8.1f}  first_response_ms {first:8.1f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        lines = []
+        first = [spawn_worker(os.path.join(tmp, f'empty{i}.db'), 'first_boot') for i in range(args.workers)]
+        lines.append(summarize('first_boot', first))
+
+        path = os.path.join(tmp, 'library.db')
+        database.DATABASE = path
+        database.init_database()
+        datagen.generate(books=args.books, patrons=max(args.books // 10, 10), loans=args.books, seed=327)
+        database.close_pool()
+
+        for mode in ('full_init', 'fast_path'):
+            lines.append(summarize(mode, [spawn_worker(path, mode) for _ in range(args.workers)]))
+
+        if hasattr(os, 'fork'):
+            parent_ms, timings = forked_workers(path, args.workers)
+            lines.append(summarize('preload', timings) + f'  (parent once: {parent_ms:.1f} ms)')
+            database.close_pool()
+
+    print('books', args.books)
+    print('\n'.join(lines))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Synthetic Data Generator - Seeded library data for benchmarks
+Creates books, patrons and loans with a realistic skew: a few popular titles
+and heavy readers account for most of the loans.
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import database
+
+WORDS = ['river', 'night', 'garden', 'empire', 'silent', 'winter', 'shadow', 'golden', 'last',
+         'journey', 'house', 'storm', 'letters', 'island', 'forgotten', 'crown', 'glass', 'fire',
+         'ocean', 'stone', 'secret', 'summer', 'city', 'wolf', 'daughter', 'king', 'paper', 'road']
+FIRST_NAMES = ['Ada', 'Kofi', 'Mei', 'Ivan', 'Leila', 'Tomas', 'Priya', 'Sam', 'Noor', 'Elena']
+LAST_NAMES = ['Smith', 'Garcia', 'Okafor', 'Nguyen', 'Kowalski', 'Haddad', 'Tanaka', 'Silva',
+              'Novak', 'Brown', 'Dubois', 'Kim', 'Mensah', 'Rossi', 'Olsen']
+
+MAX_OPEN_LOANS = 5
+
+
+def zipf_weights(n: int, s: float = 1.1) -> List[float]:
+    """Zipf-like weights: item k is picked in proportion to 1 / k**s."""
+    return [1.0 / (k ** s) for k in range(1, n + 1)]
+
+
+def patron_ids(patrons: int) -> List[str]:
+    """Deterministic 6-digit patron IDs."""
+    return [f'{100000 + i}' for i in range(patrons)]
+
+
+def generate(books: int, patrons: int, loans: int, open_fraction: float = 0.1,
+             seed: int = 327, now: datetime = None) -> Dict:
+    """
+    Fill the current database (already initialized and empty) with synthetic data.
+
+    Args:
+        books: Number of books
+        patrons: Number of patrons
+        loans: Number of loans, historical and open
+        open_fraction: Share of loans that are still open
+        seed: Random seed; the same arguments always produce the same data
+        now: Reference time for loan dates (defaults to now)
+
+    Returns:
+        dict: Counts of what was created
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    patron_list = patron_ids(patrons)
+
+    catalog = []
+    for i in range(books):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        author = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        copies = rng.choice((1, 1, 2, 2, 3, 5))
+        catalog.append([f'{title} {i}', author, f'{9780000000000 + i}', copies, copies])
+
+    # Popular books and heavy readers get most of the traffic
+    book_weights = zipf_weights(books)
+    patron_weights = zipf_weights(patrons, 0.8)
+    book_picks = rng.choices(range(books), weights=book_weights, k=loans)
+    patron_picks = rng.choices(range(patrons), weights=patron_weights, k=loans)
+
+    records = []
+    open_per_patron = [0] * patrons
+    open_count = 0
+    target_open = int(loans * open_fraction)
+    for book, patron in zip(book_picks, patron_picks):
+        wants_open = open_count < target_open and rng.random() < open_fraction
+        if wants_open and open_per_patron[patron] < MAX_OPEN_LOANS and catalog[book][4] > 0:
+            # Recent loan, some of them overdue
+            borrowed = now - timedelta(days=rng.uniform(0, 40))
+            catalog[book][4] -= 1
+            open_per_patron[patron] += 1
+            open_count += 1
+            returned = None
+        else:
+            borrowed = now - timedelta(days=rng.uniform(40, 730))
+            returned = (borrowed + timedelta(days=rng.uniform(1, 20))).isoformat()
+        due = borrowed + timedelta(days=14)
+        records.append((patron_list[patron], book + 1, borrowed.isoformat(), due.isoformat(), returned))
+
+    conn = database.get_db_connection()
+    conn.executemany('''
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?)
+    ''', catalog)
+    conn.executemany('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', records)
+    conn.commit()
+    conn.close()
+
+    return {'books': books, 'patrons': patrons, 'loans': loans, 'open_loans': open_count}
@@ -0,0 +1,155 @@
+"""
+Service Benchmark Suite
+Times the main service functions against synthetic libraries of several sizes and
+writes the results as JSON, so runs can be compared between releases.
+
+    python -m benchmarks.suite --sizes 1000 10000 100000 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import database
+from benchmarks import datagen
+from services.library_service import (
+    add_book_to_catalog, borrow_book_by_patron, return_book_by_patron,
+    search_books_in_catalog, get_patron_status_report
+)
+from services.search_index import build_search_index, catalog_index
+
+
+def summarize(timings: List[float]) -> Dict:
+    """Latency statistics in milliseconds for a list of durations in seconds."""
+    ms = sorted(t * 1000 for t in timings)
+    return {
+        'calls': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 4),
+        'p50_ms': round(ms[len(ms) // 2], 4),
+        'p95_ms': round(ms[min(int(len(ms) * 0.95), len(ms) - 1)], 4),
+        'max_ms': round(ms[-1], 4),
+    }
+
+
+def time_calls(func: Callable, calls: List[tuple]) -> Dict:
+    """Call func(*args) for each argument tuple and summarize the latencies."""
+    timings = []
+    for args in calls:
+        began = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - began)
+    return summarize(timings)
+
+
+def plan_calls(size: int, ops: int, rng: random.Random) -> Dict[str, List[tuple]]:
+    """Pick the arguments for every timed call up front, from the generated data."""
+    conn = database.get_db_connection()
+    available = [row[0] for row in conn.execute('SELECT id FROM books WHERE available_copies > 0')]
+    open_loans = conn.execute(
+        'SELECT DISTINCT patron_id, book_id FROM borrow_records WHERE return_date IS NULL'
+    ).fetchall()
+    busy = {row[0] for row in conn.execute(
+        'SELECT patron_id FROM borrow_records WHERE return_date IS NULL GROUP BY patron_id HAVING COUNT(*) >= 5'
+    )}
+    conn.close()
+
+    patrons = datagen.patron_ids(max(size // 10, 10))
+    readers = rng.choices(patrons, weights=datagen.zipf_weights(len(patrons), 0.8), k=ops)
+    borrowers = [p for p in patrons if p not in busy]
+    searches = []
+    for _ in range(ops):
+        kind = rng.random()
+        if kind < 0.6:
+            searches.append((rng.choice(datagen.WORDS)[:rng.randint(3, 6)], 'title'))
+        elif kind < 0.9:
+            searches.append((rng.choice(datagen.LAST_NAMES).lower(), 'author'))
+        else:
+            searches.append((f'{9780000000000 + rng.randrange(size)}', 'isbn'))
+
+    return {
+        'add_book_to_catalog': [(f'Bench Title {i}', 'Bench Author', f'{9790000000000 + i}', 2)
+                                for i in range(ops)],
+        'borrow_book_by_patron': [(rng.choice(borrowers), rng.choice(available)) for _ in range(ops)],
+        'return_book_by_patron': [tuple(loan) for loan in rng.sample(open_loans, min(ops, len(open_loans)))],
+        'search_books_in_catalog': searches,
+        'get_patron_status_report': [(patron,) for patron in readers],
+    }
+
+
+OPERATIONS = {
+    'add_book_to_catalog': add_book_to_catalog,
+    'borrow_book_by_patron': borrow_book_by_patron,
+    'return_book_by_patron': return_book_by_patron,
+    'search_books_in_catalog': search_books_in_catalog,
+    'get_patron_status_report': get_patron_status_report,
+}
+
+
+def run_size(size: int, ops: int, seed: int) -> List[Dict]:
+    """Generate a library with `size` books and time every operation on it."""
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.init_database()
+        counts = datagen.generate(books=size, patrons=max(size // 10, 10), loans=size * 3, seed=seed)
+        build_search_index()
+        calls = plan_calls(size, ops, rng)
+
+        results = []
+        for name, func in OPERATIONS.items():
+            stats = time_calls(func, calls[name]) if calls[name] else summarize([0.0])
+            results.append({'size': size, 'operation': name, **counts, **stats})
+
+        database.remove_book_listener(catalog_index.add)
+        database.close_pool()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--ops', type=int, default=200, help='timed calls per operation and size')
+    parser.add_argument('--seed', type=int, default=327)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'profile': database.get_performance_profile(),
+            'seed': args.seed,
+            'ops': args.ops,
+        },
+        'results': [row for size in args.sizes for row in run_size(size, args.ops, args.seed)],
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
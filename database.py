@@ -3,22 +3,668 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import json
+import os
+import re
+import secrets
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Database configuration; LIBRARY_DATABASE or set_database_path() points the helpers elsewhere
+DATABASE = os.environ.get('LIBRARY_DATABASE', 'library.db')
+
+# Connection pool defaults
+POOL_SIZE = 5
+POOL_TIMEOUT = 5.0
+POOL_HEALTH_CHECK_INTERVAL = 30.0
+
+# Bump whenever init_database() creates or changes a table, index or trigger,
+# so existing databases are migrated on their next boot
+SCHEMA_VERSION = 3
+
+# A pending ledger entry older than this (seconds) is assumed abandoned and may be retried
+PAYMENT_PENDING_TIMEOUT = 600
+
+# A running payment job not updated for this long (seconds) is assumed abandoned
+# by a worker that died, and may be taken over by another
+PAYMENT_JOB_LEASE = 120
+
+# SQLite performance profiles, selectable with set_performance_profile().
+# journal_mode is stored in the database file and applied by init_database();
+# the other settings are per connection and applied when a connection is opened.
+PERFORMANCE_PROFILES = {
+    # SQLite's own defaults: rollback journal, readers wait on writers
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+    # WAL so readers never block behind a borrow, but every commit is fsynced
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+    },
+    # WAL with fsync only at checkpoints; a power loss can drop the last commits
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+}
+DEFAULT_PROFILE = 'durable'
+_profile = DEFAULT_PROFILE
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    SQLite connection handed out by a ConnectionPool.
+
+    Calling close() gives the connection back instead of closing it, so the
+    existing helpers keep their open/close pattern unchanged.
+    """
+
+    pool = None
+    last_used = 0.0
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.checkin(self)
+
+    def really_close(self):
+        """Close the underlying SQLite handle."""
+        sqlite3.Connection.close(self)
+
+
+class QueryStats:
+    """
+    Statements run on one thread between start_query_stats() and
+    stop_query_stats(), i.e. during one Flask request.
+
+    Statements are grouped by their SQL text, so a query repeated in a loop
+    shows up as one entry with a high call count.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # SQL text -> [calls, total seconds, seconds of the slowest call]
+        self.statements: Dict[str, List] = {}
+
+    def _entry(self, sql: str) -> List:
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = [0, 0.0, 0.0]
+        entry[0] += 1
+        self.count += 1
+        return entry
+
+    def slowest(self, limit: int = 5) -> List[Dict]:
+        """Return the statements with the slowest single call, slowest first."""
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][2], reverse=True)
+        return [{'sql': ' '.join(sql.split()), 'calls': calls, 'total_ms': round(total * 1000, 3),
+                 'max_ms': round(slowest * 1000, 3)}
+                for sql, (calls, total, slowest) in ranked[:limit]]
+
+
+_query_stats = threading.local()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execution and fetching into the thread's QueryStats."""
+
+    _stats: Optional[QueryStats] = None
+    _entry: Optional[List] = None
+    _elapsed = 0.0
+
+    def _add(self, seconds: float):
+        self._elapsed += seconds
+        self._stats.seconds += seconds
+        self._entry[1] += seconds
+        if self._elapsed > self._entry[2]:
+            self._entry[2] = self._elapsed
+
+    def _run(self, method, sql: str, *args):
+        stats = getattr(_query_stats, 'current', None)
+        if stats is None:
+            self._stats = None
+            return method(self, sql, *args)
+        start = time.perf_counter()
+        try:
+            return method(self, sql, *args)
+        finally:
+            self._stats, self._entry, self._elapsed = stats, stats._entry(sql), 0.0
+            self._add(time.perf_counter() - start)
+
+    def _fetch(self, method, *args):
+        if self._stats is None:
+            return method(self, *args)
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._run(sqlite3.Cursor.executescript, sql_script)
+
+    def fetchone(self):
+        return self._fetch(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetch(lambda cursor: sqlite3.Cursor.fetchmany(cursor, *args, **kwargs))
+
+    def fetchall(self):
+        return self._fetch(sqlite3.Cursor.fetchall)
+
+    def __next__(self):
+        return self._fetch(sqlite3.Cursor.__next__)
+
+
+class InstrumentedConnection(PooledConnection):
+    """Pooled connection whose cursors report to QueryStats; used only while query stats are on."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C implementations of these create a plain cursor, so route them through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections shared by the helpers in this module.
+
+    Each thread holds at most one connection at a time: nested calls on the
+    same thread share it, and it goes back to the pool once the last caller
+    closes it (or when the surrounding request scope ends).
+    """
+
+    def __init__(self, database: str, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL):
+        """
+        Args:
+            database: Path of the SQLite database file
+            max_size: Maximum number of open connections
+            timeout: Seconds to wait for a free connection before giving up
+            health_check_interval: Idle seconds after which a connection is pinged before reuse
+        """
+        if max_size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle: List[PooledConnection] = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.waits = 0
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(self.database, factory=_connection_factory, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # SQLite's lower() only folds ASCII; searches fold case like Python does
+        conn.create_function('unicode_lower', 1, _unicode_lower, deterministic=True)
+        apply_connection_pragmas(conn)
+        conn.pool = self
+        self.created += 1
+        return conn
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.OperationalError("Connection pool is closed.")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError("Timed out waiting for a database connection.")
+                self.waits += 1
+                self._cond.wait(remaining)
+
+        if conn is not None and self._is_healthy(conn):
+            self.reused += 1
+            return conn
+
+        if conn is not None:
+            self.recycled += 1
+            try:
+                conn.really_close()
+            except sqlite3.Error:
+                pass
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn: PooledConnection):
+        with self._cond:
+            if conn in self._idle:
+                return
+            if conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            conn.last_used = time.monotonic()
+            if self._closed:
+                self._size -= 1
+                conn.really_close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def checkout(self) -> PooledConnection:
+        """Return this thread's connection, taking one from the pool if needed."""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = self._acquire()
+            local.conn = conn
+            local.leases = 0
+        local.leases += 1
+        return conn
+
+    def checkin(self, conn: PooledConnection):
+        """Drop one lease on this thread's connection; called from close()."""
+        local = self._local
+        if getattr(local, 'conn', None) is not conn:
+            # Connection was handed across threads; just return it.
+            self._release(conn)
+            return
+        local.leases = max(local.leases - 1, 0)
+        if local.leases:
+            return
+        if getattr(local, 'scoped', False):
+            # Keep it for the rest of the request, but never leak a half-done transaction.
+            if conn.in_transaction:
+                conn.rollback()
+            return
+        local.conn = None
+        self._release(conn)
+
+    def begin_scope(self):
+        """Keep this thread's connection checked out until end_scope() is called."""
+        self._local.scoped = True
+
+    def end_scope(self):
+        """Return this thread's connection to the pool at the end of a scope."""
+        local = self._local
+        local.scoped = False
+        conn = getattr(local, 'conn', None)
+        if conn is not None:
+            local.conn = None
+            local.leases = 0
+            self._release(conn)
+
+    def close(self):
+        """Close all idle connections; busy ones are closed when returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.really_close()
+
+    def stats(self) -> Dict:
+        """Return a snapshot of pool usage counters."""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'open': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'recycled': self.recycled,
+                'waits': self.waits,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_pool_settings = {
+    'max_size': POOL_SIZE,
+    'timeout': POOL_TIMEOUT,
+    'health_check_interval': POOL_HEALTH_CHECK_INTERVAL,
+}
+
+
+def configure_pool(max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                   health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL) -> ConnectionPool:
+    """
+    (Re)create the connection pool used by get_db_connection().
+
+    Args:
+        max_size: Maximum number of open connections
+        timeout: Seconds to wait for a free connection
+        health_check_interval: Idle seconds before a connection is pinged on reuse
+
+    Returns:
+        ConnectionPool: The new pool
+    """
+    global _pool
+    with _pool_lock:
+        _pool_settings.update(max_size=max_size, timeout=timeout,
+                              health_check_interval=health_check_interval)
+        old, _pool = _pool, ConnectionPool(DATABASE, **_pool_settings)
+    if old is not None:
+        old.close()
+    return _pool
+
+
+def get_pool() -> ConnectionPool:
+    """Return the active pool, rebuilding it if DATABASE has been changed."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.database == DATABASE:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.database != DATABASE:
+            old, _pool = _pool, ConnectionPool(DATABASE, **_pool_settings)
+            if old is not None:
+                old.close()
+        return _pool
+
+
+def close_pool():
+    """Close the connection pool and all of its idle connections."""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, None
+    if old is not None:
+        old.close()
+
+
+# Pools inherited from the parent process. Their connections belong to the
+# parent, so the child keeps them referenced and never closes them.
+_inherited_pools: List[ConnectionPool] = []
+
+def _forget_pool_after_fork():
+    global _pool, _pool_lock
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+def begin_connection_scope():
+    """Pin this thread's connection until end_connection_scope() (one Flask request)."""
+    get_pool().begin_scope()
+
+
+def end_connection_scope(exc: Optional[BaseException] = None):
+    """Return the connection pinned by begin_connection_scope() to the pool."""
+    pool = _pool
+    if pool is not None:
+        pool.end_scope()
+
+
+# Connection class used for new pooled connections; InstrumentedConnection
+# while query stats are on. Plain connections carry no instrumentation at all.
+_connection_factory = PooledConnection
+
+def query_stats_enabled() -> bool:
+    """Return True if pooled connections record query statistics."""
+    return _connection_factory is InstrumentedConnection
+
+
+def set_query_stats_enabled(enabled: bool):
+    """
+    Turn query statistics on or off for connections handed out from now on.
+
+    The pool is rebuilt when the setting changes, so no connection of the
+    other kind is reused afterwards.
+    """
+    global _connection_factory
+    factory = InstrumentedConnection if enabled else PooledConnection
+    if factory is not _connection_factory:
+        _connection_factory = factory
+        if _pool is not None:
+            configure_pool(**_pool_settings)
+
+
+def start_query_stats() -> QueryStats:
+    """Start collecting statistics for the statements this thread runs (one Flask request)."""
+    stats = _query_stats.current = QueryStats()
+    return stats
+
+
+def get_query_stats() -> Optional[QueryStats]:
+    """Return the statistics being collected on this thread, if any."""
+    return getattr(_query_stats, 'current', None)
+
+
+def stop_query_stats() -> Optional[QueryStats]:
+    """Stop collecting on this thread and return what was collected."""
+    stats = getattr(_query_stats, 'current', None)
+    _query_stats.current = None
+    return stats
+
+
+def get_performance_profile() -> str:
+    """Return the name of the active performance profile."""
+    return _profile
+
+
+def set_performance_profile(name: str):
+    """
+    Select one of PERFORMANCE_PROFILES for new connections.
+
+    Pooled connections opened under the previous profile are closed so that
+    every connection handed out afterwards uses the new settings. Call
+    init_database() afterwards to switch the journal mode of the file.
+
+    Args:
+        name: Profile name ('legacy', 'durable' or 'fast')
+    """
+    global _profile
+    if name not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Unknown performance profile '{name}'.")
+    if name != _profile:
+        _profile = name
+        if _pool is not None:
+            configure_pool(**_pool_settings)
+
+
+def _unicode_lower(text):
+    return text.lower() if isinstance(text, str) else text
+
+def apply_connection_pragmas(conn: sqlite3.Connection):
+    """Apply the per-connection settings of the active performance profile."""
+    for pragma, value in PERFORMANCE_PROFILES[_profile].items():
+        if pragma != 'journal_mode':
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
+
+def set_database_path(path: str):
+    """
+    Point every helper at another SQLite file.
+
+    The pool, the search index and the search cache notice the change on
+    their next use and drop what belonged to the previous file.
+    """
+    global DATABASE
+    DATABASE = path
 
-# Database configuration
-DATABASE = 'library.db'
 
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    return conn
+    """Get a database connection from the pool."""
+    return get_pool().checkout()
+
+def get_catalog_state() -> Optional[Tuple[str, int, float]]:
+    """
+    Return (token, version, time of the last write as a Unix timestamp) for the books table.
+    
+    Triggers on books bump the one-row catalog_version table, so the version
+    changes with every write from any process; reading it is a single
+    primary-key lookup. The token is drawn when the table is created, so
+    (token, version) pairs never repeat across database files.
+    
+    Returns:
+        The state, or None if the schema is not initialized
+    """
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT token, version, modified_at FROM catalog_version WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    conn.close()
+    return (row['token'], row['version'], row['modified_at']) if row else None
+
+def get_catalog_version() -> Tuple[str, float]:
+    """Return (version tag, time of the last write as a Unix timestamp) for the books table."""
+    state = get_catalog_state()
+    if state is None:
+        return '0-0', 0.0
+    token, version, modified = state
+    return f'{token}-{version}', modified
+
+# Catalog versions produced by this process's writes, which are also reported
+# to the book and availability listeners. Caches kept current by the listeners
+# check a version change against these to tell whether another process wrote.
+# They are keyed by database path too, since copies of a file share its token.
+# Only the most recent ones are kept; a forgotten version just looks foreign.
+LOCAL_CATALOG_WRITES_KEPT = 10000
+_local_catalog_lock = threading.Lock()
+_local_catalog_writes: 'OrderedDict[Tuple[str, str, int], None]' = OrderedDict()
 
-def init_database():
-    """Initialize the database with required tables."""
+def _record_catalog_writes(conn: sqlite3.Connection, count: int):
+    """Remember the versions of the last `count` writes to books; call before the transaction commits."""
+    if count <= 0:
+        return
+    row = conn.execute('SELECT token, version FROM catalog_version WHERE id = 1').fetchone()
+    with _local_catalog_lock:
+        for version in range(row['version'] - count + 1, row['version'] + 1):
+            _local_catalog_writes[(DATABASE, row['token'], version)] = None
+        while len(_local_catalog_writes) > LOCAL_CATALOG_WRITES_KEPT:
+            _local_catalog_writes.popitem(last=False)
+
+def catalog_writes_are_local(token: str, after: int, upto: int) -> bool:
+    """Whether every catalog version in (after, upto] came from a write of this process that notified the listeners."""
+    with _local_catalog_lock:
+        return all((DATABASE, token, version) in _local_catalog_writes for version in range(after + 1, upto + 1))
+
+# Callbacks run with the new book's row after insert_book() commits,
+# used to keep in-memory structures such as the search index current.
+_book_listeners: List[Callable[[Dict], None]] = []
+
+def add_book_listener(callback: Callable[[Dict], None]):
+    """Call callback(book) after every successful insert_book()."""
+    if callback not in _book_listeners:
+        _book_listeners.append(callback)
+
+def remove_book_listener(callback: Callable[[Dict], None]):
+    """Stop calling a callback registered with add_book_listener()."""
+    if callback in _book_listeners:
+        _book_listeners.remove(callback)
+
+def _notify_book_inserted(book: Dict):
+    for callback in list(_book_listeners):
+        callback(book)
+
+# Callbacks run with a book's ID after its available copies change
+_availability_listeners: List[Callable[[int], None]] = []
+
+def add_availability_listener(callback: Callable[[int], None]):
+    """Call callback(book_id) after every committed change to a book's available copies."""
+    if callback not in _availability_listeners:
+        _availability_listeners.append(callback)
+
+def remove_availability_listener(callback: Callable[[int], None]):
+    """Stop calling a callback registered with add_availability_listener()."""
+    if callback in _availability_listeners:
+        _availability_listeners.remove(callback)
+
+def _notify_availability_changed(book_id: int):
+    for callback in list(_availability_listeners):
+        callback(book_id)
+
+def get_schema_version() -> Tuple[int, Optional[str]]:
+    """Return the (schema version, journal mode) recorded by init_database(), or (0, None) if it never ran."""
     conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT version, journal_mode FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        # No schema_version table yet
+        row = None
+    conn.close()
+    return (row['version'], row['journal_mode']) if row else (0, None)
+
+def init_database(force: bool = False) -> bool:
+    """
+    Initialize the database with required tables.
+    
+    A database already at SCHEMA_VERSION with the journal mode of the current
+    profile costs a single read; the DDL only runs on first boot, after a
+    schema change or when the profile's journal mode differs.
+    
+    Args:
+        force: Run the DDL even if the database looks up to date
+        
+    Returns:
+        bool: True if the schema was (re)applied
+    """
+    journal_mode = PERFORMANCE_PROFILES[_profile]['journal_mode']
+    if not force and get_schema_version() == (SCHEMA_VERSION, journal_mode):
+        return False
+    
+    conn = get_db_connection()
+    
+    # The journal mode is persistent, so set it once for the whole file
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
     
     # Create books table
     conn.execute('''
@@ -45,8 +691,177 @@ def init_database():
         )
     ''')
     
+    # Open loans are looked up by patron on every borrow, return and fee check.
+    # Indexing only rows with return_date IS NULL keeps the index as small as
+    # the set of open loans however much history builds up.
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_open
+        ON borrow_records (patron_id, borrow_date, book_id, due_date)
+        WHERE return_date IS NULL
+    ''')
+    
+    # Full loan history per patron, for the status report
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_patron
+        ON borrow_records (patron_id, borrow_date)
+    ''')
+    
+    # Payment ledger: one row per charge or refund attempt, keyed by idempotency key
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            idempotency_key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            patron_id TEXT,
+            amount REAL NOT NULL,
+            status TEXT NOT NULL,
+            transaction_id TEXT,
+            refund_of TEXT,
+            message TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_payments_transaction ON payments (transaction_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_payments_refund_of ON payments (refund_of)')
+    
+    # Which loan each successful late fee payment paid for; refunds add negative rows
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payment_allocations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_id TEXT NOT NULL,
+            patron_id TEXT NOT NULL,
+            borrow_record_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            paid_at TEXT NOT NULL,
+            FOREIGN KEY (borrow_record_id) REFERENCES borrow_records (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_allocations_record
+        ON payment_allocations (borrow_record_id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_allocations_transaction
+        ON payment_allocations (transaction_id)
+    ''')
+    
+    # Last known gateway status of each charge, written by the reconciliation job
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payment_status (
+            transaction_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            final INTEGER NOT NULL DEFAULT 0,
+            checked_at TEXT NOT NULL
+        )
+    ''')
+    
+    # Payments and refunds queued for the background workers
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payment_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            run_after TEXT
+        )
+    ''')
+    # Added in schema version 2: earliest time a deferred job may run again
+    if 'run_after' not in {row['name'] for row in conn.execute('PRAGMA table_info(payment_jobs)')}:
+        conn.execute('ALTER TABLE payment_jobs ADD COLUMN run_after TEXT')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_jobs_unfinished
+        ON payment_jobs (created_at) WHERE status IN ('queued', 'running')
+    ''')
+    
+    # Lets catalog pages seek straight to their (title, id) cursor
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)')
+    
+    _create_search_index(conn)
+    _create_catalog_version(conn)
+    
+    # Written last, so an interrupted init is simply run again on the next boot
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER NOT NULL,
+            journal_mode TEXT NOT NULL
+        )
+    ''')
+    conn.execute('DELETE FROM schema_version')
+    conn.execute('INSERT INTO schema_version (version, journal_mode) VALUES (?, ?)', (SCHEMA_VERSION, journal_mode))
+    
     conn.commit()
     conn.close()
+    return True
+
+def _create_catalog_version(conn: sqlite3.Connection):
+    """Create the one-row catalog_version table and the triggers that bump it on every write to books."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            token TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            modified_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO catalog_version (id, token, version, modified_at) VALUES (1, ?, 0, ?)',
+                 (secrets.token_hex(4), time.time()))
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        # julianday() has sub-second precision where strftime('%s') does not
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS books_catalog_version_{event.lower()} AFTER {event} ON books BEGIN
+                UPDATE catalog_version
+                SET version = version + 1, modified_at = (julianday('now') - 2440587.5) * 86400.0
+                WHERE id = 1;
+            END
+        ''')
+
+def _create_search_index(conn: sqlite3.Connection):
+    """Create the books_fts full-text index and the triggers that keep it in sync."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    ).fetchone()
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                title, author, isbn,
+                content='books', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; search_books() falls back to LIKE
+        return
+    
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author, isbn)
+            VALUES (new.id, new.title, new.author, new.isbn);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, isbn)
+            VALUES ('delete', old.id, old.title, old.author, old.isbn);
+        END
+    ''')
+    # Only text changes touch the index; availability updates do not
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author, isbn ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author, isbn)
+            VALUES ('delete', old.id, old.title, old.author, old.isbn);
+            INSERT INTO books_fts (rowid, title, author, isbn)
+            VALUES (new.id, new.title, new.author, new.isbn);
+        END
+    ''')
+    
+    if not exists:
+        # Index books that were added before the search index existed
+        conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
 
 def add_sample_data():
     """Add sample data to the database if it's empty."""
@@ -84,10 +899,28 @@ def add_sample_data():
 
 # Helper Functions for Database Operations
 
-def get_all_books() -> List[Dict]:
-    """Get all books from the database."""
+def get_all_books(after: Optional[Tuple[str, int]] = None, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Get books from the database ordered by title.
+
+    Args:
+        after: Keyset cursor (title, id) of the last book already seen; only
+            books sorting after it are returned
+        limit: Maximum number of books to return (None for all)
+
+    Returns:
+        List of book rows ordered by (title, id)
+    """
     conn = get_db_connection()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
+    if after is None:
+        books = conn.execute(
+            'SELECT * FROM books ORDER BY title, id LIMIT ?', (-1 if limit is None else limit,)
+        ).fetchall()
+    else:
+        books = conn.execute('''
+            SELECT * FROM books WHERE (title, id) > (?, ?)
+            ORDER BY title, id LIMIT ?
+        ''', (after[0], after[1], -1 if limit is None else limit)).fetchall()
     conn.close()
     return [dict(book) for book in books]
 
@@ -105,6 +938,100 @@ def get_book_by_isbn(isbn: str) -> Optional[Dict]:
     conn.close()
     return dict(book) if book else None
 
+def search_books(search_term: str, search_type: str, limit: int = -1) -> List[Dict]:
+    """
+    Search books using the books_fts full-text index.
+
+    Title and author searches match every word of the term as a word prefix,
+    ranked by BM25. ISBN searches use the unique isbn index for an exact or
+    prefix match.
+
+    Args:
+        search_term: Text to search for
+        search_type: 'title', 'author' or 'isbn'
+        limit: Maximum number of results (-1 for no limit)
+
+    Returns:
+        List of matching book rows, best match first
+    """
+    conn = get_db_connection()
+    
+    if search_type == 'isbn':
+        term = search_term.strip()
+        books = conn.execute('''
+            SELECT * FROM books WHERE isbn >= ? AND isbn < ?
+            ORDER BY isbn LIMIT ?
+        ''', (term, term + '\uffff', limit)).fetchall()
+        conn.close()
+        return [dict(book) for book in books]
+    
+    words = re.findall(r'\w+', search_term.lower())
+    if search_type not in ('title', 'author') or not words:
+        conn.close()
+        return []
+    
+    query = f'{search_type} : (' + ' '.join(f'"{word}"*' for word in words) + ')'
+    try:
+        books = conn.execute('''
+            SELECT b.* FROM books b
+            JOIN (
+                SELECT rowid, rank FROM books_fts
+                WHERE books_fts MATCH ? ORDER BY rank LIMIT ?
+            ) f ON f.rowid = b.id
+            ORDER BY f.rank, b.title
+        ''', (query, limit)).fetchall()
+    except sqlite3.OperationalError:
+        # No FTS5 in this SQLite build: plain case-insensitive scan
+        books = conn.execute(
+            f'SELECT * FROM books WHERE {search_type} LIKE ? ORDER BY title LIMIT ?',
+            ('%' + search_term.strip() + '%', limit)
+        ).fetchall()
+    conn.close()
+    return [dict(book) for book in books]
+
+def get_books_by_ids(book_ids: Iterable[int]) -> List[Dict]:
+    """Get the books with the given IDs, in no particular order."""
+    book_ids = list(book_ids)
+    conn = get_db_connection()
+    books = []
+    # Stay well under SQLite's limit on bound parameters
+    for start in range(0, len(book_ids), 500):
+        chunk = book_ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        books.extend(conn.execute(f'SELECT * FROM books WHERE id IN ({placeholders})', chunk).fetchall())
+    conn.close()
+    return [dict(book) for book in books]
+
+def get_max_book_id() -> int:
+    """Return the highest book ID (0 for an empty catalog); one read of the primary key."""
+    conn = get_db_connection()
+    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM books').fetchone()[0]
+    conn.close()
+    return max_id
+
+def get_books_after(book_id: int) -> List[Dict]:
+    """Get the books with an ID above the given one, in ID order."""
+    conn = get_db_connection()
+    books = conn.execute('SELECT * FROM books WHERE id > ? ORDER BY id', (book_id,)).fetchall()
+    conn.close()
+    return [dict(book) for book in books]
+
+def search_books_substring(search_term: str, search_type: str) -> List[Dict]:
+    """
+    Get books whose title, author or isbn contains the term (case-insensitive scan).
+    Case is folded with Python's str.lower(), as in the trigram index, so
+    non-ASCII letters match in either case too.
+    """
+    if search_type not in ('title', 'author', 'isbn'):
+        return []
+    conn = get_db_connection()
+    books = conn.execute(
+        f'SELECT * FROM books WHERE instr(unicode_lower({search_type}), ?) > 0 ORDER BY title',
+        (search_term.lower(),)
+    ).fetchall()
+    conn.close()
+    return [dict(book) for book in books]
+
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
     conn = get_db_connection()
@@ -130,6 +1057,90 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     
     return borrowed_books
 
+def get_patron_loan_history(patron_id: str) -> List[Dict]:
+    """Get every loan of a patron, open and returned, oldest first, in one query."""
+    conn = get_db_connection()
+    records = conn.execute('''
+        SELECT br.id, br.book_id, br.borrow_date, br.due_date, br.return_date, b.title, b.author,
+            (SELECT COALESCE(SUM(pa.amount), 0) FROM payment_allocations pa
+             WHERE pa.borrow_record_id = br.id) AS paid
+        FROM borrow_records br
+        JOIN books b ON br.book_id = b.id
+        WHERE br.patron_id = ?
+        ORDER BY br.borrow_date, br.id
+    ''', (patron_id,)).fetchall()
+    conn.close()
+    
+    return [{
+        'record_id': record['id'],
+        'book_id': record['book_id'],
+        'title': record['title'],
+        'author': record['author'],
+        'borrow_date': datetime.fromisoformat(record['borrow_date']),
+        'due_date': datetime.fromisoformat(record['due_date']),
+        'return_date': datetime.fromisoformat(record['return_date']) if record['return_date'] else None,
+        'paid': record['paid']
+    } for record in records]
+
+def get_open_loan(patron_id: str, book_id: int) -> Optional[Dict]:
+    """Get a patron's oldest open loan of a book, with the late fees already paid on it."""
+    conn = get_db_connection()
+    record = conn.execute('''
+        SELECT br.id, br.due_date,
+            (SELECT COALESCE(SUM(pa.amount), 0) FROM payment_allocations pa
+             WHERE pa.borrow_record_id = br.id) AS paid
+        FROM borrow_records br
+        WHERE br.patron_id = ? AND br.book_id = ? AND br.return_date IS NULL
+        ORDER BY br.borrow_date LIMIT 1
+    ''', (patron_id, book_id)).fetchone()
+    conn.close()
+    if not record:
+        return None
+    return {
+        'record_id': record['id'],
+        'due_date': datetime.fromisoformat(record['due_date']),
+        'paid': record['paid']
+    }
+
+def _stream_rows(sql: str, params: Tuple = (), chunk_size: int = 10000) -> Iterator[List[Tuple]]:
+    """Run a query and yield its rows as chunks of tuples, holding one chunk in memory at a time."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+    finally:
+        conn.close()
+
+def iter_open_loans(chunk_size: int = 10000) -> Iterator[List[Tuple[str, int, str, float]]]:
+    """
+    Stream every open loan as chunks of (patron_id, book_id, due_date, paid) tuples,
+    where paid is the late fee already paid on the loan.
+    Only one chunk is held in memory at a time.
+    """
+    return _stream_rows('''
+        SELECT br.patron_id, br.book_id, br.due_date,
+            (SELECT COALESCE(SUM(pa.amount), 0) FROM payment_allocations pa
+             WHERE pa.borrow_record_id = br.id) AS paid
+        FROM borrow_records br
+        WHERE br.return_date IS NULL
+    ''', chunk_size=chunk_size)
+
+BOOK_COLUMNS = ('id', 'title', 'author', 'isbn', 'total_copies', 'available_copies')
+BORROW_RECORD_COLUMNS = ('id', 'patron_id', 'book_id', 'borrow_date', 'due_date', 'return_date')
+
+def iter_books(chunk_size: int = 10000) -> Iterator[List[Tuple]]:
+    """Stream every book in ID order as chunks of tuples in BOOK_COLUMNS order."""
+    return _stream_rows(f'SELECT {", ".join(BOOK_COLUMNS)} FROM books ORDER BY id', chunk_size=chunk_size)
+
+def iter_borrow_records(chunk_size: int = 10000) -> Iterator[List[Tuple]]:
+    """Stream every borrow record in ID order as chunks of tuples in BORROW_RECORD_COLUMNS order."""
+    return _stream_rows(f'SELECT {", ".join(BORROW_RECORD_COLUMNS)} FROM borrow_records ORDER BY id',
+                        chunk_size=chunk_size)
+
 def get_patron_borrow_count(patron_id: str) -> int:
     """Get the number of books currently borrowed by a patron."""
     conn = get_db_connection()
@@ -144,16 +1155,65 @@ def insert_book(title: str, author: str, isbn: str, total_copies: int, available
     """Insert a new book into the database."""
     conn = get_db_connection()
     try:
-        conn.execute('''
+        cursor = conn.execute('''
             INSERT INTO books (title, author, isbn, total_copies, available_copies)
             VALUES (?, ?, ?, ?, ?)
         ''', (title, author, isbn, total_copies, available_copies))
+        _record_catalog_writes(conn, 1)
         conn.commit()
         conn.close()
-        return True
     except Exception as e:
         conn.close()
         return False
+    _notify_book_inserted({
+        'id': cursor.lastrowid,
+        'title': title,
+        'author': author,
+        'isbn': isbn,
+        'total_copies': total_copies,
+        'available_copies': available_copies
+    })
+    return True
+
+def get_all_isbns() -> Set[str]:
+    """Get the ISBN of every book, for duplicate checks that must not query per row."""
+    conn = get_db_connection()
+    isbns = {row[0] for row in conn.execute('SELECT isbn FROM books')}
+    conn.close()
+    return isbns
+
+def insert_books(books: List[Tuple[str, str, str, int, int]]) -> Optional[List[Dict]]:
+    """
+    Insert many books in one transaction with executemany.
+    Rows whose ISBN already exists are skipped.
+
+    Args:
+        books: (title, author, isbn, total_copies, available_copies) tuples
+
+    Returns:
+        The inserted books with their IDs (listeners are notified of each),
+        or None if the transaction failed
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        # New IDs are always above the current maximum, so this finds exactly the inserted rows
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM books').fetchone()[0]
+        conn.executemany('''
+            INSERT OR IGNORE INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?)
+        ''', books)
+        inserted = [dict(row) for row in conn.execute('SELECT * FROM books WHERE id > ? ORDER BY id', (last_id,))]
+        _record_catalog_writes(conn, len(inserted))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return None
+    for book in inserted:
+        _notify_book_inserted(book)
+    return inserted
 
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
@@ -174,11 +1234,13 @@ def update_book_availability(book_id: int, change: int) -> bool:
     """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
     conn = get_db_connection()
     try:
-        conn.execute('''
+        updated = conn.execute('''
             UPDATE books SET available_copies = available_copies + ? WHERE id = ?
-        ''', (change, book_id))
+        ''', (change, book_id)).rowcount
+        _record_catalog_writes(conn, updated)
         conn.commit()
         conn.close()
+        _notify_availability_changed(book_id)
         return True
     except Exception as e:
         conn.close()
@@ -199,3 +1261,414 @@ def update_borrow_record_return_date(patron_id: str, book_id: int, return_date:
     except Exception as e:
         conn.close()
         return False
+
+def borrow_book_transaction(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> str:
+    """
+    Take one copy of a book and record the loan in a single transaction.
+
+    The copy is only taken if one is still available when the write lock is
+    held, so concurrent borrowers can never push available_copies below zero.
+
+    Returns:
+        str: 'borrowed', 'unavailable' (no copy left or no such book) or 'error'
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        taken = conn.execute('''
+            UPDATE books SET available_copies = available_copies - 1
+            WHERE id = ? AND available_copies > 0
+        ''', (book_id,)).rowcount
+        if not taken:
+            conn.rollback()
+            conn.close()
+            return 'unavailable'
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+            VALUES (?, ?, ?, ?)
+        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+        _record_catalog_writes(conn, taken)
+        conn.commit()
+        conn.close()
+        _notify_availability_changed(book_id)
+        return 'borrowed'
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return 'error'
+
+def return_book_transaction(patron_id: str, book_id: int, return_date: datetime) -> str:
+    """
+    Close a patron's oldest open loan of a book and put the copy back in one transaction.
+
+    Returns:
+        str: 'returned', 'not_borrowed' or 'error'
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        closed = conn.execute('''
+            UPDATE borrow_records SET return_date = ?
+            WHERE id = (
+                SELECT id FROM borrow_records
+                WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+                ORDER BY borrow_date LIMIT 1
+            )
+        ''', (return_date.isoformat(), patron_id, book_id)).rowcount
+        if not closed:
+            conn.rollback()
+            conn.close()
+            return 'not_borrowed'
+        put_back = conn.execute('''
+            UPDATE books SET available_copies = available_copies + 1
+            WHERE id = ? AND available_copies < total_copies
+        ''', (book_id,)).rowcount
+        _record_catalog_writes(conn, put_back)
+        conn.commit()
+        conn.close()
+        _notify_availability_changed(book_id)
+        return 'returned'
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return 'error'
+
+# Payment ledger
+#
+# Every charge and refund goes through claim_payment() before the gateway is
+# called and finish_payment() afterwards. A second attempt with the same
+# idempotency key gets the stored row back instead of reaching the gateway.
+
+def _insert_allocations(conn: sqlite3.Connection, transaction_id: str, patron_id: str,
+                        allocations: List[Dict], paid_at: datetime):
+    conn.executemany('''
+        INSERT INTO payment_allocations
+            (transaction_id, patron_id, borrow_record_id, book_id, amount, paid_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(transaction_id, patron_id, item['record_id'], item['book_id'], item['amount'],
+           paid_at.isoformat()) for item in allocations])
+
+def _insert_refund_allocations(conn: sqlite3.Connection, refund_of: str, amount: float, refunded_at: datetime):
+    # Net a refund out of the loans its charge paid for, most recently paid first,
+    # so refunded fees are owed again
+    rows = conn.execute('''
+        SELECT patron_id, borrow_record_id, book_id, SUM(amount) AS remaining
+        FROM payment_allocations
+        WHERE transaction_id = ?
+        GROUP BY borrow_record_id, patron_id, book_id
+        HAVING SUM(amount) > 0
+        ORDER BY MAX(id) DESC
+    ''', (refund_of,)).fetchall()
+    left = round(amount, 2)
+    for row in rows:
+        if left <= 0:
+            break
+        share = min(round(row['remaining'], 2), left)
+        left = round(left - share, 2)
+        _insert_allocations(conn, refund_of, row['patron_id'],
+                            [{'record_id': row['borrow_record_id'], 'book_id': row['book_id'],
+                              'amount': -share}], refunded_at)
+
+def claim_payment(idempotency_key: str, kind: str, amount: float, patron_id: Optional[str] = None,
+                  refund_of: Optional[str] = None) -> Optional[Dict]:
+    """
+    Reserve an idempotency key for a charge or refund before calling the gateway.
+
+    A key whose earlier attempt failed, or was left pending for longer than
+    PAYMENT_PENDING_TIMEOUT, is taken over. Refunds are checked against the
+    original charge when the ledger has it.
+
+    Args:
+        idempotency_key: Client-supplied or generated key for this payment
+        kind: 'charge' or 'refund'
+        amount: Amount in dollars
+        patron_id: 6-digit library card ID, if known
+        refund_of: Transaction ID being refunded (refunds only)
+
+    Returns:
+        None if the caller now owns the key and should call the gateway,
+        otherwise the stored ledger row (status 'succeeded' or 'pending')
+
+    Raises:
+        ValueError: If a refund exceeds what is left of the original charge
+    """
+    now = datetime.now()
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT * FROM payments WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+        if row is not None:
+            stale = now - datetime.fromisoformat(row['updated_at']) > timedelta(seconds=PAYMENT_PENDING_TIMEOUT)
+            if row['status'] == 'succeeded' or (row['status'] == 'pending' and not stale):
+                conn.commit()
+                conn.close()
+                return dict(row)
+        
+        if kind == 'refund' and refund_of:
+            charge = conn.execute('''
+                SELECT amount,
+                    (SELECT COALESCE(SUM(amount), 0) FROM payments
+                     WHERE kind = 'refund' AND refund_of = ? AND status IN ('pending', 'succeeded')
+                       AND idempotency_key != ?) AS refunded
+                FROM payments WHERE kind = 'charge' AND status = 'succeeded' AND transaction_id = ?
+            ''', (refund_of, idempotency_key, refund_of)).fetchone()
+            if charge is not None and round(amount, 2) > round(charge['amount'] - charge['refunded'], 2):
+                raise ValueError("Refund amount exceeds the amount charged.")
+        
+        conn.execute('''
+            INSERT INTO payments (idempotency_key, kind, patron_id, amount, status, refund_of, created_at, updated_at)
+            VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)
+            ON CONFLICT (idempotency_key) DO UPDATE SET
+                kind = excluded.kind, patron_id = excluded.patron_id, amount = excluded.amount,
+                status = 'pending', transaction_id = NULL, refund_of = excluded.refund_of,
+                message = NULL, updated_at = excluded.updated_at
+        ''', (idempotency_key, kind, patron_id, amount, refund_of, now.isoformat(), now.isoformat()))
+        conn.commit()
+        conn.close()
+        return None
+    except Exception:
+        conn.rollback()
+        conn.close()
+        raise
+
+def finish_payment(idempotency_key: str, success: bool, transaction_id: Optional[str], message: str,
+                   allocations: Optional[List[Dict]] = None) -> bool:
+    """
+    Store the outcome of a claimed payment in one transaction, together with
+    the loans a successful charge paid for, or for a successful refund,
+    negative allocations that take it back off those loans.
+
+    Args:
+        idempotency_key: Key passed to claim_payment()
+        success: Whether the gateway accepted the payment
+        transaction_id: Gateway transaction ID (None on failure)
+        message: Result message returned to the caller, replayed on retries
+        allocations: Dicts with 'record_id', 'book_id' and 'amount' for a successful charge
+    """
+    now = datetime.now()
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            'SELECT kind, patron_id, amount, status, refund_of FROM payments WHERE idempotency_key = ?',
+            (idempotency_key,)
+        ).fetchone()
+        conn.execute('''
+            UPDATE payments SET status = ?, transaction_id = ?, message = ?, updated_at = ?
+            WHERE idempotency_key = ?
+        ''', ('succeeded' if success else 'failed', transaction_id, message, now.isoformat(),
+              idempotency_key))
+        if success and allocations and row is not None:
+            _insert_allocations(conn, transaction_id, row['patron_id'], allocations, now)
+        if success and row is not None and row['kind'] == 'refund' and row['refund_of'] \
+                and row['status'] != 'succeeded':
+            _insert_refund_allocations(conn, row['refund_of'], row['amount'], now)
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return False
+
+def get_payment(idempotency_key: str) -> Optional[Dict]:
+    """Get the ledger row stored for an idempotency key."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM payments WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_unreconciled_transactions(limit: Optional[int] = None) -> List[str]:
+    """
+    Get the transaction IDs of successful charges whose gateway status is not
+    yet known to be final, oldest first.
+    """
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT p.transaction_id
+        FROM payments p
+        LEFT JOIN payment_status ps ON ps.transaction_id = p.transaction_id
+        WHERE p.kind = 'charge' AND p.status = 'succeeded' AND COALESCE(ps.final, 0) = 0
+        ORDER BY p.updated_at
+        LIMIT ?
+    ''', (-1 if limit is None else limit,)).fetchall()
+    conn.close()
+    return [row['transaction_id'] for row in rows]
+
+def record_payment_statuses(statuses: Iterable[Tuple[str, str, bool]]) -> bool:
+    """
+    Store gateway statuses in one transaction.
+
+    Args:
+        statuses: (transaction_id, status, final) tuples; final marks a status that will not change
+    """
+    checked_at = datetime.now().isoformat()
+    conn = get_db_connection()
+    try:
+        conn.executemany('''
+            INSERT INTO payment_status (transaction_id, status, final, checked_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (transaction_id) DO UPDATE SET
+                status = excluded.status, final = excluded.final, checked_at = excluded.checked_at
+        ''', [(txn, status, int(final), checked_at) for txn, status, final in statuses])
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return False
+
+def reopen_payment_status(transaction_id: str) -> bool:
+    """Mark a stored gateway status as no longer final (e.g. after a refund) so reconciliation checks it again."""
+    conn = get_db_connection()
+    try:
+        conn.execute('UPDATE payment_status SET final = 0 WHERE transaction_id = ?', (transaction_id,))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        conn.close()
+        return False
+
+def get_payment_status(transaction_id: str) -> Optional[Dict]:
+    """Get the last recorded gateway status of a transaction."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM payment_status WHERE transaction_id = ?', (transaction_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+# Payment jobs
+
+def _job_row(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+def insert_payment_job(job_id: str, kind: str, params: Dict) -> bool:
+    """Store a new queued payment job."""
+    now = datetime.now().isoformat()
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            INSERT INTO payment_jobs (id, kind, params, status, created_at, updated_at)
+            VALUES (?, ?, ?, 'queued', ?, ?)
+        ''', (job_id, kind, json.dumps(params), now, now))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        conn.close()
+        return False
+
+def start_payment_job(job_id: str, lease: float = PAYMENT_JOB_LEASE) -> Optional[Dict]:
+    """
+    Claim a job for this worker: mark it running and return it.
+
+    Only a queued job that is due, or a running job whose worker has not
+    updated it within `lease` seconds, can be claimed; so two workers never
+    run the same job. Returns None otherwise, or if the job does not exist.
+    """
+    now = datetime.now()
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        updated = conn.execute('''
+            UPDATE payment_jobs SET status = 'running', attempts = attempts + 1, updated_at = ?, run_after = NULL
+            WHERE id = ? AND ((status = 'queued' AND COALESCE(run_after, '') <= ?)
+                              OR (status = 'running' AND updated_at < ?))
+        ''', (now.isoformat(), job_id, now.isoformat(),
+              (now - timedelta(seconds=lease)).isoformat())).rowcount
+        row = conn.execute('SELECT * FROM payment_jobs WHERE id = ?', (job_id,)).fetchone() if updated else None
+        conn.commit()
+        conn.close()
+        return _job_row(row) if row else None
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return None
+
+def defer_payment_job(job_id: str, run_after: datetime, result: Dict) -> bool:
+    """Put a claimed job back in the queue, to be run again no earlier than `run_after`."""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            UPDATE payment_jobs SET status = 'queued', result = ?, updated_at = ?, run_after = ? WHERE id = ?
+        ''', (json.dumps(result), datetime.now().isoformat(), run_after.isoformat(), job_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return False
+
+def finish_payment_job(job_id: str, success: bool, result: Dict) -> bool:
+    """Store the result of a job and mark it succeeded or failed."""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            UPDATE payment_jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?
+        ''', ('succeeded' if success else 'failed', json.dumps(result), datetime.now().isoformat(), job_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return False
+
+def get_payment_job(job_id: str) -> Optional[Dict]:
+    """Get a payment job with its decoded params and result."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM payment_jobs WHERE id = ?', (job_id,)).fetchone()
+    conn.close()
+    return _job_row(row) if row else None
+
+def get_unfinished_payment_jobs(lease: float = PAYMENT_JOB_LEASE) -> List[str]:
+    """
+    IDs of the jobs a worker could claim now, oldest first: queued jobs that
+    are due, and running jobs whose lease has expired (their worker stopped).
+    """
+    now = datetime.now()
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT id FROM payment_jobs
+        WHERE status IN ('queued', 'running')
+          AND ((status = 'queued' AND COALESCE(run_after, '') <= ?) OR (status = 'running' AND updated_at < ?))
+        ORDER BY created_at
+    ''', (now.isoformat(), (now - timedelta(seconds=lease)).isoformat())).fetchall()
+    conn.close()
+    return [row['id'] for row in rows]
+
+def get_allocation_watermark(patron_id: str) -> int:
+    """
+    Return the ID of the latest payment allocation on a patron's open loans (0 if none).
+    
+    Every successful charge or refund of their fees moves it, so together with
+    the fees computed after reading it, it identifies what the patron owes.
+    """
+    conn = get_db_connection()
+    watermark = conn.execute('''
+        SELECT COALESCE(MAX(id), 0) FROM payment_allocations
+        WHERE borrow_record_id IN (
+            SELECT id FROM borrow_records WHERE patron_id = ? AND return_date IS NULL
+        )
+    ''', (patron_id,)).fetchone()[0]
+    conn.close()
+    return watermark
+
+def get_payment_allocations(transaction_id: str) -> List[Dict]:
+    """Get the per-loan allocations recorded for a gateway transaction."""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT pa.borrow_record_id, pa.book_id, b.title, pa.amount, pa.paid_at
+        FROM payment_allocations pa
+        JOIN books b ON pa.book_id = b.id
+        WHERE pa.transaction_id = ?
+        ORDER BY pa.id
+    ''', (transaction_id,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
@@ -6,10 +6,13 @@ from .catalog_routes import catalog_bp
 from .borrowing_routes import borrowing_bp
 from .search_routes import search_bp
 from .api_routes import api_bp
+from .metrics_routes import metrics_bp, init_metrics
 
 def register_blueprints(app):
-    """Register all route blueprints with the Flask app."""
+    """Register all route blueprints with the Flask app, and time their requests."""
+    init_metrics(app)
     app.register_blueprint(catalog_bp)
     app.register_blueprint(borrowing_bp)
     app.register_blueprint(search_bp)
     app.register_blueprint(api_bp)
+    app.register_blueprint(metrics_bp)
@@ -2,8 +2,22 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+import io
+
+from flask import Blueprint, Response, jsonify, request, url_for
+from database import get_payment_allocations, get_payment_job
+from routes.conditional import catalog_conditional
+from services.gateway_resilience import gateway_health
+from services.catalog_export import MIMETYPES, export_rows
+from services.catalog_import import FORMATS, import_books, read_rows
+from services.search_cache import search_cache
+from services.payment_jobs import (
+    queue_late_fee_payment, queue_all_late_fees_payment, queue_late_fee_refund
+)
+from services.library_service import (
+    calculate_late_fee_for_book, search_books_in_catalog, get_catalog_page, CATALOG_PAGE_SIZE,
+    pay_late_fees, pay_all_late_fees
+)
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -16,7 +30,83 @@ def get_late_fee(patron_id, book_id):
     result = calculate_late_fee_for_book(patron_id, book_id)
     return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
 
+@api_bp.route('/late_fee/<patron_id>/<int:book_id>/pay', methods=['POST'])
+def pay_late_fee_api(patron_id, book_id):
+    """
+    Pay the outstanding late fee for one book.
+    Send an Idempotency-Key header to make retries safe: a repeated key is not charged again.
+    """
+    success, message, transaction_id = pay_late_fees(
+        patron_id, book_id, idempotency_key=request.headers.get('Idempotency-Key')
+    )
+    
+    if not success:
+        return jsonify({'success': False, 'message': message}), 400
+    
+    return jsonify({'success': True, 'message': message, 'transaction_id': transaction_id})
+
+@api_bp.route('/late_fee/<patron_id>/pay_all', methods=['POST'])
+def pay_all_late_fees_api(patron_id):
+    """
+    Pay all of a patron's outstanding late fees with a single charge.
+    Send an Idempotency-Key header to make retries safe: a repeated key is not charged again.
+    """
+    success, message, transaction_id = pay_all_late_fees(
+        patron_id, idempotency_key=request.headers.get('Idempotency-Key')
+    )
+    
+    if not success:
+        return jsonify({'success': False, 'message': message}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': message,
+        'transaction_id': transaction_id,
+        'allocations': get_payment_allocations(transaction_id)
+    })
+
+@api_bp.route('/payment_jobs', methods=['POST'])
+def queue_payment_job_api():
+    """
+    Queue a payment or refund for the background workers.
+    JSON body: {"kind": "pay", "patron_id", "book_id"}, {"kind": "pay_all", "patron_id"}
+    or {"kind": "refund", "transaction_id", "amount"}. Poll the returned status URL for the result.
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    
+    try:
+        if kind == 'pay':
+            success, message, job_id = queue_late_fee_payment(str(data.get('patron_id', '')), int(data['book_id']))
+        elif kind == 'pay_all':
+            success, message, job_id = queue_all_late_fees_payment(str(data.get('patron_id', '')))
+        elif kind == 'refund':
+            success, message, job_id = queue_late_fee_refund(str(data.get('transaction_id', '')),
+                                                             float(data['amount']))
+        else:
+            return jsonify({'error': "Kind must be 'pay', 'pay_all' or 'refund'."}), 400
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Missing or invalid job parameters.'}), 400
+    
+    if not success:
+        return jsonify({'error': message}), 400
+    
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('api.payment_job_status_api', job_id=job_id)
+    }), 202
+
+@api_bp.route('/payment_jobs/<job_id>')
+def payment_job_status_api(job_id):
+    """Status and, once finished, result of a queued payment job."""
+    job = get_payment_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(job)
+
 @api_bp.route('/search')
+@catalog_conditional
 def search_books_api():
     """
     Search for books via API endpoint.
@@ -37,3 +127,84 @@ def search_books_api():
         'results': books,
         'count': len(books)
     })
+
+@api_bp.route('/search/cache')
+def search_cache_stats_api():
+    """Hit, miss, eviction and invalidation counters of the search result cache."""
+    return jsonify(search_cache.stats())
+
+@api_bp.route('/books')
+def list_books_api():
+    """
+    List catalog books one page at a time.
+    Pass the returned 'next' cursor as ?after= to get the following page.
+    """
+    cursor = request.args.get('after') or None
+    
+    try:
+        limit = int(request.args.get('limit', CATALOG_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Limit must be an integer.'}), 400
+    
+    try:
+        page = get_catalog_page(cursor, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'books': page['books'],
+        'count': len(page['books']),
+        'limit': limit,
+        'next': page['next_cursor']
+    })
+
+@api_bp.route('/health/payment_gateway')
+def payment_gateway_health_api():
+    """
+    Circuit breaker and retry budget state of the payment gateway.
+    Responds 503 while the breaker is open so load balancers and monitors notice.
+    """
+    health = gateway_health()
+    return jsonify(health), 503 if health['circuit_breaker']['state'] == 'open' else 200
+
+BULK_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+}
+
+@api_bp.route('/books/bulk', methods=['POST'])
+def bulk_import_books_api():
+    """
+    Import many books from a CSV or JSON Lines request body.
+    The format comes from ?format=csv|jsonl or the Content-Type header.
+    The body is read as a stream, so large files are never held in memory.
+    """
+    fmt = request.args.get('format') or BULK_CONTENT_TYPES.get(request.mimetype)
+    if fmt not in FORMATS:
+        return jsonify({'error': 'Send text/csv or application/x-ndjson, or pass ?format=csv|jsonl.'}), 400
+    
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        report = import_books(read_rows(stream, fmt))
+    except UnicodeDecodeError:
+        return jsonify({'error': 'The request body must be UTF-8.'}), 400
+    
+    return jsonify(report)
+
+@api_bp.route('/export/<name>')
+def export_api(name):
+    """
+    Download the books or loans table as CSV (?format=csv, the default) or NDJSON (?format=ndjson).
+    Rows are streamed as they are read, so the whole table is never held in memory.
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        pieces = export_rows(name, fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    return Response(pieces, mimetype=MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename={name}.{extension}'
+    })
@@ -3,8 +3,8 @@ Catalog Routes - Book catalog related endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
-from services.library_service import add_book_to_catalog
+from routes.conditional import catalog_conditional
+from services.library_service import add_book_to_catalog, get_catalog_page, CATALOG_PAGE_SIZE
 
 catalog_bp = Blueprint('catalog', __name__)
 
@@ -14,13 +14,23 @@ def index():
     return redirect(url_for('catalog.catalog'))
 
 @catalog_bp.route('/catalog')
+@catalog_conditional
 def catalog():
     """
-    Display all books in the catalog.
+    Display the catalog one page at a time.
     Implements R2: Book Catalog Display
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    cursor = request.args.get('after') or None
+    
+    try:
+        page = get_catalog_page(cursor, CATALOG_PAGE_SIZE)
+    except ValueError as e:
+        flash(str(e), 'error')
+        page = get_catalog_page(None, CATALOG_PAGE_SIZE)
+        cursor = None
+    
+    return render_template('catalog.html', books=page['books'],
+                           next_cursor=page['next_cursor'], is_first_page=cursor is None)
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
@@ -0,0 +1,43 @@
+"""
+Conditional GET support for catalog-backed pages
+Tags responses with an ETag and Last-Modified taken from the catalog version,
+and answers a matching If-None-Match (or If-Modified-Since) with 304 before
+the view runs, so unchanged pages cost one primary-key read and no rendering.
+"""
+
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request, session
+from database import get_catalog_version
+
+
+def catalog_conditional(view):
+    """Decorate a GET view whose output depends only on its URL and the books table."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Pages showing flashed messages depend on the session, not just the catalog
+        if '_flashes' in session:
+            return view(*args, **kwargs)
+        
+        # Read the version before the view queries, so a concurrent write makes the tag stale rather than wrong
+        etag, modified = get_catalog_version()
+        last_modified = datetime.fromtimestamp(int(modified), timezone.utc)
+        
+        if request.if_none_match:
+            fresh = request.if_none_match.contains(etag)
+        else:
+            fresh = request.if_modified_since is not None and last_modified <= request.if_modified_since
+        if fresh:
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        # Clients may keep the page but must check back before reusing it
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
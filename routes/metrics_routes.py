@@ -0,0 +1,43 @@
+"""
+Metrics Routes - Request timing and the Prometheus /metrics endpoint
+"""
+
+import time
+
+from flask import Blueprint, Response, g, request
+from services.metrics import metrics, http_request_duration, METRICS_FLUSH_INTERVAL
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def metrics_endpoint():
+    """All metrics in the Prometheus text exposition format."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    """
+    Time every request of the app and configure the registry.
+
+    METRICS_DIR turns on multi-process mode (see services.metrics);
+    METRICS_FLUSH_INTERVAL bounds how often each worker writes its file.
+    """
+    metrics.configure(app.config.get('METRICS_DIR'),
+                      app.config.get('METRICS_FLUSH_INTERVAL', METRICS_FLUSH_INTERVAL))
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+def _observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Unmatched URLs share one series so that scanners cannot blow up the label set
+        http_request_duration.observe(
+            (request.blueprint or '', request.endpoint or 'unmatched', request.method, str(response.status_code)),
+            time.perf_counter() - started)
+        metrics.flush()
+    return response
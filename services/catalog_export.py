@@ -0,0 +1,81 @@
+"""
+Catalog Export Module - Streaming CSV and NDJSON exports
+Writes the books and borrow_records tables chunk by chunk from a database
+cursor, so memory use does not grow with the size of the table.
+
+Run with: python -m services.catalog_export books --format csv --output books.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from typing import Callable, Dict, Iterator, Tuple
+
+from database import BOOK_COLUMNS, BORROW_RECORD_COLUMNS, iter_books, iter_borrow_records
+
+EXPORT_CHUNK_SIZE = 5000
+FORMATS = ('csv', 'ndjson')
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# Export name -> (column names, chunked row iterator)
+EXPORTS: Dict[str, Tuple[Tuple[str, ...], Callable]] = {
+    'books': (BOOK_COLUMNS, iter_books),
+    'loans': (BORROW_RECORD_COLUMNS, iter_borrow_records),
+}
+
+
+def export_rows(name: str, fmt: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Stream an export as text, one piece per chunk of rows.
+
+    Args:
+        name: 'books' or 'loans'
+        fmt: 'csv' (with a header row) or 'ndjson' (one JSON object per line)
+        chunk_size: Rows fetched from the database and written per piece
+
+    Raises:
+        ValueError: If the export or format is unknown (raised before any row is read)
+    """
+    if name not in EXPORTS:
+        raise ValueError(f"Export must be one of: {', '.join(EXPORTS)}.")
+    if fmt not in FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(FORMATS)}.")
+    columns, iterate = EXPORTS[name]
+    return _csv_pieces(columns, iterate(chunk_size)) if fmt == 'csv' else _ndjson_pieces(columns, iterate(chunk_size))
+
+
+def _csv_pieces(columns, chunks) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson_pieces(columns, chunks) -> Iterator[str]:
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in chunk)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export books or loans as CSV or NDJSON.')
+    parser.add_argument('name', choices=list(EXPORTS))
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help='file to write (defaults to stdout)')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for piece in export_rows(args.name, args.format, args.chunk_size):
+            out.write(piece)
+    finally:
+        if args.output:
+            out.close()
@@ -0,0 +1,171 @@
+"""
+Catalog Import Module - Bulk loading of books from CSV or JSON Lines
+Streams the input, validates each row with the same rules as add_book_to_catalog,
+drops duplicate ISBNs using an in-memory set, and inserts the valid rows in
+chunked executemany transactions.
+
+Run with: python -m services.catalog_import books.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from database import get_all_isbns, init_database, insert_books
+from services.library_service import validate_book
+
+IMPORT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('csv', 'jsonl')
+COLUMNS = ('title', 'author', 'isbn', 'total_copies')
+
+
+def _text(value) -> str:
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _copies(value):
+    """total_copies as an int when the input holds a whole number, otherwise left for validate_book to reject."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return value
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Read book rows one at a time.
+
+    Args:
+        stream: Text stream; CSV needs a header row with title,author,isbn,total_copies
+        fmt: 'csv' or 'jsonl' (one JSON object per line)
+
+    Yields:
+        tuple: (row number, row dict or None, parse error or None)
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            yield 1, None, f"Missing CSV columns: {', '.join(missing)}"
+            return
+        for number, row in enumerate(reader, start=2):
+            yield number, row, None
+    elif fmt == 'jsonl':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None, "Invalid JSON."
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "Each line must be a JSON object."
+                continue
+            yield number, row, None
+    else:
+        raise ValueError(f"Format must be one of: {', '.join(FORMATS)}.")
+
+
+def import_books(rows: Iterable[Tuple[int, Optional[Dict], Optional[str]]],
+                 chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """
+    Validate and insert books in chunks.
+
+    Args:
+        rows: Output of read_rows()
+        chunk_size: Books inserted per transaction
+
+    Returns:
+        dict: Counts of rows read, imported and rejected, the first
+        MAX_REPORTED_ERRORS errors as {'row', 'error'}, and the throughput
+    """
+    began = time.perf_counter()
+    seen = get_all_isbns()
+    report = {'rows': 0, 'imported': 0, 'rejected': 0, 'errors': []}
+    chunk: List[Tuple[str, str, str, int, int]] = []
+    chunk_rows: List[int] = []
+
+    def reject(number: int, error: str):
+        report['rejected'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': number, 'error': error})
+
+    def flush():
+        inserted = insert_books(chunk)
+        if inserted is None:
+            for number in chunk_rows:
+                reject(number, "Database error occurred while adding the book.")
+        else:
+            report['imported'] += len(inserted)
+            # Rows skipped by the database were added by someone else since the ISBNs were loaded
+            added = {book['isbn'] for book in inserted}
+            for number, book in zip(chunk_rows, chunk):
+                if book[2] not in added:
+                    reject(number, "A book with this ISBN already exists.")
+        chunk.clear()
+        chunk_rows.clear()
+
+    for number, row, error in rows:
+        report['rows'] += 1
+        if error:
+            reject(number, error)
+            continue
+        # Validated exactly as add_book_to_catalog() receives it, so both paths accept the same rows
+        title, author, isbn = _text(row.get('title')), _text(row.get('author')), _text(row.get('isbn'))
+        total_copies = _copies(row.get('total_copies'))
+        error = validate_book(title, author, isbn, total_copies)
+        if error is None and isbn in seen:
+            error = "A book with this ISBN already exists."
+        if error:
+            reject(number, error)
+            continue
+        seen.add(isbn)
+        chunk.append((title.strip(), author.strip(), isbn, total_copies, total_copies))
+        chunk_rows.append(number)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    elapsed = time.perf_counter() - began
+    report['seconds'] = round(elapsed, 4)
+    report['rows_per_sec'] = round(report['rows'] / elapsed, 1) if elapsed > 0 else None
+    return report
+
+
+def detect_format(path: str) -> str:
+    """Guess the format from a file name: .csv, or .jsonl/.ndjson."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Cannot tell the format of '{path}'; pass --format.")
+
+
+def import_books_file(path: str, fmt: Optional[str] = None, chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """Import books from a CSV or JSON Lines file."""
+    fmt = fmt or detect_format(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        return import_books(read_rows(f, fmt), chunk_size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import books from a CSV or JSON Lines file.')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS, help='defaults to the file extension')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    init_database()
+    result = import_books_file(args.path, args.format, args.chunk_size)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if not result['rejected'] else 1)
@@ -0,0 +1,107 @@
+"""
+Fee Sweep Module - Library-wide overdue and late fee totals
+Streams all open loans in chunks and computes their late fees in bulk,
+instead of calling calculate_late_fee_for_book once per loan.
+
+Run nightly with: python -m services.fee_sweep
+"""
+
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple
+
+from database import iter_open_loans
+from services.library_service import compute_late_fee
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the sweep falls back to plain Python
+    np = None
+
+
+def compute_fees(due_dates: Sequence[str], as_of: datetime) -> Tuple[Sequence[int], Sequence[float]]:
+    """
+    Late fees for a batch of ISO-format due dates, as of one point in time.
+    Applies the same rules as compute_late_fee: $0.50/day for 7 days,
+    then $1.00/day, capped at $15.00.
+
+    Returns:
+        tuple: (days_overdue per loan, fee per loan)
+    """
+    if np is None:
+        results = [compute_late_fee(datetime.fromisoformat(due), as_of) for due in due_dates]
+        return [days for _, days in results], [fee for fee, _ in results]
+
+    due = np.array(due_dates, dtype='datetime64[us]')
+    days = (np.datetime64(as_of, 'us') - due) // np.timedelta64(1, 'D')
+    days = np.maximum(days, 0)
+    fees = np.where(days <= 7, days * 0.50, 3.50 + (days - 7) * 1.00)
+    fees = np.minimum(fees, 15.00)
+    return days, fees
+
+
+def sweep_late_fees(as_of: Optional[datetime] = None, chunk_size: int = 100000) -> Dict:
+    """
+    Compute outstanding late fees for every open loan in the library,
+    less anything already paid towards them.
+
+    Args:
+        as_of: Time to compute fees at (defaults to now)
+        chunk_size: Number of loans read and computed per batch
+
+    Returns:
+        dict: Totals plus per-patron and per-book fee aggregates
+    """
+    as_of = as_of or datetime.now()
+    by_patron = defaultdict(float)
+    by_book = defaultdict(float)
+    loans = overdue = 0
+    total = 0.0
+
+    for chunk in iter_open_loans(chunk_size):
+        patron_ids, book_ids, due_dates, paid = zip(*chunk)
+        days, fees = compute_fees(due_dates, as_of)
+        loans += len(chunk)
+
+        if np is None:
+            for patron_id, book_id, fee, already_paid in zip(patron_ids, book_ids, fees, paid):
+                fee = max(fee - already_paid, 0.0)
+                if fee > 0:
+                    overdue += 1
+                    total += fee
+                    by_patron[patron_id] += fee
+                    by_book[book_id] += fee
+            continue
+
+        # Only what is still owed counts
+        fees = np.maximum(fees - np.array(paid, dtype=float), 0.0)
+        late = fees > 0
+        overdue += int(late.sum())
+        total += float(fees.sum())
+        # Group the chunk by patron and by book, then fold into the running totals
+        for keys, totals in ((patron_ids, by_patron), (book_ids, by_book)):
+            unique, inverse = np.unique(np.array(keys)[late], return_inverse=True)
+            sums = np.bincount(inverse, weights=fees[late], minlength=len(unique))
+            for key, amount in zip(unique.tolist(), sums.tolist()):
+                totals[key] += amount
+
+    return {
+        'as_of': as_of.isoformat(),
+        'open_loans': loans,
+        'overdue_loans': overdue,
+        'total_fees': round(total, 2),
+        'by_patron': {patron: round(amount, 2) for patron, amount in by_patron.items()},
+        'by_book': {book: round(amount, 2) for book, amount in by_book.items()},
+    }
+
+
+if __name__ == '__main__':
+    report = sweep_late_fees()
+    print(json.dumps({
+        'as_of': report['as_of'],
+        'open_loans': report['open_loans'],
+        'overdue_loans': report['overdue_loans'],
+        'total_fees': report['total_fees'],
+        'patrons_owing': len(report['by_patron']),
+    }, indent=2))
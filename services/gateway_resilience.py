@@ -0,0 +1,229 @@
+"""
+Gateway Resilience Module - Timeouts, retries and a circuit breaker for payment calls
+Keeps a slow or failing payment provider from tying up every request: each call
+has a deadline, failed calls are retried only while the retry budget allows,
+and after repeated failures the breaker opens and calls fail at once.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from services.payment_service import call_gateway
+
+GATEWAY_TIMEOUT = 2.0
+GATEWAY_MAX_ATTEMPTS = 3
+GATEWAY_BACKOFF = 0.1
+GATEWAY_BACKOFF_CAP = 1.0
+
+
+class GatewayUnavailableError(Exception):
+    """Raised without calling the gateway while the circuit breaker is open."""
+
+
+class GatewayTimeoutError(Exception):
+    """Raised when the gateway does not answer within the call timeout."""
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive gateway failures.
+
+    closed: calls go through. After failure_threshold failures in a row the
+    breaker opens and rejects calls for reset_timeout seconds. It then lets a
+    single trial call through (half_open): success closes it, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may go to the gateway now."""
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_running = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def abandon(self):
+        """The call allow() let through ended without an outcome (it was cancelled); let another trial through."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_running = False
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+            self.rejected = self.opened = 0
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            return {'state': state, 'consecutive_failures': self._failures,
+                    'failure_threshold': self.failure_threshold, 'reset_timeout': self.reset_timeout,
+                    'times_opened': self.opened, 'rejected_calls': self.rejected}
+
+
+class RetryBudget:
+    """
+    Limits retries to a share of the calls made, so that retries cannot multiply
+    the load on a provider that is already struggling.
+
+    Every call earns `ratio` of a retry, up to `max_tokens`; every retry spends one.
+    """
+
+    def __init__(self, ratio: float = 0.2, initial: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = initial
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.denied = 0
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        """Take one retry from the budget; False if it is spent."""
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'tokens': round(self._tokens, 2), 'retries': self.retries, 'denied': self.denied}
+
+
+# Shared by every ResilientGateway that is not given its own, so the state
+# reflects the provider as a whole and can be reported by /api/health/payment_gateway
+gateway_breaker = CircuitBreaker()
+gateway_retry_budget = RetryBudget()
+
+
+class ResilientGateway:
+    """
+    Wraps a PaymentGateway or AsyncPaymentGateway with the same async contract.
+
+    Status lookups are retried after any error. Charges and refunds are
+    only retried after a ConnectionError, when the request never reached
+    the provider. After a timeout the charge may already have gone through,
+    and the gateway takes no idempotency key.
+    """
+
+    # Tells call_gateway() not to time calls to the wrapper, only those it makes to the gateway
+    WRAPS_GATEWAY = True
+
+    def __init__(self, gateway, timeout: float = GATEWAY_TIMEOUT, max_attempts: int = GATEWAY_MAX_ATTEMPTS,
+                 backoff: float = GATEWAY_BACKOFF, backoff_cap: float = GATEWAY_BACKOFF_CAP,
+                 breaker: Optional[CircuitBreaker] = None, retry_budget: Optional[RetryBudget] = None):
+        """
+        Args:
+            gateway: The gateway client to call
+            timeout: Seconds each attempt may take
+            max_attempts: Attempts per call, including the first
+            backoff: Base delay before a retry; doubles per attempt, with full jitter
+            backoff_cap: Longest delay before a retry
+            breaker: Circuit breaker (defaults to the shared gateway_breaker)
+            retry_budget: Retry budget (defaults to the shared gateway_retry_budget)
+        """
+        self.gateway = gateway
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker if breaker is not None else gateway_breaker
+        self.retry_budget = retry_budget if retry_budget is not None else gateway_retry_budget
+
+    async def _call(self, method_name: str, retry_on, *args, **kwargs):
+        method = getattr(self.gateway, method_name)
+        self.retry_budget.deposit()
+        attempt = 1
+        while True:
+            if not self.breaker.allow():
+                raise GatewayUnavailableError("Payment gateway is unavailable, please try again later.")
+            try:
+                result = await asyncio.wait_for(call_gateway(method, *args, **kwargs), self.timeout)
+            except asyncio.TimeoutError:
+                self.breaker.record_failure()
+                error = GatewayTimeoutError(f"Payment gateway did not respond within {self.timeout:g}s.")
+            except Exception as e:
+                self.breaker.record_failure()
+                error = e
+            except BaseException:
+                # Cancelled: a half-open breaker must not wait forever for this trial
+                self.breaker.abandon()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+            if attempt >= self.max_attempts or not isinstance(error, retry_on) or not self.retry_budget.withdraw():
+                raise error
+            await asyncio.sleep(random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** (attempt - 1))))
+            attempt += 1
+
+    async def process_payment(self, patron_id: str, amount: float, description: str = "", **kwargs):
+        return await self._call('process_payment', ConnectionError, patron_id=patron_id, amount=amount,
+                                description=description, **kwargs)
+
+    async def refund_payment(self, transaction_id: str, amount: float):
+        return await self._call('refund_payment', ConnectionError, transaction_id, amount)
+
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        return await self._call('verify_payment_status', Exception, transaction_id)
+
+
+def gateway_health() -> Dict:
+    """Breaker and retry budget state of the shared payment gateway, for monitoring."""
+    return {'circuit_breaker': gateway_breaker.stats(), 'retry_budget': gateway_retry_budget.stats()}
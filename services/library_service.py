@@ -2,47 +2,97 @@
 Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
-from services.payment_service import PaymentGateway 
+from services.payment_service import PaymentGateway, AsyncPaymentGateway, call_gateway, payment_status_cache
+from services.gateway_resilience import ResilientGateway
+from services.search_cache import search_cache
+from services.search_index import catalog_index
+import asyncio
+import base64
+import hashlib
+import json
+import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from database import (
     get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
-    insert_book, insert_borrow_record, update_book_availability, get_patron_borrowed_books, get_db_connection,
-    update_borrow_record_return_date, get_all_books
+    insert_book, get_patron_borrowed_books, get_db_connection, get_all_books,
+    borrow_book_transaction, return_book_transaction, search_books, get_patron_loan_history,
+    get_open_loan, claim_payment, finish_payment, get_payment, reopen_payment_status,
+    get_allocation_watermark
 )
 
-def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+# Catalog pagination
+CATALOG_PAGE_SIZE = 50
+MAX_CATALOG_PAGE_SIZE = 200
+
+# Catalog search: 'trigram' matches substrings through the in-memory index, and
+# uses the FTS5 index (word-prefix matching) only until the index is built;
+# 'fts' always uses the FTS5 index. Chosen by create_app() from SEARCH_BACKEND.
+SEARCH_BACKENDS = ('trigram', 'fts')
+_search_backend = 'trigram'
+
+def set_search_backend(name: str):
     """
-    Add a new book to the catalog.
-    Implements R1: Book Catalog Management
-    
+    Select the backend search_books_in_catalog() answers from.
+
     Args:
-        title: Book title (max 200 chars)
-        author: Book author (max 100 chars)
-        isbn: 13-digit ISBN
-        total_copies: Number of copies (positive integer)
-        
+        name: 'trigram' or 'fts'
+    """
+    global _search_backend
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend '{name}'.")
+    _search_backend = name
+
+def get_search_backend() -> str:
+    """Return the name of the selected search backend."""
+    return _search_backend
+
+def validate_book(title: str, author: str, isbn: str, total_copies: int) -> Optional[str]:
+    """
+    Check the fields of a new book against the R1 rules.
+    
     Returns:
-        tuple: (success: bool, message: str)
+        The error message for the first rule broken, or None if the book is valid
     """
-    # Input validation
     if not title or not title.strip():
-        return False, "Title is required."
+        return "Title is required."
     
     if len(title.strip()) > 200:
-        return False, "Title must be less than 200 characters."
+        return "Title must be less than 200 characters."
     
     if not author or not author.strip():
-        return False, "Author is required."
+        return "Author is required."
     
     if len(author.strip()) > 100:
-        return False, "Author must be less than 100 characters."
+        return "Author must be less than 100 characters."
     
     if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
+        return "ISBN must be exactly 13 digits."
     
     if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
+        return "Total copies must be a positive integer."
+    
+    return None
+
+
+def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+    """
+    Add a new book to the catalog.
+    Implements R1: Book Catalog Management
+    
+    Args:
+        title: Book title (max 200 chars)
+        author: Book author (max 100 chars)
+        isbn: 13-digit ISBN
+        total_copies: Number of copies (positive integer)
+        
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    # Input validation
+    error = validate_book(title, author, isbn, total_copies)
+    if error:
+        return False, error
     
     # Check for duplicate ISBN
     existing = get_book_by_isbn(isbn)
@@ -57,18 +107,19 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
         return False, "Database error occurred while adding the book."
     
 
-def book_catalog_display() -> List[Dict]:
+def book_catalog_display(after: Optional[Tuple[str, int]] = None, limit: Optional[int] = None) -> List[Dict]:
     """
     Displays all the books in a catalog alongside their information
     Implements R2: Book Catalog Display.
 
     Args:
-        None
+        after: Optional (title, id) of the last book on the previous page
+        limit: Optional maximum number of books to return
         
     Returns:
         A List of Dictionaries (all books in the catalog with required fields)
     """
-    books = get_all_books()
+    books = get_all_books(after, limit)
 
     # Building the catalog of books
     book_catalog = []
@@ -84,6 +135,54 @@ def book_catalog_display() -> List[Dict]:
 
     return book_catalog
 
+def encode_catalog_cursor(book: Dict) -> str:
+    """Turn the last book of a page into an opaque cursor for the next page."""
+    raw = json.dumps([book["title"], book["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_catalog_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Read a cursor made by encode_catalog_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        title, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid page cursor.")
+    if not isinstance(title, str) or not isinstance(book_id, int):
+        raise ValueError("Invalid page cursor.")
+    return title, book_id
+
+def get_catalog_page(cursor: Optional[str] = None, limit: int = CATALOG_PAGE_SIZE) -> Dict:
+    """
+    Get one page of the catalog using keyset pagination on (title, id).
+    The cost of a page does not depend on how far into the catalog it is.
+
+    Args:
+        cursor: Cursor returned with the previous page (None for the first page)
+        limit: Number of books per page (1 to MAX_CATALOG_PAGE_SIZE)
+
+    Returns:
+        dict: {"books": [...], "next_cursor": str or None}
+
+    Raises:
+        ValueError: If the cursor or limit is invalid
+    """
+    if not isinstance(limit, int) or not 1 <= limit <= MAX_CATALOG_PAGE_SIZE:
+        raise ValueError(f"Limit must be between 1 and {MAX_CATALOG_PAGE_SIZE}.")
+    after = decode_catalog_cursor(cursor) if cursor else None
+
+    # Fetch one extra row to learn whether another page follows
+    books = book_catalog_display(after, limit + 1)
+    next_cursor = None
+    if len(books) > limit:
+        books = books[:limit]
+        next_cursor = encode_catalog_cursor(books[-1])
+
+    return {"books": books, "next_cursor": next_cursor}
+
 def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
     Allow a patron to borrow a book.
@@ -118,15 +217,13 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=14)
     
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
+    # Take a copy and insert the borrow record in one transaction
+    outcome = borrow_book_transaction(patron_id, book_id, borrow_date, due_date)
+    if outcome == 'unavailable':
+        return False, "This book is currently not available."
+    if outcome != 'borrowed':
         return False, "Database error occurred while creating borrow record."
     
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
-    
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
 
@@ -166,16 +263,18 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if book_borrowed is None:
         return False, "Book not borrowed"
 
-    ### If book was borrowed, update the availiable copies 
-    update_success = update_book_availability(book_id, +1)
+    ##Calculate late fees while the loan is still open
+    late_info = calculate_late_fee_for_book(patron_id, book_id)
+    late_fee = late_info["fee_amount"]
+
+    ### Close the loan and put the copy back in one transaction
+    outcome = return_book_transaction(patron_id, book_id, datetime.now())
+    if outcome == 'not_borrowed':
+        return False, "Book not borrowed"
 
     ##Check if the update was a failure
-    if not update_success:
+    if outcome != 'returned':
         return False, "update was a failure"
-
-    ##Calculate late fees
-    late_info = calculate_late_fee_for_book(patron_id, book_id)
-    late_fee = late_info["fee_amount"]
     
     ##Print late fee message
     if late_fee > 0:
@@ -185,6 +284,27 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
         return True, f'Your late fee is zero dollars .'
 
 
+def compute_late_fee(due_date: datetime, as_of: datetime) -> Tuple[float, int]:
+    """
+    Late fee for a loan due on due_date, as of a given time. Pure, no database access.
+    $0.50/day for the first 7 days overdue, $1.00/day after that, capped at $15.00.
+
+    Returns:
+        tuple: (fee_amount: float, days_overdue: int)
+    """
+    days_overdue = (as_of - due_date).days
+    if days_overdue <= 0:
+        return 0.0, 0
+
+    if days_overdue <= 7:
+        fee_amount = days_overdue * 0.50
+    else:
+        fee_amount = (7 * 0.50) + ((days_overdue - 7) * 1.00)
+
+    ###Max late cap of 15 dollars
+    return round(min(fee_amount, 15.00), 2), days_overdue
+
+
 def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     """
     Calculate late fees for a specific book.
@@ -222,26 +342,18 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
         }
     
     ## Check if Patron actually borrowed the book
-    books_borrowed = get_patron_borrowed_books(patron_id)
-    book_borrowed = None
-
-    for key in books_borrowed:
-        if key["book_id"] == book_id:
-            book_borrowed = key
-            break
+    loan = get_open_loan(patron_id, book_id)
 
     ### The book was not borrowed by the patron
-    if book_borrowed is None:
+    if loan is None:
         return {
             'fee_amount' : 0.00,
             'days_overdue' : 0,
             'status' : 'This book was not borrowed by this person and is not in their possession currently'
         }
     
-    ##Calculate the number of days the book is overdue and record return date
-    due_date = book_borrowed["due_date"]
-    return_date = datetime.now()
-    days_overdue = (return_date - due_date).days
+    ##Calculate the number of days the book is overdue and the fee as of now
+    fee_amount, days_overdue = compute_late_fee(loan["due_date"], datetime.now())
 
     if days_overdue <= 0:
         return {
@@ -249,16 +361,15 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
             'days_overdue' : 0,
             'status' : 'This book was returned on time and is not overdue'
         }
-    
-    ##calculate the late fee
-    if days_overdue <= 7:
-        fee_amount = days_overdue * 0.50
 
-    else:
-        fee_amount = (7 * 0.50) + ((days_overdue -7) * 1.00)
-
-    ###Max late cap of 15 dollars
-    fee_amount = min(fee_amount, 15.00)
+    ##Only what has not been paid yet is owed
+    fee_amount = max(round(fee_amount - loan["paid"], 2), 0.0)
+    if fee_amount <= 0:
+        return {
+            'fee_amount' : 0.00,
+            'days_overdue' : days_overdue,
+            'status' : 'Late fees for this book have already been paid'
+        }
 
     ##Display message
     return {
@@ -287,22 +398,25 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     if not search_term or not search_type:
         return []
  
-    search_term = search_term.lower()
     search_type = search_type.lower()
+    if search_type not in ("title", "author", "isbn"):
+        return []
 
-    books = get_all_books()
-
-    found = []
-
-    for book in books:
-        if search_type == "title" and search_term in book["title"].lower():
-            found.append(book)
-        elif search_type == "author" and search_term in book["author"].lower():
-            found.append(book)
-        elif search_type == "isbn" and search_term in book["isbn"].lower():
-            found.append(book)
-
-    return found
+    # Substring matching through the in-memory trigram index once it is built,
+    # unless the full-text backend was chosen; otherwise the full-text index
+    # (word-prefix matching) answers the query
+    backend = 'trigram' if _search_backend == 'trigram' and catalog_index.ready else 'fts'
+    key = (backend, search_type, search_term.lower())
+    books, generation = search_cache.get(key)
+    if books is not None:
+        return books
+    
+    if backend == 'trigram':
+        books = catalog_index.search(search_term, search_type)
+    else:
+        books = search_books(search_term, search_type)
+    search_cache.put(key, books, generation)
+    return books
  
 
 def get_patron_status_report(patron_id: str) -> Dict:
@@ -327,49 +441,124 @@ def get_patron_status_report(patron_id: str) -> Dict:
             "report_status": "Invalid patron ID. Cannot create a report for unrecognizable patron"
         }
     
-    # Info needed on books currently borrowed including the number and the books borrowed
-    borrowed = get_patron_borrowed_books(patron_id)
-    num_current_borrowed = get_patron_borrow_count(patron_id)
+    # Every loan of the patron, open and returned, in a single query
+    history = get_patron_loan_history(patron_id)
+    now = datetime.now()
 
-    # Calculating the total late fee of each borrowed book
+    borrowed = []
+    borrow_history = []
     late_fees = 0.0
-    for book in borrowed:
-        fee_info = calculate_late_fee_for_book(patron_id, book["book_id"])
-        late_fees += fee_info.get("fee_amount", 0.0)
-    late_fees = round(late_fees, 2)
+    for loan in history:
+        if loan["return_date"] is None:
+            # Same shape as get_patron_borrowed_books()
+            borrowed.append({
+                "book_id": loan["book_id"],
+                "title": loan["title"],
+                "author": loan["author"],
+                "borrow_date": loan["borrow_date"],
+                "due_date": loan["due_date"],
+                "is_overdue": now > loan["due_date"]
+            })
+            fee_amount, _ = compute_late_fee(loan["due_date"], now)
+            late_fees += max(fee_amount - loan["paid"], 0.0)
 
-    # the borrowing history of each book in history
-    borrow_history = []
-    for book in borrowed:
         borrow_history.append({
-            "book_id": book["book_id"],
-            "title": book["title"],
-            "author": book["author"],
-            "borrow_date": book["borrow_date"].strftime("%Y-%m-%d"),
-            "due_date": book["due_date"].strftime("%Y-%m-%d"),
-            "return_date": "Not Returned"
+            "book_id": loan["book_id"],
+            "title": loan["title"],
+            "author": loan["author"],
+            "borrow_date": loan["borrow_date"].strftime("%Y-%m-%d"),
+            "due_date": loan["due_date"].strftime("%Y-%m-%d"),
+            "return_date": (
+                loan["return_date"].strftime("%Y-%m-%d") if loan["return_date"] else "Not Returned"
+            )
         })
 
     # output to display
     return {
         "patron_id": patron_id,
-        "num_current_borrowed": num_current_borrowed,
-        "late_fees": late_fees,
+        "num_current_borrowed": len(borrowed),
+        "late_fees": round(late_fees, 2),
         "borrowed": borrowed,
         "borrow_history": borrow_history
     }
 
-def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+def _new_idempotency_key(kind: str) -> str:
+    return f"{kind}_{uuid.uuid4().hex}"
+
+
+def _default_charge_key(patron_id: str, watermark: int, amount: float, description: str,
+                        allocations: List[Dict]) -> str:
+    """
+    Idempotency key for a charge made without one: the same for every call that
+    sees the same fees owed, so a double submit is charged once.
+
+    The allocation watermark must be read before the fees are computed. A call
+    that reads it after an earlier charge finished also sees that charge's
+    payments, and owes nothing more.
+    """
+    loans = ",".join(f"{item['record_id']}:{item['amount']:.2f}"
+                     for item in sorted(allocations, key=lambda item: item["record_id"]))
+    digest = hashlib.sha256(f"{patron_id}|{watermark}|{amount:.2f}|{description}|{loans}".encode()).hexdigest()
+    return f"charge_{digest[:32]}"
+
+
+def _replayed_charge(stored: Dict) -> Tuple[bool, str, Optional[str]]:
+    """Result of a charge whose idempotency key was already used."""
+    if stored["status"] == "succeeded":
+        return True, stored["message"], stored["transaction_id"]
+    return False, "A payment with this idempotency key is already in progress.", None
+
+
+async def _charge(patron_id: str, amount: float, description: str, allocations: List[Dict],
+                  payment_gateway, key: str, **gateway_kwargs) -> Tuple[bool, str, Optional[str]]:
+    """Charge through the gateway at most once per idempotency key and record the outcome."""
+    stored = claim_payment(key, "charge", amount, patron_id)
+    if stored is not None:
+        return _replayed_charge(stored)
+    
+    # Use provided gateway or create new one, with timeouts, retries and the circuit breaker
+    if payment_gateway is None:
+        payment_gateway = ResilientGateway(AsyncPaymentGateway())
+    
+    # Process payment through external gateway
+    # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
+    try:
+        success, transaction_id, message = await call_gateway(
+            payment_gateway.process_payment,
+            patron_id=patron_id,
+            amount=amount,
+            description=description,
+            **gateway_kwargs
+        )
+    except Exception as e:
+        # Handle payment gateway errors
+        finish_payment(key, False, None, str(e))
+        return False, f"Payment processing error: {str(e)}", None
+    
+    if not success:
+        finish_payment(key, False, None, message)
+        return False, f"Payment failed: {message}", None
+    
+    result_message = f"Payment successful! {message}"
+    if not finish_payment(key, True, transaction_id, result_message, allocations):
+        return True, f"Payment successful, but it could not be recorded. {message}", transaction_id
+    return True, result_message, transaction_id
+
+
+def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None,
+                  idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
     """
     Process payment for late fees using external payment gateway.
     
     NEW FEATURE FOR ASSIGNMENT 3: Demonstrates need for mocking/stubbing
     This function depends on an external payment service that should be mocked in tests.
+    Thin blocking wrapper around pay_late_fees_async; do not call it from a running event loop.
     
     Args:
         patron_id: 6-digit library card ID
         book_id: ID of the book with late fees
         payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Optional key; retries with the same key are charged only once
         
     Returns:
         tuple: (success: bool, message: str, transaction_id: Optional[str])
@@ -380,11 +569,38 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
         success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
     """
+    return asyncio.run(pay_late_fees_async(patron_id, book_id, payment_gateway, idempotency_key))
+
+
+async def pay_late_fees_async(patron_id: str, book_id: int, payment_gateway=None,
+                              idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Process payment for late fees without blocking while the gateway responds.
+    
+    Every charge is written to the payments ledger. A repeated call with the same
+    idempotency key returns the stored result without contacting the gateway.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        payment_gateway: AsyncPaymentGateway, or a blocking PaymentGateway
+            (run on a worker thread); defaults to a ResilientGateway around AsyncPaymentGateway()
+        idempotency_key: Optional key; retries with the same key are charged only once
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
     # Validate patron ID
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits.", None
     
-    # Calculate late fee first
+    # A completed retry is answered from the ledger before anything is recalculated
+    stored = get_payment(idempotency_key) if idempotency_key else None
+    if stored is not None and stored["status"] == "succeeded":
+        return _replayed_charge(stored)
+    watermark = None if idempotency_key else get_allocation_watermark(patron_id)
+    
+    # Calculate late fee first (already net of earlier payments)
     fee_info = calculate_late_fee_for_book(patron_id, book_id)
     
     # Check if there's a fee to pay
@@ -401,39 +617,129 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
     if not book:
         return False, "Book not found.", None
     
-    # Use provided gateway or create new one
-    if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+    loan = get_open_loan(patron_id, book_id)
+    allocations = [{"record_id": loan["record_id"], "book_id": book_id, "amount": fee_amount}] if loan else []
     
-    # Process payment through external gateway
-    # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
-    try:
-        success, transaction_id, message = payment_gateway.process_payment(
-            patron_id=patron_id,
-            amount=fee_amount,
-            description=f"Late fees for '{book['title']}'"
-        )
+    description = f"Late fees for '{book['title']}'"
+    key = idempotency_key or _default_charge_key(patron_id, watermark, fee_amount, description, allocations)
+    return await _charge(
+        patron_id, fee_amount, description, allocations,
+        payment_gateway, key
+    )
+
+
+def pay_all_late_fees(patron_id: str, payment_gateway: PaymentGateway = None,
+                      idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Settle every outstanding late fee of a patron with one gateway charge.
+    Thin blocking wrapper around pay_all_late_fees_async.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Optional key; retries with the same key are charged only once
         
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
-            return False, f"Payment failed: {message}", None
-            
-    except Exception as e:
-        # Handle payment gateway errors
-        return False, f"Payment processing error: {str(e)}", None
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    return asyncio.run(pay_all_late_fees_async(patron_id, payment_gateway, idempotency_key))
 
 
-def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
+async def pay_all_late_fees_async(patron_id: str, payment_gateway=None,
+                                  idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Settle every outstanding late fee of a patron with one gateway charge.
+    
+    The fees of all open loans, less anything already paid, are computed in one
+    pass over the patron's loan history and sent as a single charge with one
+    line item per book. The split is recorded in payment_allocations.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        payment_gateway: AsyncPaymentGateway or blocking PaymentGateway;
+            defaults to a ResilientGateway around AsyncPaymentGateway()
+        idempotency_key: Optional key; retries with the same key are charged only once
+        
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+    
+    stored = get_payment(idempotency_key) if idempotency_key else None
+    if stored is not None and stored["status"] == "succeeded":
+        return _replayed_charge(stored)
+    watermark = None if idempotency_key else get_allocation_watermark(patron_id)
+    
+    # One query for all loans, fees computed in memory
+    now = datetime.now()
+    allocations = []
+    for loan in get_patron_loan_history(patron_id):
+        if loan["return_date"] is not None:
+            continue
+        fee_amount, _ = compute_late_fee(loan["due_date"], now)
+        fee_amount = round(fee_amount - loan["paid"], 2)
+        if fee_amount > 0:
+            allocations.append({
+                "record_id": loan["record_id"],
+                "book_id": loan["book_id"],
+                "title": loan["title"],
+                "amount": fee_amount
+            })
+    
+    if not allocations:
+        return False, "No late fees to pay.", None
+    
+    total = round(sum(item["amount"] for item in allocations), 2)
+    description = f"Late fees for {len(allocations)} book(s)"
+    key = idempotency_key or _default_charge_key(patron_id, watermark, total, description, allocations)
+    
+    return await _charge(
+        patron_id, total, description, allocations,
+        payment_gateway, key,
+        line_items=[
+            {"book_id": item["book_id"], "description": item["title"], "amount": item["amount"]}
+            for item in allocations
+        ]
+    )
+
+
+def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None,
+                            idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
     """
     Refund a late fee payment (e.g., if book was returned on time but fees were charged in error).
     
     NEW FEATURE FOR ASSIGNMENT 3: Another function requiring mocking
+    Thin blocking wrapper around refund_late_fee_payment_async.
     
     Args:
         transaction_id: Original transaction ID to refund
         amount: Amount to refund
         payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Optional key; retries with the same key are refunded only once
+        
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    return asyncio.run(refund_late_fee_payment_async(transaction_id, amount, payment_gateway, idempotency_key))
+
+
+async def refund_late_fee_payment_async(transaction_id: str, amount: float, payment_gateway=None,
+                                        idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Refund a late fee payment without blocking while the gateway responds.
+    
+    When the original charge is in the payments ledger, the refund may not
+    exceed what is left of it. Older transactions are only held to the
+    $15.00 per-book maximum.
+    
+    Args:
+        transaction_id: Original transaction ID to refund
+        amount: Amount to refund
+        payment_gateway: AsyncPaymentGateway or blocking PaymentGateway;
+            defaults to a ResilientGateway around AsyncPaymentGateway()
+        idempotency_key: Optional key; retries with the same key are refunded only once
         
     Returns:
         tuple: (success: bool, message: str)
@@ -448,21 +754,33 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
     if amount > 15.00:  # Maximum late fee per book
         return False, "Refund amount exceeds maximum late fee."
     
-    # Use provided gateway or create new one
+    key = idempotency_key or _new_idempotency_key("refund")
+    try:
+        stored = claim_payment(key, "refund", amount, refund_of=transaction_id)
+    except ValueError as e:
+        return False, str(e)
+    if stored is not None:
+        if stored["status"] == "succeeded":
+            return True, stored["message"]
+        return False, "A refund with this idempotency key is already in progress."
+    
+    # Use provided gateway or create new one, with timeouts, retries and the circuit breaker
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = ResilientGateway(AsyncPaymentGateway())
     
     # Process refund through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN YOUR TESTS!
     try:
-        success, message = payment_gateway.refund_payment(transaction_id, amount)
-        
-        if success:
-            return True, message
-        else:
-            return False, f"Refund failed: {message}"
-            
+        success, message = await call_gateway(payment_gateway.refund_payment, transaction_id, amount)
     except Exception as e:
+        finish_payment(key, False, None, str(e))
         return False, f"Refund processing error: {str(e)}"
     
-
+    finish_payment(key, success, transaction_id if success else None, message)
+    if success:
+        # The charge's cached or reconciled status ("completed") is out of date now
+        payment_status_cache.discard(transaction_id)
+        reopen_payment_status(transaction_id)
+        return True, message
+    else:
+        return False, f"Refund failed: {message}"
@@ -0,0 +1,244 @@
+"""
+Metrics Module - Request and gateway latency histograms in Prometheus text format
+Histograms keep fixed buckets per label combination behind one short lock
+each. Pool statistics are read when the metrics are rendered.
+
+With several worker processes, give every worker the same metrics directory:
+each one writes its numbers to its own file there (at most once per flush
+interval, and whenever it renders), and rendering adds up the files of all
+workers, so any worker can answer a scrape.
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import database
+
+# Upper bounds (seconds) of the latency buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_FLUSH_INTERVAL = 1.0
+
+# A collector returns (name, type, help, value) samples, read at render time
+Sample = Tuple[str, str, str, float]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with one series per combination of label values.
+
+    A series is a list of per-bucket counts (the last one for +Inf) followed
+    by the sum of the observed values.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        """Count one observation; `labels` are the values for labelnames, in order."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List]:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def _after_fork(self):
+        # A forked worker starts from zero; the parent's numbers are its own
+        self._lock = threading.Lock()
+        self._series = {}
+
+
+class MetricsRegistry:
+    """Histograms and collectors of this process, rendered as Prometheus text exposition."""
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+        self.directory: Optional[str] = None
+        self.flush_interval = METRICS_FLUSH_INTERVAL
+        self._last_flush = 0.0
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str],
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        histogram = self.histograms[name] = Histogram(name, documentation, labelnames, buckets)
+        return histogram
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self.collectors.append(collector)
+
+    def configure(self, directory: Optional[str] = None, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        """
+        Args:
+            directory: Shared directory for multi-process mode (None keeps metrics in this process only)
+            flush_interval: Minimum seconds between writes of this process's file
+        """
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+
+    def snapshot(self) -> Dict:
+        """Return this process's metrics as a JSON-serialisable dict."""
+        samples = []
+        for collector in self.collectors:
+            samples.extend(list(sample) for sample in collector())
+        return {
+            'pid': os.getpid(),
+            'histograms': {name: [[list(labels), series] for labels, series in histogram.snapshot().items()]
+                           for name, histogram in self.histograms.items()},
+            'samples': samples,
+        }
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self, force: bool = False):
+        """Write this process's file in multi-process mode, unless it was written less than flush_interval ago."""
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        path = self._path(os.getpid())
+        temp = os.path.join(self.directory, f'.metrics-{os.getpid()}.json.tmp')
+        with open(temp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp, path)
+
+    def _snapshots(self) -> List[Dict]:
+        if self.directory is None:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for path in sorted(glob.glob(os.path.join(self.directory, 'metrics-*.json'))):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+
+        In multi-process mode histograms are summed over every worker that
+        has written a file, including exited ones, so counts never go back.
+        Collector samples describe a live process; they carry a pid label and
+        are left out for workers that have exited.
+        """
+        snapshots = self._snapshots()
+        multi_process = self.directory is not None
+        lines = []
+
+        for name, histogram in self.histograms.items():
+            merged: Dict[Tuple[str, ...], List] = {}
+            for snapshot in snapshots:
+                for labels, series in snapshot['histograms'].get(name, ()):
+                    total = merged.setdefault(tuple(labels), [0] * len(series))
+                    for i, value in enumerate(series):
+                        total[i] += value
+            lines.append(f'# HELP {name} {histogram.documentation}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, series in sorted(merged.items()):
+                pairs = list(zip(histogram.labelnames, labels))
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), series):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_labels(pairs + [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(pairs)} {series[-1]!r}')
+                lines.append(f'{name}_count{_labels(pairs)} {cumulative}')
+
+        described = set()
+        for snapshot in snapshots:
+            if multi_process and snapshot['pid'] != os.getpid() and not _alive(snapshot['pid']):
+                continue
+            pairs = [('pid', str(snapshot['pid']))] if multi_process else []
+            for name, kind, documentation, value in snapshot['samples']:
+                if name not in described:
+                    described.add(name)
+                    lines.append(f'# HELP {name} {documentation}')
+                    lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name}{_labels(pairs)} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+    def _after_fork(self):
+        for histogram in self.histograms.values():
+            histogram._after_fork()
+        self._last_flush = 0.0
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# Process-wide registry, served at /metrics
+metrics = MetricsRegistry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics._after_fork)
+atexit.register(lambda: metrics.flush(force=True))
+
+http_request_duration = metrics.histogram(
+    'library_http_request_duration_seconds', 'Time spent handling HTTP requests.',
+    ('blueprint', 'endpoint', 'method', 'status'))
+gateway_call_duration = metrics.histogram(
+    'library_gateway_call_duration_seconds', 'Time spent in payment gateway calls.',
+    ('gateway', 'method', 'outcome'))
+
+POOL_SAMPLES = (
+    ('max_size', 'gauge', 'Maximum number of pooled database connections.'),
+    ('open', 'gauge', 'Open pooled database connections.'),
+    ('idle', 'gauge', 'Idle pooled database connections.'),
+    ('in_use', 'gauge', 'Pooled database connections checked out.'),
+    ('created', 'counter', 'Database connections opened by the pool.'),
+    ('reused', 'counter', 'Checkouts served by an idle connection.'),
+    ('recycled', 'counter', 'Connections replaced after failing a health check.'),
+    ('waits', 'counter', 'Checkouts that had to wait for a free connection.'),
+)
+
+
+def _pool_samples() -> Iterable[Sample]:
+    stats = database.get_pool().stats()
+    for key, kind, documentation in POOL_SAMPLES:
+        name = f'library_db_pool_{key}' + ('_total' if kind == 'counter' else '')
+        yield name, kind, documentation, stats[key]
+
+
+metrics.add_collector(_pool_samples)
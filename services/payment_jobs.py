@@ -0,0 +1,233 @@
+"""
+Payment Jobs Module - Background queue for payments and refunds
+Requests enqueue a job and return at once; a pool of worker threads runs the
+gateway calls. Jobs are stored in SQLite, so unfinished ones are picked up
+again after a restart, or by another worker process once the lease of the
+one running them has expired.
+"""
+
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from database import (
+    PAYMENT_PENDING_TIMEOUT, insert_payment_job, start_payment_job, defer_payment_job, finish_payment_job,
+    get_payment_job, get_unfinished_payment_jobs, get_payment
+)
+from services.library_service import pay_late_fees, pay_all_late_fees, refund_late_fee_payment
+
+PAYMENT_WORKERS = 2
+# Seconds between scans for deferred jobs and jobs abandoned by a stopped worker
+PAYMENT_JOB_POLL_INTERVAL = 30.0
+
+
+class PaymentJobQueue:
+    """
+    Runs payment jobs on a thread pool.
+
+    The job ID doubles as the payment's idempotency key. A job that was
+    interrupted mid-charge and is run again after a restart gets the ledger
+    result back instead of charging twice. If the ledger entry is still
+    pending, the charge may or may not have gone through, so the job waits
+    in the queue until the ledger lets the key be retried
+    (PAYMENT_PENDING_TIMEOUT).
+    """
+
+    def __init__(self, payment_gateway=None):
+        """
+        Args:
+            payment_gateway: Gateway handed to the payment functions
+                (None uses their default, the resilient async gateway)
+        """
+        self.payment_gateway = payment_gateway
+        self.workers = 0
+        self.poll_interval = PAYMENT_JOB_POLL_INTERVAL
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stop_polling = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self, workers: int = PAYMENT_WORKERS, poll_interval: float = PAYMENT_JOB_POLL_INTERVAL) -> int:
+        """
+        Start the worker pool (if needed) and requeue the jobs that can be claimed now:
+        queued ones, and running ones whose worker's lease has expired.
+
+        Args:
+            workers: Number of worker threads
+            poll_interval: Seconds between later scans for deferred and abandoned jobs
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        if workers < 1:
+            raise ValueError("At least one payment worker is required.")
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payment-worker')
+                self.workers = workers
+                self.poll_interval = poll_interval
+                self._start_polling()
+        return self._requeue()
+
+    def stop(self, wait: bool = True):
+        """Stop taking jobs; queued jobs stay in the database for the next start()."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._futures.clear()
+            self._stop_polling.set()
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _after_fork(self):
+        # Worker threads do not survive a fork; the child gets an empty pool of its own.
+        # Jobs already queued stay with the parent.
+        self._lock = threading.Lock()
+        self._futures = {}
+        if self._executor is not None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='payment-worker')
+            self._start_polling()
+
+    def _start_polling(self):
+        self._stop_polling = stop = threading.Event()
+        threading.Thread(target=self._poll, args=(stop,), name='payment-job-poller', daemon=True).start()
+
+    def _poll(self, stop: threading.Event):
+        while not stop.wait(self.poll_interval):
+            try:
+                self._requeue()
+            except Exception:
+                # The database may be briefly unavailable; try again on the next round
+                continue
+
+    def _requeue(self) -> int:
+        job_ids = get_unfinished_payment_jobs()
+        for job_id in job_ids:
+            self._submit(job_id)
+        return len(job_ids)
+
+    def _submit(self, job_id: str):
+        with self._lock:
+            if self._executor is None:
+                return
+            previous = self._futures.get(job_id)
+            if previous is not None and not previous.done():
+                return
+            future = self._executor.submit(self._run, job_id)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._forget(job_id, f))
+
+    def _forget(self, job_id: str, future: Future):
+        with self._lock:
+            if self._futures.get(job_id) is future:
+                del self._futures[job_id]
+
+    def enqueue(self, kind: str, params: Dict) -> Optional[str]:
+        """Store a job and hand it to the workers; returns the job ID, or None if it could not be stored."""
+        job_id = f"job_{uuid.uuid4().hex}"
+        if not insert_payment_job(job_id, kind, params):
+            return None
+        self._submit(job_id)
+        return job_id
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Block until the job is no longer in flight here, then return it."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return get_payment_job(job_id)
+
+    def _run(self, job_id: str):
+        job = start_payment_job(job_id)
+        if job is None:
+            return
+        params = job['params']
+        try:
+            if job['kind'] == 'pay':
+                success, message, transaction_id = pay_late_fees(
+                    params['patron_id'], params['book_id'], self.payment_gateway, idempotency_key=job_id)
+                result = {'success': success, 'message': message, 'transaction_id': transaction_id}
+            elif job['kind'] == 'pay_all':
+                success, message, transaction_id = pay_all_late_fees(
+                    params['patron_id'], self.payment_gateway, idempotency_key=job_id)
+                result = {'success': success, 'message': message, 'transaction_id': transaction_id}
+            elif job['kind'] == 'refund':
+                success, message = refund_late_fee_payment(
+                    params['transaction_id'], params['amount'], self.payment_gateway, idempotency_key=job_id)
+                result = {'success': success, 'message': message}
+            else:
+                success, result = False, {'success': False, 'message': f"Unknown job kind '{job['kind']}'."}
+        except Exception as e:
+            success, result = False, {'success': False, 'message': f"Job failed: {str(e)}"}
+        if not success:
+            # An earlier attempt claimed the key and never finished: wait until the ledger releases it
+            payment = get_payment(job_id)
+            if payment is not None and payment['status'] == 'pending':
+                run_after = datetime.fromisoformat(payment['updated_at']) + timedelta(seconds=PAYMENT_PENDING_TIMEOUT + 1)
+                defer_payment_job(job_id, run_after, result)
+                return
+        finish_payment_job(job_id, success, result)
+
+
+# Process-wide queue, started by create_app()
+payment_jobs = PaymentJobQueue()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=payment_jobs._after_fork)
+
+
+def _valid_patron(patron_id: str) -> bool:
+    return bool(patron_id) and patron_id.isdigit() and len(patron_id) == 6
+
+
+def queue_late_fee_payment(patron_id: str, book_id: int) -> Tuple[bool, str, Optional[str]]:
+    """
+    Queue payment of the late fee for one book.
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[str])
+    """
+    if not _valid_patron(patron_id):
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+    return _queue('pay', {'patron_id': patron_id, 'book_id': book_id})
+
+
+def queue_all_late_fees_payment(patron_id: str) -> Tuple[bool, str, Optional[str]]:
+    """
+    Queue payment of all of a patron's late fees.
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[str])
+    """
+    if not _valid_patron(patron_id):
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+    return _queue('pay_all', {'patron_id': patron_id})
+
+
+def queue_late_fee_refund(transaction_id: str, amount: float) -> Tuple[bool, str, Optional[str]]:
+    """
+    Queue a refund of a late fee payment.
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[str])
+    """
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return False, "Invalid transaction ID.", None
+    if amount <= 0:
+        return False, "Refund amount must be greater than 0.", None
+    return _queue('refund', {'transaction_id': transaction_id, 'amount': amount})
+
+
+def _queue(kind: str, params: Dict) -> Tuple[bool, str, Optional[str]]:
+    if not payment_jobs.running:
+        return False, "Background payments are not enabled.", None
+    job_id = payment_jobs.enqueue(kind, params)
+    if job_id is None:
+        return False, "Database error occurred while queuing the payment.", None
+    return True, "Payment queued.", job_id
@@ -8,8 +8,191 @@ since we cannot make actual payment API calls during testing.
 
 ##import requests
 
-from typing import Dict, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
 import time
+import uuid
+
+from services.metrics import gateway_call_duration
+
+# Statuses that do not change on their own; only these are cached. A completed
+# charge can still be refunded by this app, which evicts it (see discard()).
+TERMINAL_STATUSES = frozenset({"completed", "failed", "refunded", "cancelled"})
+
+
+def _charge_result(patron_id: str, amount: float, line_items: Optional[List[Dict]] = None) -> Tuple[bool, str, str]:
+    """Simulated gateway response to a charge request."""
+    if line_items is not None and round(sum(item["amount"] for item in line_items), 2) != round(amount, 2):
+        return False, "", "Invalid line items: they must add up to the amount"
+    
+    if amount <= 0:
+        return False, "", "Invalid amount: must be greater than 0"
+    
+    if amount > 1000:
+        return False, "", "Payment declined: amount exceeds limit"
+    
+    if len(patron_id) != 6:
+        return False, "", "Invalid patron ID format"
+    
+    # Simulate successful payment; the ledger keys allocations and refunds on the
+    # transaction ID, so two charges in the same second must not share one
+    transaction_id = f"txn_{patron_id}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+
+
+def _refund_result(transaction_id: str, amount: float) -> Tuple[bool, str]:
+    """Simulated gateway response to a refund request."""
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return False, "Invalid transaction ID"
+    
+    if amount <= 0:
+        return False, "Invalid refund amount"
+    
+    refund_id = f"refund_{transaction_id}_{int(time.time())}"
+    return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+
+
+def _status_result(transaction_id: str) -> Dict:
+    """Simulated gateway response to a status lookup."""
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return {"status": "not_found", "message": "Transaction not found"}
+    
+    # Simulate status check
+    return {
+        "transaction_id": transaction_id,
+        "status": "completed",
+        "amount": 10.50,
+        "timestamp": time.time()
+    }
+
+
+class PaymentStatusCache:
+    """
+    Thread-safe LRU cache of verify_payment_status results with a time-to-live.
+    
+    Only terminal statuses are stored, so a pending or unknown transaction is
+    always looked up at the gateway again.
+    """
+    
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            maxsize: Most transactions kept; the least recently used is evicted first
+            ttl: Seconds an entry stays valid
+            clock: Time source in seconds (injectable for testing)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, transaction_id: str) -> Optional[Dict]:
+        """Return a copy of the cached status, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(transaction_id)
+            if entry is None or self._clock() >= entry[0]:
+                if entry is not None:
+                    del self._entries[transaction_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(transaction_id)
+            self.hits += 1
+            return dict(entry[1])
+    
+    def put(self, transaction_id: str, status: Dict) -> bool:
+        """Cache a status if it is terminal; returns whether it was stored."""
+        if self.maxsize <= 0 or status.get("status") not in TERMINAL_STATUSES:
+            return False
+        with self._lock:
+            self._entries[transaction_id] = (self._clock() + self.ttl, dict(status))
+            self._entries.move_to_end(transaction_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return True
+    
+    def discard(self, transaction_id: str):
+        """Drop a transaction whose status has changed, e.g. after a refund."""
+        with self._lock:
+            self._entries.pop(transaction_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl,
+                    "hits": self.hits, "misses": self.misses}
+
+
+# Shared by every gateway instance unless one is given its own cache
+payment_status_cache = PaymentStatusCache()
+
+
+# Blocking gateway calls run on threads of their own. asyncio.run() joins the
+# event loop's default executor when it returns, so a call made with
+# asyncio.to_thread() would keep the caller waiting after a timeout gave up on it.
+GATEWAY_THREADS = 32
+_gateway_executor: Optional[ThreadPoolExecutor] = None
+_gateway_executor_lock = threading.Lock()
+
+
+def _get_gateway_executor() -> ThreadPoolExecutor:
+    global _gateway_executor
+    with _gateway_executor_lock:
+        if _gateway_executor is None:
+            _gateway_executor = ThreadPoolExecutor(max_workers=GATEWAY_THREADS, thread_name_prefix='gateway-call')
+        return _gateway_executor
+
+
+def _reset_gateway_executor():
+    # Threads do not survive a fork; the child starts a pool of its own when needed
+    global _gateway_executor, _gateway_executor_lock
+    _gateway_executor = None
+    _gateway_executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_gateway_executor)
+
+
+async def call_gateway(method, *args, **kwargs):
+    """
+    Await an async gateway method, or run a blocking one on a gateway thread.
+    Cancelling the call (e.g. on timeout) returns at once; a blocking call
+    carries on in the background until the gateway answers.
+    The call's latency is recorded in gateway_call_duration; 'error' covers
+    exceptions and calls cancelled by a timeout.
+    """
+    owner = getattr(method, '__self__', None)
+    if getattr(owner, 'WRAPS_GATEWAY', False):
+        # Wrappers such as ResilientGateway call the real gateway through here; only those calls are timed
+        return await method(*args, **kwargs)
+    labels = (type(owner).__name__ if owner is not None else 'unknown', getattr(method, '__name__', 'unknown'))
+    outcome = 'error'
+    start = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(method):
+            result = await method(*args, **kwargs)
+        else:
+            call = functools.partial(contextvars.copy_context().run, method, *args, **kwargs)
+            result = await asyncio.get_running_loop().run_in_executor(_get_gateway_executor(), call)
+        outcome = 'ok'
+        return result
+    finally:
+        gateway_call_duration.observe(labels + (outcome,), time.perf_counter() - start)
 
 
 class PaymentGateway:
@@ -23,17 +206,25 @@ class PaymentGateway:
     - Incurring costs or rate limits
     """
     
-    def __init__(self, api_key: str = "test_key_12345"):
+    # Simulated round-trip time of each call, in seconds
+    PROCESS_DELAY = 0.5
+    REFUND_DELAY = 0.5
+    STATUS_DELAY = 0.3
+    
+    def __init__(self, api_key: str = "test_key_12345", status_cache: Optional[PaymentStatusCache] = None):
         """
         Initialize payment gateway with API credentials.
         
         Args:
             api_key: API key for authentication (default is test key)
+            status_cache: Cache for verify_payment_status (defaults to the shared payment_status_cache)
         """
         self.api_key = api_key
         self.base_url = "https://api.payment-gateway.example.com"
+        self.status_cache = status_cache if status_cache is not None else payment_status_cache
     
-    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+    def process_payment(self, patron_id: str, amount: float, description: str = "",
+                        line_items: Optional[List[Dict]] = None) -> Tuple[bool, str, str]:
         """
         Process a payment through the external gateway.
         
@@ -44,6 +235,7 @@ class PaymentGateway:
             patron_id: 6-digit patron/customer ID
             amount: Payment amount in dollars
             description: Payment description
+            line_items: Optional breakdown of the charge, dicts with at least 'amount'
             
         Returns:
             tuple: (success: bool, transaction_id: str, message: str)
@@ -53,7 +245,7 @@ class PaymentGateway:
             success, txn_id, msg = gateway.process_payment("123456", 10.50, "Late fees")
         """
         # Simulate API call delay
-        time.sleep(0.5)
+        time.sleep(self.PROCESS_DELAY)
         
         # In a real implementation, this would make an HTTP request:
         # response = requests.post(
@@ -63,25 +255,14 @@ class PaymentGateway:
         #         "customer_id": patron_id,
         #         "amount": amount,
         #         "currency": "usd",
-        #         "description": description
+        #         "description": description,
+        #         "line_items": line_items
         #     }
         # )
         
         # For this template, we simulate different scenarios based on amount
         # This allows testing without a real API
-        
-        if amount <= 0:
-            return False, "", "Invalid amount: must be greater than 0"
-        
-        if amount > 1000:
-            return False, "", "Payment declined: amount exceeds limit"
-        
-        if len(patron_id) != 6:
-            return False, "", "Invalid patron ID format"
-        
-        # Simulate successful payment
-        transaction_id = f"txn_{patron_id}_{int(time.time())}"
-        return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+        return _charge_result(patron_id, amount, line_items)
     
     def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
         """
@@ -97,16 +278,11 @@ class PaymentGateway:
         Returns:
             tuple: (success: bool, message: str)
         """
-        time.sleep(0.5)
-        
-        if not transaction_id or not transaction_id.startswith("txn_"):
-            return False, "Invalid transaction ID"
-        
-        if amount <= 0:
-            return False, "Invalid refund amount"
-        
-        refund_id = f"refund_{transaction_id}_{int(time.time())}"
-        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+        time.sleep(self.REFUND_DELAY)
+        result = _refund_result(transaction_id, amount)
+        if result[0]:
+            self.status_cache.discard(transaction_id)
+        return result
     
     def verify_payment_status(self, transaction_id: str) -> Dict:
         """
@@ -115,21 +291,82 @@ class PaymentGateway:
         WARNING: This makes an actual HTTP request to external service.
         You should MOCK this method in tests!
         
+        Terminal statuses are answered from the status cache when possible.
+        
         Args:
             transaction_id: Transaction ID to check
             
         Returns:
             dict: Payment status information
         """
-        time.sleep(0.3)
+        cached = self.status_cache.get(transaction_id)
+        if cached is not None:
+            return cached
+        time.sleep(self.STATUS_DELAY)
+        result = _status_result(transaction_id)
+        self.status_cache.put(transaction_id, result)
+        return result
+
+
+class AsyncPaymentGateway:
+    """
+    asyncio version of PaymentGateway with the same contract.
+    
+    Each call awaits the round-trip instead of sleeping, so many payments can
+    be in flight at once on one event loop without tying up a worker each.
+    """
+    
+    PROCESS_DELAY = PaymentGateway.PROCESS_DELAY
+    REFUND_DELAY = PaymentGateway.REFUND_DELAY
+    STATUS_DELAY = PaymentGateway.STATUS_DELAY
+    
+    def __init__(self, api_key: str = "test_key_12345", status_cache: Optional[PaymentStatusCache] = None):
+        """
+        Args:
+            api_key: API key for authentication (default is test key)
+            status_cache: Cache for verify_payment_status (defaults to the shared payment_status_cache)
+        """
+        self.api_key = api_key
+        self.base_url = "https://api.payment-gateway.example.com"
+        self.status_cache = status_cache if status_cache is not None else payment_status_cache
+    
+    async def process_payment(self, patron_id: str, amount: float, description: str = "",
+                              line_items: Optional[List[Dict]] = None) -> Tuple[bool, str, str]:
+        """
+        Process a payment through the external gateway.
         
-        if not transaction_id or not transaction_id.startswith("txn_"):
-            return {"status": "not_found", "message": "Transaction not found"}
+        Returns:
+            tuple: (success: bool, transaction_id: str, message: str)
+        """
+        await asyncio.sleep(self.PROCESS_DELAY)
+        return _charge_result(patron_id, amount, line_items)
+    
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """
+        Refund a previous payment.
         
-        # Simulate status check
-        return {
-            "transaction_id": transaction_id,
-            "status": "completed",
-            "amount": 10.50,
-            "timestamp": time.time()
-        }
\ No newline at end of file
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        await asyncio.sleep(self.REFUND_DELAY)
+        result = _refund_result(transaction_id, amount)
+        if result[0]:
+            self.status_cache.discard(transaction_id)
+        return result
+    
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        """
+        Check the status of a payment transaction.
+        Terminal statuses are answered from the status cache when possible.
+        
+        Returns:
+            dict: Payment status information
+        """
+        cached = self.status_cache.get(transaction_id)
+        if cached is not None:
+            return cached
+        await asyncio.sleep(self.STATUS_DELAY)
+        result = _status_result(transaction_id)
+        self.status_cache.put(transaction_id, result)
+        return result
+
@@ -0,0 +1,198 @@
+"""
+Profiling Module - Opt-in profiles of single requests
+A request is profiled when it is picked by the configured sample rate, or
+when it carries a valid signed X-Profile header. Profiles are written to a
+directory: cProfile output as .prof (pstats) files, the sampling profiler's
+as .folded collapsed stacks for flamegraph tools. A rate limit caps how many
+requests are profiled per minute, so the hooks can stay on in production.
+
+Sign a header with: python -m services.profiling --secret SECRET /api/search
+"""
+
+import argparse
+import cProfile
+import hashlib
+import hmac
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from flask import Flask, g, request
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_DIR = 'profiles'
+PROFILE_MAX_PER_MINUTE = 6
+PROFILE_SAMPLE_INTERVAL = 0.001
+PROFILE_TOKEN_TTL = 300
+PROFILERS = ('cprofile', 'sampling')
+
+
+def sign_profile_request(secret: str, path: str, ttl: int = PROFILE_TOKEN_TTL) -> str:
+    """Return an X-Profile header value that is valid for `path` during the next `ttl` seconds."""
+    expires = int(time.time()) + ttl
+    return f'{expires}.{_signature(secret, expires, path)}'
+
+
+def verify_profile_request(secret: str, path: str, token: str) -> bool:
+    """Check an X-Profile header value made by sign_profile_request()."""
+    expires, _, signature = token.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(secret, int(expires), path))
+
+
+def _signature(secret: str, expires: int, path: str) -> str:
+    return hmac.new(secret.encode(), f'{expires}:{path}'.encode(), hashlib.sha256).hexdigest()
+
+
+class ProfileRateLimiter:
+    """Token bucket allowing at most `per_minute` profiles in any minute."""
+
+    def __init__(self, per_minute: int = PROFILE_MAX_PER_MINUTE, clock=time.monotonic):
+        self.per_minute = per_minute
+        self._clock = clock
+        self._tokens = float(per_minute)
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.denied = 0
+
+    def acquire(self) -> bool:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60)
+            self._updated = now
+            if self._tokens < 1:
+                self.denied += 1
+                return False
+            self._tokens -= 1
+            return True
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread.
+
+    Cheaper than cProfile on deep call trees since the profiled thread is
+    not traced; the cost is one stack walk per interval.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path: str):
+        """Write collapsed stacks, one 'frame;frame;... count' line per distinct stack."""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+_profile_ids = itertools.count(1)
+
+
+def register_profiling(app: Flask):
+    """
+    Add the profiling hooks if the app's config asks for them.
+
+    PROFILE_SAMPLE_RATE is the fraction of requests profiled unasked;
+    PROFILE_SECRET lets callers ask for a profile with a signed X-Profile
+    header. Both are subject to PROFILE_MAX_PER_MINUTE. PROFILER picks
+    'cprofile' or 'sampling'; profiles are written to PROFILE_DIR and the
+    file name is returned in the X-Profile-Id response header. With neither
+    a sample rate nor a secret, no hooks are added.
+    """
+    sample_rate = app.config['PROFILE_SAMPLE_RATE']
+    secret = app.config['PROFILE_SECRET']
+    profiler_kind = app.config['PROFILER']
+    if profiler_kind not in PROFILERS:
+        raise ValueError(f"PROFILER must be one of: {', '.join(PROFILERS)}.")
+    if not sample_rate and not secret:
+        return
+
+    directory = app.config['PROFILE_DIR']
+    limiter = ProfileRateLimiter(app.config['PROFILE_MAX_PER_MINUTE'])
+    app.extensions['profile_rate_limiter'] = limiter
+
+    def wanted() -> bool:
+        token = request.headers.get(PROFILE_HEADER)
+        if secret and token and verify_profile_request(secret, request.path, token):
+            return True
+        return bool(sample_rate) and random.random() < sample_rate
+
+    @app.before_request
+    def start_profile():
+        if not wanted() or not limiter.acquire():
+            return
+        if profiler_kind == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active in this process
+                return
+        else:
+            profiler = SamplingProfiler(threading.get_ident())
+            profiler.start()
+        endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unmatched')
+        extension = 'prof' if profiler_kind == 'cprofile' else 'folded'
+        g.profile = (profiler, f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint}-{os.getpid()}-"
+                               f"{next(_profile_ids)}.{extension}")
+
+    @app.after_request
+    def add_profile_header(response):
+        profile = g.get('profile')
+        if profile is not None:
+            response.headers['X-Profile-Id'] = profile[1]
+        return response
+
+    @app.teardown_request
+    def finish_profile(exc: Optional[BaseException] = None):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profiler, name = profile
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+        os.makedirs(directory, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.dump_stats(os.path.join(directory, name))
+        else:
+            profiler.write(os.path.join(directory, name))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print a signed X-Profile header value for a request path.')
+    parser.add_argument('path', help='request path, e.g. /api/search')
+    parser.add_argument('--secret', required=True, help='the PROFILE_SECRET of the app')
+    parser.add_argument('--ttl', type=int, default=PROFILE_TOKEN_TTL, help='seconds the header stays valid')
+    args = parser.parse_args()
+    print(sign_profile_request(args.secret, args.path, args.ttl))
@@ -0,0 +1,73 @@
+"""
+Query Stats Module - Per-request database instrumentation
+Counts the statements each request runs and how long they take. In debug
+mode the totals are sent back as X-DB-* response headers, and statements
+slower than a threshold are written to the 'library.slow_queries' log as one
+JSON object per line.
+"""
+
+import json
+import logging
+from typing import Optional
+
+from flask import Flask, request
+
+from database import set_query_stats_enabled, start_query_stats, get_query_stats, stop_query_stats
+
+SLOW_QUERY_MS = 100.0
+
+slow_query_log = logging.getLogger('library.slow_queries')
+
+
+def register_query_stats(app: Flask):
+    """
+    Instrument the app's requests according to its config.
+
+    DB_QUERY_STATS turns the instrumentation on (None follows app.debug).
+    DB_SLOW_QUERY_MS is the slow-query log threshold in milliseconds (None
+    turns the log off). When the instrumentation is off no hooks are added
+    and connections are not wrapped, so there is nothing to pay for.
+    """
+    enabled = app.config['DB_QUERY_STATS']
+    if enabled is None:
+        enabled = app.debug
+    set_query_stats_enabled(enabled)
+    if not enabled:
+        return
+
+    threshold = app.config['DB_SLOW_QUERY_MS']
+
+    @app.before_request
+    def begin_query_stats():
+        start_query_stats()
+
+    @app.after_request
+    def add_query_stats_headers(response):
+        stats = get_query_stats()
+        if stats is not None and app.debug:
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time-Ms'] = f'{stats.seconds * 1000:.3f}'
+            slowest = stats.slowest(1)
+            if slowest:
+                response.headers['X-DB-Slowest-Query-Ms'] = f"{slowest[0]['max_ms']:.3f}"
+                response.headers['X-DB-Slowest-Query'] = slowest[0]['sql'][:200]
+        return response
+
+    @app.teardown_request
+    def log_slow_queries(exc: Optional[BaseException] = None):
+        stats = stop_query_stats()
+        if stats is None or threshold is None:
+            return
+        for statement in stats.slowest(len(stats.statements)):
+            if statement['max_ms'] < threshold:
+                break
+            record = {
+                'event': 'slow_query',
+                'method': request.method,
+                'path': request.path,
+                'threshold_ms': threshold,
+                'request_queries': stats.count,
+                'request_db_ms': round(stats.seconds * 1000, 3),
+                **statement,
+            }
+            slow_query_log.warning(json.dumps(record), extra={'slow_query': record})
@@ -0,0 +1,85 @@
+"""
+Reconciliation Module - Bulk payment status checks
+Looks up the gateway status of many transactions concurrently, with a cap on
+requests in flight, and stores the outcomes in the payment_status table.
+
+Run after the day's payments with: python -m services.reconciliation
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from database import get_unreconciled_transactions, record_payment_statuses
+from services.gateway_resilience import ResilientGateway
+from services.payment_service import AsyncPaymentGateway, TERMINAL_STATUSES, call_gateway
+
+RECONCILE_CONCURRENCY = 20
+
+
+async def reconcile_payments_async(transaction_ids: Optional[Iterable[str]] = None, payment_gateway=None,
+                                   concurrency: int = RECONCILE_CONCURRENCY) -> Dict:
+    """
+    Check the gateway status of a batch of transactions and record the results.
+
+    Args:
+        transaction_ids: Transactions to check (defaults to every successful
+            charge whose status is not yet final)
+        payment_gateway: AsyncPaymentGateway, or a blocking PaymentGateway
+            (run on worker threads); defaults to a ResilientGateway around AsyncPaymentGateway()
+        concurrency: Most status requests in flight at once
+
+    Returns:
+        dict: Counts of transactions checked, per status and failed lookups,
+        plus the elapsed time and throughput
+    """
+    if concurrency < 1:
+        raise ValueError("Concurrency must be at least 1.")
+    if transaction_ids is None:
+        transaction_ids = get_unreconciled_transactions()
+    transaction_ids = list(dict.fromkeys(transaction_ids))
+    if payment_gateway is None:
+        payment_gateway = ResilientGateway(AsyncPaymentGateway())
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def check(transaction_id):
+        async with limit:
+            try:
+                return transaction_id, await call_gateway(payment_gateway.verify_payment_status, transaction_id)
+            except Exception:
+                # Left for the next run
+                return transaction_id, None
+
+    began = time.perf_counter()
+    results = await asyncio.gather(*(check(txn) for txn in transaction_ids))
+    elapsed = time.perf_counter() - began
+
+    statuses = [(txn, result.get("status", "unknown"), result.get("status") in TERMINAL_STATUSES)
+                for txn, result in results if result is not None]
+    stored = record_payment_statuses(statuses) if statuses else True
+
+    return {
+        "checked": len(transaction_ids),
+        "errors": len(transaction_ids) - len(statuses),
+        "stored": stored,
+        "by_status": dict(Counter(status for _, status, _ in statuses)),
+        "seconds": round(elapsed, 4),
+        "statuses_per_sec": round(len(statuses) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def reconcile_payments(transaction_ids: Optional[Iterable[str]] = None, payment_gateway=None,
+                       concurrency: int = RECONCILE_CONCURRENCY) -> Dict:
+    """Blocking wrapper around reconcile_payments_async; do not call it from a running event loop."""
+    return asyncio.run(reconcile_payments_async(transaction_ids, payment_gateway, concurrency))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record the gateway status of unreconciled payments.')
+    parser.add_argument('--concurrency', type=int, default=RECONCILE_CONCURRENCY)
+    args = parser.parse_args()
+    print(json.dumps(reconcile_payments(concurrency=args.concurrency), indent=2))
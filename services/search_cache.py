@@ -0,0 +1,148 @@
+"""
+Search Cache Module - LRU cache of catalog search results
+Popular queries are answered from memory. Writes made by this process drop
+only the results they could change: a new book that matches the query, or an
+availability change of a book in the result. Every lookup also checks the
+shared catalog version, and a write by another process clears the cache.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import database
+
+SEARCH_CACHE_SIZE = 1024
+
+# (backend, search_type, lower-cased search_term)
+CacheKey = Tuple[str, str, str]
+
+
+class SearchCache:
+    """
+    Bounded LRU mapping of search keys to result lists, with a reverse index
+    from book ID to the keys whose results contain that book.
+    """
+
+    def __init__(self, maxsize: int = SEARCH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.database: Optional[str] = None
+        self._entries: "OrderedDict[CacheKey, List[Dict]]" = OrderedDict()
+        self._keys_by_book: Dict[int, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a result computed across one is not stored
+        self._generation = 0
+        # (token, version) of the catalog the entries were validated against
+        self._version: Optional[Tuple[str, int]] = None
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _check_database(self):
+        # Called with the lock held; entries belong to one database file
+        if self.database != database.DATABASE:
+            self._reset()
+            self.database = database.DATABASE
+            self._version = None
+
+    def _check_version(self, state: Optional[Tuple[str, int, float]]):
+        # Called with the lock held and the catalog state read before taking it
+        if state is None:
+            return
+        token, version, _ = state
+        if self._version is None or self._version[0] != token:
+            self._reset()
+        elif version <= self._version[1]:
+            # Read before a newer state another thread already checked
+            return
+        elif not database.catalog_writes_are_local(token, self._version[1], version):
+            # Another process wrote; there is no telling which results it changed
+            self._reset()
+            self.invalidations += 1
+        self._version = (token, version)
+
+    def _reset(self):
+        self._entries.clear()
+        self._keys_by_book.clear()
+        self._generation += 1
+
+    def get(self, key: CacheKey) -> Tuple[Optional[List[Dict]], int]:
+        """
+        Look up a key.
+
+        Returns:
+            tuple: (copy of the cached books or None, generation to pass to put())
+        """
+        # One primary-key read; done before taking the lock, which must not wait on the pool
+        state = database.get_catalog_state()
+        with self._lock:
+            self._check_database()
+            self._check_version(state)
+            books = self._entries.get(key)
+            if books is None:
+                self.misses += 1
+                return None, self._generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(book) for book in books], self._generation
+
+    def put(self, key: CacheKey, books: List[Dict], generation: int):
+        """Store a result computed after get() returned `generation`, unless a write happened since."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._check_database()
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = [dict(book) for book in books]
+            for book in books:
+                self._keys_by_book.setdefault(book['id'], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: CacheKey):
+        books = self._entries.pop(key, None)
+        for book in books or ():
+            keys = self._keys_by_book.get(book['id'])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_book[book['id']]
+
+    def book_changed(self, book_id: int):
+        """Drop the results that contain a book whose availability changed."""
+        with self._lock:
+            self._generation += 1
+            for key in list(self._keys_by_book.get(book_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def book_added(self, book: Dict):
+        """Drop the results a new book could appear in."""
+        with self._lock:
+            self._generation += 1
+            fields = {field: str(book[field]).lower() for field in ('title', 'author', 'isbn')}
+            # A trigram result gains the book exactly when the term is a substring of
+            # the field. Full-text matching is per word, ignores word order and
+            # diacritics, so any full-text result may gain it.
+            stale = [key for key in self._entries if key[0] == 'fts' or key[2] in fields[key[1]]]
+            for key in stale:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else None}
+
+
+# Process-wide cache used by search_books_in_catalog()
+search_cache = SearchCache()
+database.add_book_listener(search_cache.book_added)
+database.add_availability_listener(search_cache.book_changed)
@@ -0,0 +1,170 @@
+"""
+Search Index Module - In-memory trigram index for catalog search
+Answers case-insensitive substring searches on title, author and ISBN
+without scanning the books table. Books inserted by other processes are
+picked up before each search by indexing the IDs above the highest one
+already indexed.
+"""
+
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set
+
+import database
+
+FIELDS = ('title', 'author', 'isbn')
+
+
+def trigrams(text: str) -> Set[str]:
+    """Return the distinct 3-character substrings of the lower-cased text."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _contains(postings: array, book_id: int) -> bool:
+    i = bisect_left(postings, book_id)
+    return i < len(postings) and postings[i] == book_id
+
+
+class TrigramIndex:
+    """
+    Trigram posting lists for each searchable book field.
+
+    Every trigram maps to a sorted array of book IDs, so a substring query is
+    the intersection of the posting lists of its trigrams. Candidates are then
+    checked against the real rows, because sharing all trigrams does not
+    guarantee the whole substring is present.
+    """
+
+    def __init__(self):
+        self.database: Optional[str] = None
+        self._postings: Dict[str, Dict[str, array]] = {field: {} for field in FIELDS}
+        self._book_count = 0
+        self._max_id = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def build(self, books: Iterable[Dict]):
+        """Replace the index contents with the given books."""
+        postings: Dict[str, Dict[str, array]] = {field: {} for field in FIELDS}
+        count = max_id = 0
+        for book in sorted(books, key=lambda b: b['id']):
+            max_id = book['id']
+            for field in FIELDS:
+                field_postings = postings[field]
+                for gram in trigrams(book[field]):
+                    if gram not in field_postings:
+                        field_postings[gram] = array('I')
+                    field_postings[gram].append(book['id'])
+            count += 1
+        with self._lock:
+            self._postings = postings
+            self._book_count = count
+            self._max_id = max_id
+            self.database = database.DATABASE
+
+    def add(self, book: Dict):
+        """Index one new book; called after insert_book() commits."""
+        if self.database != database.DATABASE:
+            return
+        book_id = book['id']
+        added = False
+        with self._lock:
+            for field in FIELDS:
+                field_postings = self._postings[field]
+                for gram in trigrams(book[field]):
+                    postings = field_postings.get(gram)
+                    if postings is None:
+                        field_postings[gram] = array('I', [book_id])
+                    elif not postings or postings[-1] < book_id:
+                        # IDs are handed out in increasing order, so appending keeps the list sorted
+                        postings.append(book_id)
+                    elif not _contains(postings, book_id):
+                        postings.insert(bisect_left(postings, book_id), book_id)
+                    else:
+                        continue
+                    added = True
+            # The listener and refresh() may both deliver the same book
+            if added:
+                self._book_count += 1
+            self._max_id = max(self._max_id, book_id)
+
+    def refresh(self) -> int:
+        """
+        Index books inserted since the index last saw one, including those
+        inserted by other processes. Costs one MAX(id) read when nothing is new.
+
+        Returns:
+            int: Number of books read from the database
+        """
+        if not self.ready or database.get_max_book_id() <= self._max_id:
+            return 0
+        with self._refresh_lock:
+            books = database.get_books_after(self._max_id)
+            for book in books:
+                self.add(book)
+        return len(books)
+
+    @property
+    def ready(self) -> bool:
+        """True if the index was built for the database currently in use."""
+        return self.database is not None and self.database == database.DATABASE
+
+    def candidates(self, search_term: str, field: str) -> List[int]:
+        """
+        Return the IDs of books whose field contains every trigram of the term.
+
+        Args:
+            search_term: Search text of at least 3 characters
+            field: 'title', 'author' or 'isbn'
+        """
+        field_postings = self._postings[field]
+        lists = []
+        for gram in trigrams(search_term):
+            postings = field_postings.get(gram)
+            if postings is None:
+                return []
+            lists.append(postings)
+        lists.sort(key=len)
+        smallest, rest = lists[0], lists[1:]
+        return [book_id for book_id in smallest if all(_contains(p, book_id) for p in rest)]
+
+    def search(self, search_term: str, field: str) -> List[Dict]:
+        """Return books whose field contains the term (case-insensitive), sorted by title."""
+        term = search_term.lower()
+        if len(term) < 3:
+            # Too short to have a trigram; let SQLite do the scan
+            return database.search_books_substring(term, field)
+        self.refresh()
+        books = database.get_books_by_ids(self.candidates(term, field))
+        found = [book for book in books if term in book[field].lower()]
+        found.sort(key=lambda book: (book['title'], book['id']))
+        return found
+
+    def memory_usage(self) -> Dict:
+        """Approximate memory held by the index, in bytes."""
+        with self._lock:
+            report = {'books': self._book_count, 'trigrams': 0, 'postings': 0,
+                      'posting_bytes': 0, 'overhead_bytes': 0}
+            for field_postings in self._postings.values():
+                report['trigrams'] += len(field_postings)
+                report['overhead_bytes'] += sys.getsizeof(field_postings)
+                for gram, postings in field_postings.items():
+                    report['postings'] += len(postings)
+                    report['posting_bytes'] += postings.buffer_info()[1] * postings.itemsize
+                    report['overhead_bytes'] += sys.getsizeof(gram) + sys.getsizeof(array('I'))
+        report['total_bytes'] = report['posting_bytes'] + report['overhead_bytes']
+        return report
+
+
+# Process-wide index used by search_books_in_catalog()
+catalog_index = TrigramIndex()
+
+
+def build_search_index() -> TrigramIndex:
+    """Build the catalog index from the books table and keep it updated on inserts."""
+    catalog_index.build(database.get_all_books())
+    database.add_book_listener(catalog_index.add)
+    return catalog_index
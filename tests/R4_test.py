@@ -1,11 +1,13 @@
 
 import pytest
 from services.library_service import (
-    return_book_by_patron
+    borrow_book_by_patron, return_book_by_patron
 )
 
 def test_book_return_valid():
       """book return with valid input"""
+      # Each test starts from the sample data, so borrow the book here
+      assert borrow_book_by_patron("123456", 2)[0]
       success, message = return_book_by_patron("123456", 2)
       assert success == True
       assert "late fee is" in message.lower()
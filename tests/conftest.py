@@ -1,4 +1,89 @@
 import sys
 import os
+import shutil
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import database
+from services.payment_service import PaymentGateway, AsyncPaymentGateway, PaymentStatusCache
+
+GATEWAY_DELAYS = ("PROCESS_DELAY", "REFUND_DELAY", "STATUS_DELAY")
+
+
+@pytest.fixture(scope="session")
+def db_templates(tmp_path_factory):
+    """
+    Build an empty and a sample-data database once per session (once per
+    worker under pytest-xdist); tests get file copies instead of running
+    the schema and sample inserts themselves.
+    """
+    directory = tmp_path_factory.mktemp("templates")
+    original = database.DATABASE
+    templates = {}
+    try:
+        for name, sample_data in (("empty", False), ("sample", True)):
+            database.set_database_path(str(directory / f"{name}.db"))
+            database.init_database()
+            if sample_data:
+                database.add_sample_data()
+            # Closing the last connection folds the WAL into the file, so one copy is complete
+            database.close_pool()
+            templates[name] = database.DATABASE
+    finally:
+        database.set_database_path(original)
+    return templates
+
+
+def _clone(template, path, monkeypatch):
+    shutil.copyfile(template, path)
+    monkeypatch.setattr(database, "DATABASE", path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def library_db(db_templates, tmp_path, monkeypatch):
+    """
+    Every test gets its own copy of the sample database instead of ./library.db.
+    Pool settings changed by configure_pool() are put back afterwards, so they
+    cannot leak into later tests of the same (xdist) worker.
+    """
+    monkeypatch.setattr(database, "_pool_settings", dict(database._pool_settings))
+    yield _clone(db_templates["sample"], str(tmp_path / "sample.db"), monkeypatch)
+    database.close_pool()
+
+
+@pytest.fixture(autouse=True)
+def stub_gateway(monkeypatch):
+    """
+    Take the simulated latency out of the payment gateways for every test;
+    tests that need latency set it on their own instance. The fixture value
+    is a zero-latency async gateway with a status cache of its own.
+    """
+    for gateway_class in (PaymentGateway, AsyncPaymentGateway):
+        for delay in GATEWAY_DELAYS:
+            monkeypatch.setattr(gateway_class, delay, 0)
+    return AsyncPaymentGateway(status_cache=PaymentStatusCache())
+
+
+@pytest.fixture
+def temp_db(db_templates, tmp_path, monkeypatch):
+    """Point the database helpers at a fresh, empty database file."""
+    yield _clone(db_templates["empty"], str(tmp_path / "library.db"), monkeypatch)
+    database.close_pool()
+
+
+@pytest.fixture
+def client(library_db):
+    """
+    Flask test client for an app backed by a fresh database with the sample books.
+    The background payment workers are not started; tests that need them start
+    their own queue (see tests/test_payment_jobs.py).
+    """
+    from app import create_app
+    from services.search_index import catalog_index
+
+    app = create_app({"TESTING": True, "SAMPLE_DATA": True, "PAYMENT_WORKERS": 0})
+    yield app.test_client()
+    database.remove_book_listener(catalog_index.add)
+    database.close_pool()
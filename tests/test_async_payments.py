@@ -0,0 +1,89 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from services.library_service import (
+    pay_late_fees, pay_late_fees_async, refund_late_fee_payment, refund_late_fee_payment_async
+)
+from services.payment_service import AsyncPaymentGateway, PaymentGateway
+
+
+def fast_gateway(delay=0.0):
+    gateway = AsyncPaymentGateway()
+    gateway.PROCESS_DELAY = gateway.REFUND_DELAY = gateway.STATUS_DELAY = delay
+    return gateway
+
+
+@pytest.fixture
+def stub_db_fee(mocker):
+    mocker.patch(
+        "services.library_service.calculate_late_fee_for_book",
+        return_value={"fee_amount": 4.50}
+    )
+    mocker.patch(
+        "services.library_service.get_book_by_id",
+        return_value={"id": 1, "title": "Percy Jackson"}
+    )
+
+
+@pytest.mark.parametrize("patron_id,amount", [("123456", 10.5), ("123456", 0), ("123456", 5000), ("12", 5)])
+def test_async_gateway_matches_sync_contract(patron_id, amount):
+    sync = PaymentGateway()
+    sync.PROCESS_DELAY = 0
+    expected = sync.process_payment(patron_id, amount)
+    actual = asyncio.run(fast_gateway().process_payment(patron_id, amount))
+    assert actual[0] == expected[0] and actual[2] == expected[2]
+
+
+def test_async_gateway_refund_and_status():
+    gateway = fast_gateway()
+    assert asyncio.run(gateway.refund_payment("txn_1", 3.0))[0]
+    assert not asyncio.run(gateway.refund_payment("bad", 3.0))[0]
+    assert asyncio.run(gateway.verify_payment_status("txn_1"))["status"] == "completed"
+
+
+def test_charges_in_the_same_second_get_distinct_transaction_ids():
+    gateway = PaymentGateway()
+    first = gateway.process_payment("123456", 2.0)[1]
+    second = asyncio.run(fast_gateway().process_payment("123456", 2.0))[1]
+    assert first.startswith("txn_123456_") and second.startswith("txn_123456_")
+    assert first != second
+
+
+def test_pay_async_awaits_async_gateway(stub_db_fee):
+    gateway = AsyncMock(spec=AsyncPaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_9", "ok")
+    success, msg, txn = asyncio.run(pay_late_fees_async("123456", 1, gateway))
+    gateway.process_payment.assert_awaited_once_with(
+        patron_id="123456", amount=4.50, description="Late fees for 'Percy Jackson'"
+    )
+    assert success and txn == "txn_9"
+
+
+def test_sync_wrapper_accepts_async_gateway(stub_db_fee):
+    success, msg, txn = pay_late_fees("123456", 1, fast_gateway())
+    assert success and txn.startswith("txn_123456")
+    assert refund_late_fee_payment(txn, 4.50, fast_gateway())[0]
+
+
+def test_async_refund_with_blocking_gateway():
+    gateway = Mock(spec=PaymentGateway)
+    gateway.refund_payment.return_value = (False, "declined")
+    success, msg = asyncio.run(refund_late_fee_payment_async("txn_1", 2.0, gateway))
+    assert not success and "declined" in msg
+
+
+def test_concurrent_payments_overlap(stub_db_fee):
+    gateway = fast_gateway(delay=0.2)
+
+    async def burst():
+        # Distinct keys: without one, identical calls would be deduplicated as a double submit
+        return await asyncio.gather(*(pay_late_fees_async("123456", 1, gateway, idempotency_key=f"burst-{i}")
+                                      for i in range(10)))
+
+    began = time.perf_counter()
+    results = asyncio.run(burst())
+    elapsed = time.perf_counter() - began
+    assert all(success for success, _, _ in results)
+    assert elapsed < 1.0  # ten sequential calls would take 2 seconds
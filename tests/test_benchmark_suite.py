@@ -0,0 +1,47 @@
+import database
+from benchmarks import datagen, suite
+
+
+def _snapshot():
+    conn = database.get_db_connection()
+    books = conn.execute("SELECT * FROM books ORDER BY id").fetchall()
+    loans = conn.execute("SELECT * FROM borrow_records ORDER BY id").fetchall()
+    conn.close()
+    return [tuple(b) for b in books], [tuple(l) for l in loans]
+
+
+def test_generator_is_consistent(temp_db):
+    counts = datagen.generate(books=200, patrons=30, loans=1500, open_fraction=0.2, seed=7)
+    books, loans = _snapshot()
+    assert len(books) == 200 and len(loans) == 1500
+    assert counts["open_loans"] > 0
+
+    open_by_book, open_by_patron = {}, {}
+    for _, patron, book_id, _, _, returned in loans:
+        if returned is None:
+            open_by_book[book_id] = open_by_book.get(book_id, 0) + 1
+            open_by_patron[patron] = open_by_patron.get(patron, 0) + 1
+    assert max(open_by_patron.values()) <= datagen.MAX_OPEN_LOANS
+    for book_id, _, _, _, total, available in books:
+        assert available == total - open_by_book.get(book_id, 0) >= 0
+
+
+def test_generator_is_seeded(tmp_path, monkeypatch):
+    from datetime import datetime
+    now = datetime(2025, 1, 1)
+    snapshots = []
+    for run in range(2):
+        monkeypatch.setattr(database, "DATABASE", str(tmp_path / f"run{run}.db"))
+        database.init_database()
+        datagen.generate(books=50, patrons=10, loans=200, seed=11, now=now)
+        snapshots.append(_snapshot())
+    database.close_pool()
+    assert snapshots[0] == snapshots[1]
+
+
+def test_suite_reports_every_operation(monkeypatch):
+    # run_size() repoints DATABASE at its own temporary file; restore it afterwards
+    monkeypatch.setattr(database, "DATABASE", database.DATABASE)
+    results = suite.run_size(size=100, ops=5, seed=1)
+    assert {r["operation"] for r in results} == set(suite.OPERATIONS)
+    assert all(r["calls"] > 0 and r["p95_ms"] >= r["p50_ms"] for r in results)
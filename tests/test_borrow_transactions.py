@@ -0,0 +1,53 @@
+import threading
+from datetime import datetime
+
+import database
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+
+def _add_book(copies):
+    database.insert_book("Dune", "Frank Herbert", "1111111111111", copies, copies)
+    return database.get_book_by_isbn("1111111111111")["id"]
+
+
+def test_concurrent_borrows_never_oversell(temp_db):
+    book_id = _add_book(5)
+    results = []
+    start = threading.Barrier(20)
+
+    def borrow(n):
+        start.wait()
+        results.append(borrow_book_by_patron(f"{n:06d}", book_id))
+
+    threads = [threading.Thread(target=borrow, args=(n,)) for n in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for success, _ in results if success) == 5
+    assert all("not available" in msg.lower() for success, msg in results if not success)
+    assert database.get_book_by_id(book_id)["available_copies"] == 0
+    conn = database.get_db_connection()
+    loans = conn.execute("SELECT COUNT(*) FROM borrow_records WHERE book_id = ?", (book_id,)).fetchone()[0]
+    conn.close()
+    assert loans == 5
+
+
+def test_return_closes_loan_and_restores_copy(temp_db):
+    book_id = _add_book(1)
+    assert borrow_book_by_patron("123456", book_id)[0]
+
+    success, message = return_book_by_patron("123456", book_id)
+    assert success
+    assert database.get_book_by_id(book_id)["available_copies"] == 1
+    assert database.get_patron_borrow_count("123456") == 0
+
+    success, message = return_book_by_patron("123456", book_id)
+    assert not success
+    assert "not borrowed" in message.lower()
+
+
+def test_borrow_transaction_reports_unknown_book(temp_db):
+    outcome = database.borrow_book_transaction("123456", 999, datetime.now(), datetime.now())
+    assert outcome == "unavailable"
@@ -0,0 +1,92 @@
+import io
+import json
+
+import database
+from services.catalog_import import import_books, import_books_file, read_rows
+from services.search_index import TrigramIndex
+
+CSV = (
+    "title,author,isbn,total_copies\n"
+    "Dune,Frank Herbert,9780000000001,3\n"
+    ",No Title,9780000000002,1\n"
+    "Emma,Jane Austen,978000000000,2\n"
+    "Emma,Jane Austen,9780000000003,zero\n"
+    "Dune Again,Frank Herbert,9780000000001,1\n"
+    "Ulysses,James Joyce,9780000000004,1\n"
+)
+
+
+def test_csv_import_validates_and_dedupes(temp_db):
+    report = import_books(read_rows(io.StringIO(CSV), "csv"), chunk_size=2)
+
+    assert report["rows"] == 6 and report["imported"] == 2 and report["rejected"] == 4
+    assert report["errors"] == [
+        {"row": 3, "error": "Title is required."},
+        {"row": 4, "error": "ISBN must be exactly 13 digits."},
+        {"row": 5, "error": "Total copies must be a positive integer."},
+        {"row": 6, "error": "A book with this ISBN already exists."},
+    ]
+    dune = database.get_book_by_isbn("9780000000001")
+    assert dune["title"] == "Dune" and dune["available_copies"] == 3
+
+
+def test_existing_isbns_are_rejected(temp_db):
+    database.insert_book("Old", "Author", "9780000000001", 1, 1)
+    report = import_books(read_rows(io.StringIO(CSV), "csv"))
+    assert report["imported"] == 1
+    assert {"row": 2, "error": "A book with this ISBN already exists."} in report["errors"]
+
+
+def test_jsonl_file_import(temp_db, tmp_path):
+    path = tmp_path / "books.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"title": "Beloved", "author": "Toni Morrison", "isbn": "9780000000010", "total_copies": 2}),
+        "{not json",
+        json.dumps(["a", "list"]),
+        json.dumps({"title": "Flag", "author": "A", "isbn": "9780000000011", "total_copies": True}),
+        "",
+    ]))
+    report = import_books_file(str(path))
+    assert report["imported"] == 1
+    assert [e["row"] for e in report["errors"]] == [2, 3, 4]
+
+
+def test_imported_books_reach_the_listeners(temp_db):
+    index = TrigramIndex()
+    index.build([])
+    database.add_book_listener(index.add)
+    try:
+        import_books(read_rows(io.StringIO(CSV), "csv"))
+    finally:
+        database.remove_book_listener(index.add)
+    assert [book["title"] for book in index.search("joyce", "author")] == ["Ulysses"]
+
+
+def test_same_rules_as_add_book_to_catalog(temp_db):
+    from services.library_service import add_book_to_catalog
+
+    rows = [{"title": "Padded", "author": "A", "isbn": " 9780000000001", "total_copies": 1}]
+    report = import_books(iter([(1, rows[0], None)]))
+    success, message = add_book_to_catalog("Padded", "A", " 9780000000001", 1)
+    assert report["imported"] == 0 and not success
+    assert report["errors"][0]["error"] == message
+
+
+def test_missing_columns(temp_db):
+    report = import_books(read_rows(io.StringIO("title,author\nA,B\n"), "csv"))
+    assert report["imported"] == 0
+    assert "isbn" in report["errors"][0]["error"]
+
+
+def test_bulk_endpoint(client):
+    response = client.post("/api/books/bulk", data=CSV, content_type="text/csv")
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 2
+    assert client.get("/api/search?q=ulysses").get_json()["count"] == 1
+
+    lines = json.dumps({"title": "Middlemarch", "author": "George Eliot", "isbn": "9780000000020",
+                        "total_copies": 1})
+    response = client.post("/api/books/bulk?format=jsonl", data=lines)
+    assert response.get_json()["imported"] == 1
+
+    assert client.post("/api/books/bulk", data=CSV, content_type="text/plain").status_code == 400
@@ -0,0 +1,69 @@
+import pytest
+import database
+from services.library_service import get_catalog_page, decode_catalog_cursor
+
+
+@pytest.fixture
+def many_books(temp_db):
+    # Duplicate titles make sure the id tie-breaker keeps pages stable
+    for i in range(25):
+        database.insert_book(f"Title {i % 10:02d}", "Author", f"{i:013d}", 1, 1)
+
+
+def walk(limit):
+    pages, cursor = [], None
+    while True:
+        page = get_catalog_page(cursor, limit)
+        pages.append(page["books"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_catalog_in_order(many_books):
+    pages = walk(7)
+    assert [len(p) for p in pages] == [7, 7, 7, 4]
+    seen = [(b["title"], b["id"]) for page in pages for b in page]
+    assert seen == sorted(seen)
+    assert [b["id"] for b in database.get_all_books()] == [i for _, i in seen]
+
+
+def test_exact_multiple_has_no_empty_trailing_page(many_books):
+    assert [len(p) for p in walk(5)] == [5, 5, 5, 5, 5]
+
+
+def test_invalid_arguments(many_books):
+    with pytest.raises(ValueError):
+        get_catalog_page("not-a-cursor", 5)
+    with pytest.raises(ValueError):
+        get_catalog_page(None, 0)
+
+
+def test_cursor_round_trip():
+    from services.library_service import encode_catalog_cursor
+    assert decode_catalog_cursor(encode_catalog_cursor({"title": "Ça & Co", "id": 4})) == ("Ça & Co", 4)
+
+
+def test_api_books_pages(client):
+    first = client.get("/api/books?limit=2").get_json()
+    assert first["count"] == 2 and first["next"]
+    second = client.get(f"/api/books?limit=2&after={first['next']}").get_json()
+    assert second["count"] == 1 and second["next"] is None
+    titles = [b["title"] for b in first["books"] + second["books"]]
+    assert titles == sorted(titles)
+
+
+def test_api_books_rejects_bad_input(client):
+    assert client.get("/api/books?limit=abc").status_code == 400
+    assert client.get("/api/books?limit=1000").status_code == 400
+    assert client.get("/api/books?after=%%%").status_code == 400
+
+
+def test_catalog_page_links(client, monkeypatch):
+    monkeypatch.setattr("routes.catalog_routes.CATALOG_PAGE_SIZE", 2)
+    html = client.get("/catalog").get_data(as_text=True)
+    assert "Next Page" in html and "First Page" not in html
+    cursor = client.get("/api/books?limit=2").get_json()["next"]
+    html = client.get(f"/catalog?after={cursor}").get_data(as_text=True)
+    assert "First Page" in html and "Next Page" not in html
+    assert "Invalid page cursor" in client.get("/catalog?after=bad").get_data(as_text=True)
@@ -0,0 +1,78 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+import database
+
+URLS = ["/catalog", "/search?q=great&type=title", "/api/search?q=great&type=title"]
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_unchanged_catalog_answers_304_with_only_the_version_read(client, mocker, url):
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers["ETag"]
+
+    statements = []
+    original = database.get_db_connection
+
+    def traced():
+        conn = original()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    mocker.patch("database.get_db_connection", side_effect=traced)
+    again = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+    assert again.data == b""
+    assert statements == ["SELECT token, version, modified_at FROM catalog_version WHERE id = 1"]
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_writes_change_the_etag(client, url):
+    etag = client.get(url).headers["ETag"]
+
+    database.insert_book("Great Expectations", "Charles Dickens", "9780141439563", 1, 1)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_borrow_and_return_change_the_version(temp_db):
+    database.insert_book("Book", "Author", "1234567890123", 1, 1)
+    before = database.get_catalog_version()[0]
+    database.borrow_book_transaction("123456", 1, datetime.now(), datetime.now())
+    after_borrow = database.get_catalog_version()[0]
+    database.borrow_book_transaction("654321", 1, datetime.now(), datetime.now())  # unavailable, no write
+    assert database.get_catalog_version()[0] == after_borrow != before
+
+    database.return_book_transaction("123456", 1, datetime.now())
+    assert database.get_catalog_version()[0] != after_borrow
+
+
+def test_writes_by_other_processes_change_the_etag(client, library_db):
+    etag = client.get("/catalog").headers["ETag"]
+
+    conn = sqlite3.connect(library_db)
+    conn.execute("UPDATE books SET available_copies = available_copies - 1 WHERE id = 1")
+    conn.commit()
+    conn.close()
+    response = client.get("/catalog", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_if_modified_since(client):
+    first = client.get("/catalog")
+    response = client.get("/catalog", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert response.status_code == 304
+
+
+def test_pending_flash_is_not_swallowed(client):
+    etag = client.get("/catalog").headers["ETag"]
+    with client.session_transaction() as session:
+        session["_flashes"] = [("error", "This book is currently not available.")]
+
+    response = client.get("/catalog", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"currently not available" in response.data
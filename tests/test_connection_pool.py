@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+import database
+from database import ConnectionPool
+
+
+@pytest.fixture
+def pool_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "pool.db"))
+    database.configure_pool(max_size=2, timeout=0.2)
+    database.init_database()
+    yield database.get_pool()
+    database.close_pool()
+
+
+def test_helpers_reuse_one_connection(pool_db):
+    database.insert_book("Dune", "Frank Herbert", "1111111111111", 2, 2)
+    book = database.get_book_by_isbn("1111111111111")
+    database.get_book_by_id(book["id"])
+    database.get_patron_borrow_count("123456")
+    stats = pool_db.stats()
+    assert stats["created"] == 1
+    assert stats["in_use"] == 0
+
+
+def test_request_scope_pins_connection(pool_db):
+    database.begin_connection_scope()
+    first = database.get_db_connection()
+    first.close()
+    second = database.get_db_connection()
+    second.close()
+    assert first is second
+    assert pool_db.stats()["in_use"] == 1
+    database.end_connection_scope()
+    assert pool_db.stats()["in_use"] == 0
+
+
+def test_failed_write_is_rolled_back(pool_db):
+    assert database.insert_book("Dune", "Frank Herbert", "1111111111111", 2, 2)
+    assert not database.insert_book("Dune", "Frank Herbert", "1111111111111", 2, 2)
+    conn = database.get_db_connection()
+    assert not conn.in_transaction
+    conn.close()
+
+
+def test_pool_is_bounded(pool_db):
+    ready = threading.Barrier(3)
+    done = threading.Event()
+
+    def hold():
+        conn = database.get_db_connection()
+        try:
+            ready.wait()
+            done.wait()
+        finally:
+            conn.close()
+
+    workers = [threading.Thread(target=hold) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    ready.wait()
+    with pytest.raises(Exception, match="Timed out"):
+        database.get_db_connection()
+    done.set()
+    for worker in workers:
+        worker.join()
+    assert pool_db.stats()["open"] == 2
+
+
+def test_broken_connection_is_replaced(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "health.db"), max_size=1, health_check_interval=0)
+    conn = pool.checkout()
+    conn.close()
+    conn.really_close()
+    replacement = pool.checkout()
+    assert replacement is not conn
+    assert replacement.execute("SELECT 1").fetchone()[0] == 1
+    replacement.close()
+    assert pool.stats()["recycled"] == 1
+    pool.close()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+import database
+from services import fee_sweep
+from services.library_service import compute_late_fee
+
+AS_OF = datetime(2025, 6, 1, 12, 0, 0)
+OFFSETS = [timedelta(days=d, hours=h) for d in range(-3, 40) for h in (0, 5, 23)]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(fee_sweep, "np", None)
+    return request.param
+
+
+def test_compute_fees_matches_single_loan_rules(engine):
+    due_dates = [(AS_OF - offset).isoformat() for offset in OFFSETS]
+    days, fees = fee_sweep.compute_fees(due_dates, AS_OF)
+    expected = [compute_late_fee(AS_OF - offset, AS_OF) for offset in OFFSETS]
+    assert [float(f) for f in fees] == [fee for fee, _ in expected]
+    assert [int(d) for d in days] == [d for _, d in expected]
+
+
+def test_sweep_aggregates(temp_db, engine):
+    database.insert_book("A", "Author", "0000000000001", 5, 5)
+    database.insert_book("B", "Author", "0000000000002", 5, 5)
+    loans = [
+        ("111111", 1, 3),    # $1.50
+        ("111111", 2, 10),   # $6.50
+        ("222222", 1, 30),   # capped $15.00
+        ("333333", 2, -2),   # not due yet
+    ]
+    for patron, book, days_late in loans:
+        due = AS_OF - timedelta(days=days_late, hours=1)
+        database.insert_borrow_record(patron, book, due - timedelta(days=14), due)
+    database.insert_borrow_record("444444", 2, AS_OF - timedelta(days=90), AS_OF - timedelta(days=76))
+    database.update_borrow_record_return_date("444444", 2, AS_OF - timedelta(days=70))
+
+    report = fee_sweep.sweep_late_fees(AS_OF, chunk_size=2)
+    assert report["open_loans"] == 4
+    assert report["overdue_loans"] == 3
+    assert report["total_fees"] == 23.0
+    assert report["by_patron"] == {"111111": 8.0, "222222": 15.0}
+    assert report["by_book"] == {1: 16.5, 2: 6.5}
+
+
+def test_sweep_on_empty_library(temp_db, engine):
+    report = fee_sweep.sweep_late_fees(AS_OF)
+    assert report["open_loans"] == 0 and report["total_fees"] == 0
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+from services import gateway_resilience
+from services.gateway_resilience import (
+    CircuitBreaker, GatewayTimeoutError, GatewayUnavailableError, ResilientGateway, RetryBudget
+)
+from services.library_service import pay_late_fees, pay_late_fees_async
+from services.payment_service import PaymentGateway
+
+
+class FaultyGateway:
+    """Async stub gateway that fails on demand: 'ok', 'hang', 'refuse' or 'error'."""
+
+    def __init__(self, *modes):
+        self.modes = list(modes)
+        self.calls = 0
+
+    async def _respond(self, result):
+        mode = self.modes[min(self.calls, len(self.modes) - 1)]
+        self.calls += 1
+        if mode == "hang":
+            await asyncio.sleep(60)
+        if mode == "refuse":
+            raise ConnectionError("connection refused")
+        if mode == "error":
+            raise RuntimeError("internal error")
+        return result
+
+    async def process_payment(self, patron_id, amount, description="", line_items=None):
+        return await self._respond((True, f"txn_{patron_id}_1", "ok"))
+
+    async def refund_payment(self, transaction_id, amount):
+        return await self._respond((True, "refunded"))
+
+    async def verify_payment_status(self, transaction_id):
+        return await self._respond({"transaction_id": transaction_id, "status": "completed"})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def resilient(stub, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker())
+    kwargs.setdefault("retry_budget", RetryBudget())
+    kwargs.setdefault("backoff", 0)
+    return ResilientGateway(stub, **kwargs)
+
+
+def test_timeout_bounds_a_hanging_call():
+    gateway = resilient(FaultyGateway("hang"), timeout=0.05, max_attempts=1)
+    began = time.perf_counter()
+    with pytest.raises(GatewayTimeoutError):
+        asyncio.run(gateway.verify_payment_status("txn_1"))
+    assert time.perf_counter() - began < 1
+
+
+def test_status_lookups_are_retried():
+    stub = FaultyGateway("error", "hang", "ok")
+    gateway = resilient(stub, timeout=0.05)
+    assert asyncio.run(gateway.verify_payment_status("txn_1"))["status"] == "completed"
+    assert stub.calls == 3
+
+
+def test_charges_are_only_retried_when_never_sent():
+    stub = FaultyGateway("refuse", "ok")
+    assert asyncio.run(resilient(stub).process_payment("123456", 5.0))[0]
+    assert stub.calls == 2
+
+    stub = FaultyGateway("hang", "ok")
+    with pytest.raises(GatewayTimeoutError):
+        asyncio.run(resilient(stub, timeout=0.05).process_payment("123456", 5.0))
+    assert stub.calls == 1
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0, initial=1)
+    stub = FaultyGateway("error")
+    gateway = resilient(stub, retry_budget=budget, breaker=CircuitBreaker(failure_threshold=100))
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            asyncio.run(gateway.verify_payment_status("txn_1"))
+    assert stub.calls == 4
+    assert budget.stats()["retries"] == 1 and budget.stats()["denied"] == 3
+
+
+def test_breaker_opens_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    stub = FaultyGateway("refuse")
+    gateway = resilient(stub, breaker=breaker, max_attempts=1)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            asyncio.run(gateway.process_payment("123456", 5.0))
+    assert breaker.state == "open"
+
+    with pytest.raises(GatewayUnavailableError):
+        asyncio.run(gateway.process_payment("123456", 5.0))
+    assert stub.calls == 3
+    assert breaker.stats()["rejected_calls"] == 1
+
+
+def test_breaker_half_open_trial():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_timeout_bounds_a_blocking_gateway(temp_db, mocker):
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+    mocker.patch("services.library_service.get_book_by_id", return_value={"id": 1, "title": "Book"})
+    release = threading.Event()
+    blocking = Mock(spec=PaymentGateway)
+    blocking.process_payment.side_effect = lambda **kwargs: release.wait(5)
+    gateway = resilient(blocking, timeout=0.1, max_attempts=1)
+
+    began = time.perf_counter()
+    success, message, _ = pay_late_fees("123456", 1, gateway)
+    elapsed = time.perf_counter() - began
+    release.set()
+    assert not success and "did not respond" in message
+    assert elapsed < 1
+
+
+def test_cancelled_trial_does_not_wedge_the_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    gateway = resilient(FaultyGateway("hang", "ok"), breaker=breaker, timeout=60)
+
+    async def cancel_trial():
+        trial = asyncio.create_task(gateway.verify_payment_status("txn_1"))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(cancel_trial())
+    assert asyncio.run(gateway.verify_payment_status("txn_1"))["status"] == "completed"
+    assert breaker.state == "closed"
+
+
+def test_outage_keeps_payment_latency_bounded(temp_db, mocker):
+    """During an outage each request waits at most one timeout, then the breaker answers at once."""
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={"fee_amount": 5.0})
+    mocker.patch("services.library_service.get_book_by_id", return_value={"id": 1, "title": "Book"})
+    gateway = resilient(FaultyGateway("hang"), timeout=0.05, breaker=CircuitBreaker(failure_threshold=3))
+
+    latencies = []
+    for _ in range(10):
+        began = time.perf_counter()
+        success, message, _ = asyncio.run(pay_late_fees_async("123456", 1, gateway))
+        latencies.append(time.perf_counter() - began)
+        assert not success
+    assert max(latencies) < 0.5
+    assert "unavailable" in message
+    assert gateway.gateway.calls == 3
+
+
+def test_health_endpoint_reports_breaker_state(client, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1)
+    monkeypatch.setattr(gateway_resilience, "gateway_breaker", breaker)
+    assert client.get("/api/health/payment_gateway").get_json()["circuit_breaker"]["state"] == "closed"
+
+    breaker.record_failure()
+    response = client.get("/api/health/payment_gateway")
+    assert response.status_code == 503
+    assert response.get_json()["circuit_breaker"]["state"] == "open"
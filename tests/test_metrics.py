@@ -0,0 +1,118 @@
+import asyncio
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+import database
+from services.metrics import MetricsRegistry, metrics, http_request_duration
+from services.gateway_resilience import ResilientGateway
+from services.payment_service import AsyncPaymentGateway, call_gateway
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Another worker: records one request into the shared directory and exits
+WORKER = r"""
+import sys
+from services.metrics import metrics, http_request_duration
+metrics.configure(sys.argv[1])
+http_request_duration.observe(('search', 'search.search_books', 'GET', '200'), 0.2)
+metrics.flush(force=True)
+"""
+
+
+def _sample(text, name, **labels):
+    """Value of the sample with exactly these labels, or None."""
+    rendered = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(name + (f"{{{rendered}}}" if labels else "")) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+@pytest.fixture
+def shared_dir(tmp_path):
+    yield str(tmp_path / "metrics")
+    metrics.configure(None)
+
+
+def test_histogram_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(("a",), value)
+
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert _sample(text, "test_seconds_bucket", route="a", le="0.1") == 2
+    assert _sample(text, "test_seconds_bucket", route="a", le="1.0") == 3
+    assert _sample(text, "test_seconds_bucket", route="a", le="+Inf") == 4
+    assert _sample(text, "test_seconds_count", route="a") == 4
+    assert _sample(text, "test_seconds_sum", route="a") == pytest.approx(3.65)
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.histogram("test_seconds", "Test.", ("route",)).observe(('say "hi"\n',), 0.1)
+    assert 'route="say \\"hi\\"\\n"' in registry.render()
+
+
+def test_requests_timed_per_endpoint_and_status(client):
+    client.get("/catalog")
+    client.get("/catalog")
+    client.get("/api/books/999999")
+    client.get("/no/such/page")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+
+    assert _sample(text, "library_http_request_duration_seconds_count",
+                   blueprint="catalog", endpoint="catalog.catalog", method="GET", status="200") >= 2
+    assert _sample(text, "library_http_request_duration_seconds_count",
+                   blueprint="", endpoint="unmatched", method="GET", status="404") >= 1
+    assert _sample(text, "library_db_pool_max_size") == database.get_pool().max_size
+    assert _sample(text, "library_db_pool_created_total") >= 1
+
+
+def test_gateway_latency_recorded():
+    gateway = AsyncPaymentGateway()
+    gateway.PROCESS_DELAY = 0
+    before = http_request_duration.snapshot()
+    asyncio.run(call_gateway(gateway.process_payment, patron_id="123456", amount=5.0))
+
+    text = metrics.render()
+    assert _sample(text, "library_gateway_call_duration_seconds_count",
+                   gateway="AsyncPaymentGateway", method="process_payment", outcome="ok") >= 1
+    assert http_request_duration.snapshot() == before
+
+
+def test_resilient_gateway_calls_counted_once():
+    gateway = AsyncPaymentGateway()
+    gateway.PROCESS_DELAY = 0
+    labels = dict(gateway="AsyncPaymentGateway", method="process_payment", outcome="ok")
+    before = _sample(metrics.render(), "library_gateway_call_duration_seconds_count", **labels) or 0
+
+    asyncio.run(call_gateway(ResilientGateway(gateway).process_payment, patron_id="123456", amount=5.0))
+    text = metrics.render()
+    assert _sample(text, "library_gateway_call_duration_seconds_count", **labels) == before + 1
+    assert 'gateway="ResilientGateway"' not in text
+
+
+def test_multi_process_aggregation(temp_db, shared_dir):
+    metrics.configure(shared_dir)
+    labels = dict(blueprint="search", endpoint="search.search_books", method="GET", status="200")
+    baseline = _sample(metrics.render(), "library_http_request_duration_seconds_count", **labels) or 0
+
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", WORKER, shared_dir], cwd=ROOT, check=True)
+    http_request_duration.observe(tuple(labels.values()), 0.01)
+
+    text = metrics.render()
+    # Exited workers still count towards the histograms...
+    assert _sample(text, "library_http_request_duration_seconds_count", **labels) == baseline + 3
+    # ...but only live processes report pool gauges, labelled by pid
+    assert _sample(text, "library_db_pool_max_size", pid=str(os.getpid())) == database.get_pool().max_size
+    assert text.count("library_db_pool_max_size{") == 1
+    assert text.count("# TYPE library_db_pool_max_size gauge") == 1
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+import database
+from services.library_service import compute_late_fee, get_patron_status_report
+
+
+@pytest.fixture
+def patron_loans(temp_db):
+    now = datetime.now()
+    for i in range(3):
+        database.insert_book(f"Book {i}", f"Author {i}", f"{i:013d}", 2, 2)
+    # Returned loan, loan 3 days overdue, loan 20 days overdue, loan not yet due
+    database.insert_borrow_record("123456", 1, now - timedelta(days=60), now - timedelta(days=46))
+    database.update_borrow_record_return_date("123456", 1, now - timedelta(days=50))
+    database.insert_borrow_record("123456", 2, now - timedelta(days=17, hours=1), now - timedelta(days=3, hours=1))
+    database.insert_borrow_record("123456", 3, now - timedelta(days=34, hours=1), now - timedelta(days=20, hours=1))
+    database.insert_borrow_record("123456", 1, now - timedelta(days=1), now + timedelta(days=13))
+
+
+@pytest.mark.parametrize("days,fee", [(0, 0.0), (-4, 0.0), (3, 1.5), (7, 3.5), (10, 6.5), (40, 15.0)])
+def test_compute_late_fee(days, fee):
+    due = datetime(2025, 1, 1)
+    assert compute_late_fee(due, due + timedelta(days=days)) == (fee, max(days, 0))
+
+
+def test_report_includes_returned_loans(patron_loans):
+    report = get_patron_status_report("123456")
+    assert report["num_current_borrowed"] == 3
+    assert len(report["borrow_history"]) == 4
+    returned = report["borrow_history"][0]
+    assert returned["title"] == "Book 0" and returned["return_date"] != "Not Returned"
+    assert [h["return_date"] for h in report["borrow_history"][1:]] == ["Not Returned"] * 3
+
+
+def test_report_late_fees(patron_loans):
+    # 3 days -> $1.50, 20 days -> $16.50 capped to $15.00
+    assert get_patron_status_report("123456")["late_fees"] == 16.5
+
+
+def test_report_uses_one_query(patron_loans):
+    conn = database.get_db_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    get_patron_status_report("123456")
+    conn.set_trace_callback(None)
+    conn.close()
+    assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1
+
+
+def test_unknown_patron_has_empty_report(patron_loans):
+    report = get_patron_status_report("654321")
+    assert report["num_current_borrowed"] == 0
+    assert report["borrow_history"] == [] and report["late_fees"] == 0
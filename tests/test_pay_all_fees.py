@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+import database
+from services.library_service import pay_all_late_fees
+from services.payment_service import AsyncPaymentGateway, PaymentGateway
+
+
+def _loan(patron_id, book_id, days_late, returned=False):
+    due = datetime.now() - timedelta(days=days_late, hours=1)
+    database.insert_borrow_record(patron_id, book_id, due - timedelta(days=14), due)
+    if returned:
+        database.update_borrow_record_return_date(patron_id, book_id, datetime.now())
+
+
+@pytest.fixture
+def overdue_patron(temp_db):
+    for i in range(4):
+        database.insert_book(f"Book {i}", "Author", f"{i:013d}", 3, 3)
+    _loan("123456", 1, 30, returned=True)  # returned, not owed
+    _loan("123456", 2, 3)    # $1.50
+    _loan("123456", 3, 10)   # $6.50
+    _loan("123456", 4, -5)   # not due yet
+    return "123456"
+
+
+@pytest.fixture
+def gateway():
+    mock = Mock(spec=PaymentGateway)
+    mock.process_payment.return_value = (True, "txn_123456_1", "Payment of $8.00 processed successfully")
+    return mock
+
+
+def test_one_charge_with_line_items(overdue_patron, gateway):
+    success, message, txn = pay_all_late_fees(overdue_patron, gateway)
+
+    assert success and txn == "txn_123456_1"
+    gateway.process_payment.assert_called_once()
+    kwargs = gateway.process_payment.call_args.kwargs
+    assert kwargs["amount"] == 8.0
+    assert sorted((i["book_id"], i["amount"]) for i in kwargs["line_items"]) == [(2, 1.5), (3, 6.5)]
+
+
+def test_allocation_is_recorded(overdue_patron, gateway):
+    _, _, txn = pay_all_late_fees(overdue_patron, gateway)
+    allocations = database.get_payment_allocations(txn)
+    assert sorted((a["book_id"], a["amount"]) for a in allocations) == [(2, 1.5), (3, 6.5)]
+
+
+def test_declined_charge_records_nothing(overdue_patron, gateway):
+    gateway.process_payment.return_value = (False, "", "declined")
+    success, message, txn = pay_all_late_fees(overdue_patron, gateway)
+    assert not success and "declined" in message and txn is None
+    assert database.get_payment_allocations("txn_123456_1") == []
+
+
+def test_no_fees_means_no_charge(temp_db, gateway):
+    success, message, _ = pay_all_late_fees("654321", gateway)
+    assert not success and "no late fees" in message.lower()
+    gateway.process_payment.assert_not_called()
+
+
+def test_invalid_patron(gateway):
+    assert not pay_all_late_fees("12ab", gateway)[0]
+
+
+def test_gateway_rejects_mismatched_line_items():
+    gw = PaymentGateway()
+    gw.PROCESS_DELAY = 0
+    success, _, message = gw.process_payment("123456", 5.0, line_items=[{"amount": 2.0}])
+    assert not success and "line items" in message.lower()
+
+
+def test_pay_all_route(client, monkeypatch):
+    monkeypatch.setattr(AsyncPaymentGateway, "PROCESS_DELAY", 0)
+    # Sample data: patron 123456 has 1984 out, not yet due
+    assert client.post("/api/late_fee/123456/pay_all").status_code == 400
+    _loan("111111", 1, 9)
+    response = client.post("/api/late_fee/111111/pay_all")
+    body = response.get_json()
+    assert response.status_code == 200 and body["success"]
+    assert [(a["book_id"], a["amount"]) for a in body["allocations"]] == [(1, 5.5)]
@@ -0,0 +1,170 @@
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+import database
+from services import payment_jobs as jobs_module
+from services.payment_jobs import PaymentJobQueue
+from services.payment_service import PaymentGateway
+
+
+@pytest.fixture
+def gateway():
+    mock = Mock(spec=PaymentGateway)
+    mock.process_payment.return_value = (True, "txn_123456_1", "ok")
+    mock.refund_payment.return_value = (True, "refunded")
+    return mock
+
+
+@pytest.fixture
+def overdue_loan(temp_db):
+    database.insert_book("Job Book", "Author", "1234567890123", 2, 2)
+    due = datetime.now() - timedelta(days=3, hours=1)
+    database.insert_borrow_record("123456", 1, due - timedelta(days=14), due)
+    return "123456", 1
+
+
+@pytest.fixture
+def queue(gateway, monkeypatch):
+    queue = PaymentJobQueue(gateway)
+    monkeypatch.setattr(jobs_module, "payment_jobs", queue)
+    yield queue
+    queue.stop()
+
+
+def test_job_runs_in_the_background(overdue_loan, queue, gateway):
+    queue.start(2)
+    success, _, job_id = jobs_module.queue_late_fee_payment(*overdue_loan)
+    assert success
+
+    job = queue.wait(job_id, timeout=5)
+    assert job["status"] == "succeeded" and job["attempts"] == 1
+    assert job["result"]["transaction_id"] == "txn_123456_1"
+    assert database.get_payment(job_id)["status"] == "succeeded"
+    gateway.process_payment.assert_called_once()
+
+
+def test_failed_payment_marks_the_job_failed(overdue_loan, queue, gateway):
+    gateway.process_payment.return_value = (False, "", "declined")
+    queue.start(1)
+    _, _, job_id = jobs_module.queue_all_late_fees_payment("123456")
+    job = queue.wait(job_id, timeout=5)
+    assert job["status"] == "failed" and "declined" in job["result"]["message"]
+
+
+def _age(table, key_column, key, seconds):
+    """Move a row's updated_at back in time, as if its worker had stopped `seconds` ago."""
+    past = (datetime.now() - timedelta(seconds=seconds + 1)).isoformat()
+    conn = database.get_db_connection()
+    conn.execute(f"UPDATE {table} SET updated_at = ? WHERE {key_column} = ?", (past, key))
+    conn.commit()
+    conn.close()
+
+
+def test_unfinished_jobs_resume_after_restart(overdue_loan, gateway):
+    # Stored by a process that stopped before running it
+    database.insert_payment_job("job_left_over", "pay", {"patron_id": "123456", "book_id": 1})
+    queue = PaymentJobQueue(gateway)
+    try:
+        assert queue.start(1) == 1
+        assert queue.wait("job_left_over", timeout=5)["status"] == "succeeded"
+    finally:
+        queue.stop()
+
+
+def test_interrupted_charge_is_not_repeated(overdue_loan, gateway):
+    queue = PaymentJobQueue(gateway)
+    database.insert_payment_job("job_crashed", "pay", {"patron_id": "123456", "book_id": 1})
+    database.start_payment_job("job_crashed")
+    # The charge went through, but the process died before the job was marked finished
+    database.claim_payment("job_crashed", "charge", 1.5, "123456")
+    database.finish_payment("job_crashed", True, "txn_123456_0", "Payment successful! ok")
+    _age("payment_jobs", "id", "job_crashed", database.PAYMENT_JOB_LEASE)
+    try:
+        queue.start(1)
+        job = queue.wait("job_crashed", timeout=5)
+    finally:
+        queue.stop()
+    assert job["status"] == "succeeded" and job["attempts"] == 2
+    assert job["result"]["transaction_id"] == "txn_123456_0"
+    gateway.process_payment.assert_not_called()
+
+
+def test_running_job_of_a_live_worker_is_left_alone(overdue_loan, gateway):
+    database.insert_payment_job("job_elsewhere", "pay", {"patron_id": "123456", "book_id": 1})
+    assert database.start_payment_job("job_elsewhere") is not None
+    queue = PaymentJobQueue(gateway)
+    try:
+        # Its worker holds the lease, so this worker neither requeues nor claims it
+        assert queue.start(1) == 0
+        assert database.start_payment_job("job_elsewhere") is None
+    finally:
+        queue.stop()
+    gateway.process_payment.assert_not_called()
+
+
+def test_job_with_pending_charge_waits_for_the_ledger(overdue_loan, gateway):
+    database.insert_payment_job("job_pending", "pay", {"patron_id": "123456", "book_id": 1})
+    database.start_payment_job("job_pending")
+    # The process died mid-charge: the gateway may or may not have taken the money
+    database.claim_payment("job_pending", "charge", 1.5, "123456")
+    _age("payment_jobs", "id", "job_pending", database.PAYMENT_JOB_LEASE)
+
+    queue = PaymentJobQueue(gateway)
+    try:
+        queue.start(1)
+        job = queue.wait("job_pending", timeout=5)
+        assert job["status"] == "queued" and job["run_after"] is not None
+        assert "already in progress" in job["result"]["message"]
+        assert database.get_unfinished_payment_jobs() == []
+        gateway.process_payment.assert_not_called()
+
+        # Once the ledger gives up on the pending entry, the job is retried
+        _age("payments", "idempotency_key", "job_pending", database.PAYMENT_PENDING_TIMEOUT)
+        conn = database.get_db_connection()
+        conn.execute("UPDATE payment_jobs SET run_after = NULL WHERE id = 'job_pending'")
+        conn.commit()
+        conn.close()
+        assert queue._requeue() == 1
+        job = queue.wait("job_pending", timeout=5)
+    finally:
+        queue.stop()
+    assert job["status"] == "succeeded" and job["attempts"] == 3
+    gateway.process_payment.assert_called_once()
+
+
+def test_queueing_requires_running_workers(temp_db, queue):
+    success, message, job_id = jobs_module.queue_late_fee_refund("txn_123456_1", 5.0)
+    assert not success and job_id is None
+
+
+def test_job_endpoints(client, queue, gateway):
+    queue.start(1)
+    response = client.post("/api/payment_jobs", json={"kind": "refund", "transaction_id": "txn_1", "amount": 2})
+    assert response.status_code == 202
+    body = response.get_json()
+
+    queue.wait(body["job_id"], timeout=5)
+    job = client.get(body["status_url"]).get_json()
+    assert job["status"] == "succeeded" and job["kind"] == "refund"
+
+    assert client.post("/api/payment_jobs", json={"kind": "pay"}).status_code == 400
+    assert client.post("/api/payment_jobs", json={"kind": "other"}).status_code == 400
+    assert client.get("/api/payment_jobs/job_missing").status_code == 404
+
+
+def test_catalog_stays_fast_while_payments_queue(client, queue, gateway):
+    def slow_refund(transaction_id, amount):
+        time.sleep(0.2)
+        return True, "refunded"
+
+    gateway.refund_payment.side_effect = slow_refund
+    queue.start(1)
+    for i in range(5):
+        job = {"kind": "refund", "transaction_id": f"txn_000001_{i}", "amount": 1}
+        assert client.post("/api/payment_jobs", json=job).status_code == 202
+
+    began = time.perf_counter()
+    assert client.get("/catalog").status_code == 200
+    assert time.perf_counter() - began < 0.2
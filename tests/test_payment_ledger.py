@@ -0,0 +1,114 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+import database
+from services.library_service import (
+    calculate_late_fee_for_book, pay_late_fees, pay_all_late_fees, refund_late_fee_payment
+)
+from services.payment_service import PaymentGateway
+
+
+@pytest.fixture
+def overdue_loan(temp_db):
+    database.insert_book("Ledger Book", "Author", "1234567890123", 2, 2)
+    due = datetime.now() - timedelta(days=10, hours=1)
+    database.insert_borrow_record("123456", 1, due - timedelta(days=14), due)
+    return "123456", 1
+
+
+@pytest.fixture
+def gateway():
+    mock = Mock(spec=PaymentGateway)
+    mock.process_payment.return_value = (True, "txn_123456_1", "Payment of $6.50 processed successfully")
+    mock.refund_payment.return_value = (True, "Refund processed")
+    return mock
+
+
+def test_same_key_is_charged_once(overdue_loan, gateway):
+    first = pay_late_fees(*overdue_loan, gateway, idempotency_key="pay-1")
+    second = pay_late_fees(*overdue_loan, gateway, idempotency_key="pay-1")
+
+    assert first == second
+    assert first[0] and first[2] == "txn_123456_1"
+    gateway.process_payment.assert_called_once()
+
+
+def test_paid_fee_is_not_owed_again(overdue_loan, gateway):
+    pay_late_fees(*overdue_loan, gateway)
+
+    assert calculate_late_fee_for_book(*overdue_loan)["fee_amount"] == 0.0
+    success, message, _ = pay_late_fees(*overdue_loan, gateway)
+    assert not success and "no late fees" in message.lower()
+    success, message, _ = pay_all_late_fees(overdue_loan[0], gateway)
+    assert not success
+    gateway.process_payment.assert_called_once()
+
+
+def test_failed_attempt_can_be_retried(overdue_loan, gateway):
+    gateway.process_payment.return_value = (False, "", "declined")
+    assert not pay_late_fees(*overdue_loan, gateway, idempotency_key="pay-2")[0]
+
+    gateway.process_payment.return_value = (True, "txn_123456_2", "ok")
+    success, _, txn = pay_late_fees(*overdue_loan, gateway, idempotency_key="pay-2")
+    assert success and txn == "txn_123456_2"
+    assert database.get_payment("pay-2")["status"] == "succeeded"
+
+
+def test_refund_cannot_exceed_charge(overdue_loan, gateway):
+    _, _, txn = pay_late_fees(*overdue_loan, gateway)
+
+    success, message = refund_late_fee_payment(txn, 10.0, gateway)
+    assert not success and "exceeds the amount charged" in message
+    assert refund_late_fee_payment(txn, 4.0, gateway)[0]
+    assert not refund_late_fee_payment(txn, 4.0, gateway)[0]
+    gateway.refund_payment.assert_called_once_with(txn, 4.0)
+
+
+def test_refunded_fee_is_owed_again(overdue_loan, gateway):
+    _, _, txn = pay_late_fees(*overdue_loan, gateway)
+    assert calculate_late_fee_for_book(*overdue_loan)["fee_amount"] == 0.0
+
+    assert refund_late_fee_payment(txn, 4.0, gateway, idempotency_key="refund-1")[0]
+    assert calculate_late_fee_for_book(*overdue_loan)["fee_amount"] == 4.0
+    # Replaying the refund does not net it out twice
+    assert refund_late_fee_payment(txn, 4.0, gateway, idempotency_key="refund-1")[0]
+    assert database.get_open_loan(*overdue_loan)["paid"] == pytest.approx(2.5)
+    assert sum(a["amount"] for a in database.get_payment_allocations(txn)) == pytest.approx(2.5)
+
+
+def test_pay_endpoint_honours_idempotency_key(client, mocker):
+    mock = mocker.patch("services.library_service.AsyncPaymentGateway")
+    mock.return_value.process_payment.return_value = (True, "txn_000001_1", "ok")
+    database.insert_book("Api Book", "Author", "9999999999999", 1, 1)
+    book_id = database.get_book_by_isbn("9999999999999")["id"]
+    due = datetime.now() - timedelta(days=3, hours=1)
+    database.insert_borrow_record("000001", book_id, due - timedelta(days=14), due)
+
+    headers = {"Idempotency-Key": "api-1"}
+    first = client.post(f"/api/late_fee/000001/{book_id}/pay", headers=headers)
+    second = client.post(f"/api/late_fee/000001/{book_id}/pay", headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_json() == second.get_json()
+    mock.return_value.process_payment.assert_called_once()
+
+
+def test_concurrent_calls_without_a_key_are_charged_once(overdue_loan):
+    charged = []
+
+    def process_payment(patron_id, amount, description):
+        charged.append(amount)
+        time.sleep(0.2)
+        return True, "txn_123456_3", "ok"
+
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = process_payment
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(lambda _: pay_late_fees(*overdue_loan, gateway), range(2)))
+
+    assert charged == [6.5]
+    assert sum(success for success, _, _ in results) == 1
+    assert database.get_open_loan(*overdue_loan)["paid"] == pytest.approx(6.5)
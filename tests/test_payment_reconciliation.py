@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+import database
+from services.payment_service import PaymentGateway, PaymentStatusCache
+from services.reconciliation import reconcile_payments
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_only_keeps_terminal_statuses():
+    cache = PaymentStatusCache()
+    assert cache.put("txn_1", {"status": "completed"})
+    assert not cache.put("txn_2", {"status": "pending"})
+    assert not cache.put("txn_3", {"status": "not_found"})
+    assert cache.get("txn_1") == {"status": "completed"}
+    assert cache.get("txn_2") is None
+
+
+def test_cache_entries_expire():
+    clock = Clock()
+    cache = PaymentStatusCache(ttl=10, clock=clock)
+    cache.put("txn_1", {"status": "completed"})
+    clock.now = 9.9
+    assert cache.get("txn_1") is not None
+    clock.now = 10.0
+    assert cache.get("txn_1") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = PaymentStatusCache(maxsize=2)
+    cache.put("txn_1", {"status": "completed"})
+    cache.put("txn_2", {"status": "completed"})
+    cache.get("txn_1")
+    cache.put("txn_3", {"status": "failed"})
+    assert cache.get("txn_2") is None
+    assert cache.get("txn_1") and cache.get("txn_3")
+
+
+def test_gateway_skips_the_round_trip_for_cached_statuses(mocker):
+    lookup = mocker.patch("services.payment_service._status_result",
+                          side_effect=[{"status": "pending"}, {"status": "completed"}, {"status": "failed"}])
+    gateway = PaymentGateway(status_cache=PaymentStatusCache())
+    gateway.STATUS_DELAY = 0
+
+    assert gateway.verify_payment_status("txn_1")["status"] == "pending"
+    assert gateway.verify_payment_status("txn_1")["status"] == "completed"
+    assert gateway.verify_payment_status("txn_1")["status"] == "completed"
+    assert lookup.call_count == 2
+
+
+class CountingGateway:
+    """Async stub that records the most lookups it ever had in flight."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.active = self.peak = 0
+
+    async def verify_payment_status(self, transaction_id):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.001)
+        self.active -= 1
+        status = self.statuses[transaction_id]
+        if isinstance(status, Exception):
+            raise status
+        return {"transaction_id": transaction_id, "status": status}
+
+
+def test_reconciliation_bounds_concurrency_and_stores_results(temp_db):
+    statuses = {f"txn_{i}": "completed" for i in range(20)}
+    statuses["txn_pending"] = "pending"
+    statuses["txn_broken"] = ConnectionError("timeout")
+    gateway = CountingGateway(statuses)
+
+    report = reconcile_payments(list(statuses), gateway, concurrency=4)
+
+    assert gateway.peak == 4
+    assert report["checked"] == 22 and report["errors"] == 1
+    assert report["by_status"] == {"completed": 20, "pending": 1}
+    assert database.get_payment_status("txn_3")["final"] == 1
+    assert database.get_payment_status("txn_pending")["final"] == 0
+    assert database.get_payment_status("txn_broken") is None
+
+
+def test_reconciliation_defaults_to_unsettled_charges(temp_db):
+    for key, txn in (("a", "txn_a"), ("b", "txn_b")):
+        database.claim_payment(key, "charge", 5.0, "123456")
+        database.finish_payment(key, True, txn, "ok")
+    database.record_payment_statuses([("txn_a", "completed", True)])
+
+    assert database.get_unreconciled_transactions() == ["txn_b"]
+    report = reconcile_payments(payment_gateway=CountingGateway({"txn_b": "completed"}))
+    assert report["checked"] == 1
+    assert database.get_unreconciled_transactions() == []
+
+
+def test_concurrency_must_be_positive(temp_db):
+    with pytest.raises(ValueError):
+        reconcile_payments([], CountingGateway({}), concurrency=0)
+
+
+def test_refund_reopens_a_completed_charge(temp_db):
+    from services.library_service import refund_late_fee_payment
+    from services.payment_service import payment_status_cache
+
+    database.claim_payment("c", "charge", 5.0, "123456")
+    database.finish_payment("c", True, "txn_c", "ok")
+    gateway = PaymentGateway()
+    assert gateway.verify_payment_status("txn_c")["status"] == "completed"
+    database.record_payment_statuses([("txn_c", "completed", True)])
+    assert database.get_unreconciled_transactions() == []
+
+    assert refund_late_fee_payment("txn_c", 5.0, gateway)[0]
+    assert payment_status_cache.get("txn_c") is None
+    assert database.get_unreconciled_transactions() == ["txn_c"]
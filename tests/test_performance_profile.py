@@ -0,0 +1,51 @@
+import pytest
+import database
+from app import create_app
+
+
+@pytest.fixture
+def restore_profile():
+    yield
+    database.set_performance_profile(database.DEFAULT_PROFILE)
+
+
+def _pragma(name):
+    conn = database.get_db_connection()
+    value = conn.execute(f"PRAGMA {name}").fetchone()[0]
+    conn.close()
+    return value
+
+
+def test_durable_profile_is_default(temp_db):
+    assert database.get_performance_profile() == "durable"
+    assert _pragma("journal_mode") == "wal"
+    assert _pragma("synchronous") == 2
+    assert _pragma("busy_timeout") == 5000
+
+
+def test_fast_profile_settings(temp_db, restore_profile):
+    database.set_performance_profile("fast")
+    database.init_database()
+    assert _pragma("journal_mode") == "wal"
+    assert _pragma("synchronous") == 1
+    assert _pragma("temp_store") == 2
+    assert _pragma("cache_size") == -64000
+
+
+def test_legacy_profile_uses_rollback_journal(temp_db, restore_profile):
+    database.set_performance_profile("legacy")
+    database.init_database()
+    assert _pragma("journal_mode") == "delete"
+
+
+def test_unknown_profile_rejected():
+    with pytest.raises(ValueError):
+        database.set_performance_profile("turbo")
+
+
+def test_profile_selected_from_create_app(tmp_path, monkeypatch, restore_profile):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "app.db"))
+    create_app({"DB_PROFILE": "fast", "PAYMENT_WORKERS": 0})
+    assert database.get_performance_profile() == "fast"
+    assert _pragma("synchronous") == 1
+    database.close_pool()
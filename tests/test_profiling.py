@@ -0,0 +1,85 @@
+import os
+import pstats
+
+import pytest
+import database
+from app import create_app
+from services.profiling import ProfileRateLimiter, sign_profile_request, verify_profile_request
+from services.search_index import catalog_index
+
+SECRET = "profiling-secret"
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "library.db"))
+
+    def make(**config):
+        return create_app({"TESTING": True, "SAMPLE_DATA": True, "PAYMENT_WORKERS": 0,
+                           "PROFILE_DIR": str(tmp_path / "profiles"), **config})
+
+    yield make
+    database.remove_book_listener(catalog_index.add)
+    database.close_pool()
+
+
+def test_signed_tokens():
+    token = sign_profile_request(SECRET, "/api/search")
+    assert verify_profile_request(SECRET, "/api/search", token)
+    assert not verify_profile_request(SECRET, "/catalog", token)
+    assert not verify_profile_request("other", "/api/search", token)
+    assert not verify_profile_request(SECRET, "/api/search", sign_profile_request(SECRET, "/api/search", ttl=-1))
+    assert not verify_profile_request(SECRET, "/api/search", "garbage")
+
+
+def test_rate_limiter():
+    now = [0.0]
+    limiter = ProfileRateLimiter(per_minute=2, clock=lambda: now[0])
+    assert limiter.acquire() and limiter.acquire()
+    assert not limiter.acquire()
+    now[0] += 30
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert limiter.denied == 2
+
+
+def test_off_by_default(make_app):
+    app = make_app()
+    response = app.test_client().get("/api/search?q=gatsby")
+    assert "X-Profile-Id" not in response.headers
+    assert "profile_rate_limiter" not in app.extensions
+
+
+def test_signed_header_writes_pstats(make_app):
+    app = make_app(PROFILE_SECRET=SECRET)
+    client = app.test_client()
+
+    assert "X-Profile-Id" not in client.get("/api/search?q=gatsby").headers
+    bad = client.get("/api/search?q=gatsby", headers={"X-Profile": sign_profile_request("wrong", "/api/search")})
+    assert "X-Profile-Id" not in bad.headers
+
+    response = client.get("/api/search?q=gatsby", headers={"X-Profile": sign_profile_request(SECRET, "/api/search")})
+    name = response.headers["X-Profile-Id"]
+    assert name.endswith(".prof") and "api.search" in name
+    stats = pstats.Stats(os.path.join(app.config["PROFILE_DIR"], name))
+    assert any(func[2] == "search_books_in_catalog" for func in stats.stats)
+
+
+def test_sampling_profiler_and_rate_limit(make_app):
+    app = make_app(PROFILER="sampling", PROFILE_SAMPLE_RATE=1.0, PROFILE_MAX_PER_MINUTE=2)
+    client = app.test_client()
+
+    names = [client.get("/catalog").headers.get("X-Profile-Id") for _ in range(3)]
+    assert names[0] and names[1] and names[0] != names[1]
+    assert names[2] is None
+    assert app.extensions["profile_rate_limiter"].denied == 1
+    assert names[0].endswith(".folded")
+    with open(os.path.join(app.config["PROFILE_DIR"], names[0])) as f:
+        for line in f:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) >= 1 and stack
+
+
+def test_unknown_profiler_rejected(make_app):
+    with pytest.raises(ValueError):
+        make_app(PROFILER="perf")
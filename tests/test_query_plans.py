@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+import database
+
+
+def _plans(helper, *args):
+    """Run a helper and return the EXPLAIN QUERY PLAN rows of every statement it issued."""
+    conn = database.get_db_connection()  # hold the lease so the helper shares this connection
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        helper(*args)
+    finally:
+        conn.set_trace_callback(None)
+    plans = {}
+    for sql in statements:
+        if sql.lstrip().upper().startswith(("SELECT", "UPDATE", "INSERT", "DELETE")):
+            plans[sql] = [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    conn.close()
+    return plans
+
+
+@pytest.fixture
+def loans(temp_db):
+    now = datetime.now()
+    for i in range(20):
+        database.insert_book(f"Book {i}", f"Author {i}", f"{i:013d}", 5, 5)
+    for patron in range(50):
+        for book_id in range(1, 4):
+            database.insert_borrow_record(f"{patron:06d}", book_id, now, now + timedelta(days=14))
+    database.update_borrow_record_return_date("000001", 1, now)
+
+
+HELPERS = [
+    ("get_patron_borrowed_books", lambda: database.get_patron_borrowed_books("000002")),
+    ("get_patron_borrow_count", lambda: database.get_patron_borrow_count("000002")),
+    ("get_patron_loan_history", lambda: database.get_patron_loan_history("000001")),
+    ("get_open_loan", lambda: database.get_open_loan("000002", 1)),
+    ("update_borrow_record_return_date",
+     lambda: database.update_borrow_record_return_date("000003", 2, datetime.now())),
+    ("return_book_transaction", lambda: database.return_book_transaction("000004", 2, datetime.now())),
+    ("borrow_book_transaction",
+     lambda: database.borrow_book_transaction("000005", 4, datetime.now(), datetime.now())),
+]
+
+
+@pytest.mark.parametrize("name,call", HELPERS, ids=[name for name, _ in HELPERS])
+def test_helper_never_scans_borrow_records(loans, name, call):
+    plans = _plans(call)
+    assert plans, f"{name} issued no statements"
+    for sql, details in plans.items():
+        scans = [d for d in details if d.startswith("SCAN")]
+        assert not scans, f"{name} regressed to a table scan: {scans}\n{sql}"
+
+
+def test_open_loan_index_exists(temp_db):
+    conn = database.get_db_connection()
+    names = [row["name"] for row in conn.execute("PRAGMA index_list(borrow_records)")]
+    conn.close()
+    assert "idx_borrow_records_open" in names
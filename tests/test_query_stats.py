@@ -0,0 +1,98 @@
+import json
+import logging
+
+import pytest
+import database
+from app import create_app
+from services.search_index import catalog_index
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    """Build a test client with extra config; query stats are switched off again afterwards."""
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "library.db"))
+
+    def make(**config):
+        app = create_app({"TESTING": True, "SAMPLE_DATA": True, "PAYMENT_WORKERS": 0, **config})
+        return app.test_client()
+
+    yield make
+    database.set_query_stats_enabled(False)
+    database.remove_book_listener(catalog_index.add)
+    database.close_pool()
+
+
+@pytest.fixture
+def stats_enabled(temp_db):
+    database.set_query_stats_enabled(True)
+    yield
+    database.stop_query_stats()
+    database.set_query_stats_enabled(False)
+
+
+def test_statements_grouped_by_sql(stats_enabled):
+    # Open the connection first so its PRAGMAs are not counted
+    database.get_db_connection().close()
+    stats = database.start_query_stats()
+    for book_id in (1, 2, 3):
+        database.get_book_by_id(book_id)
+    conn = database.get_db_connection()
+    rows = list(conn.execute("SELECT 1 UNION ALL SELECT 2"))
+    conn.close()
+    assert database.stop_query_stats() is stats
+
+    assert len(rows) == 2
+    assert stats.count == 4
+    assert stats.seconds > 0
+    calls = {entry["sql"]: entry["calls"] for entry in stats.slowest(10)}
+    assert calls["SELECT * FROM books WHERE id = ?"] == 3
+    assert calls["SELECT 1 UNION ALL SELECT 2"] == 1
+
+
+def test_nothing_recorded_outside_a_request(stats_enabled):
+    assert database.get_query_stats() is None
+    assert database.get_all_books() == []
+
+
+def test_disabled_by_default(make_client):
+    client = make_client()
+    assert not database.query_stats_enabled()
+    assert isinstance(database.get_db_connection(), database.PooledConnection)
+    assert not isinstance(database.get_db_connection(), database.InstrumentedConnection)
+
+    response = client.get("/api/late_fee/123456/1")
+    assert "X-DB-Query-Count" not in response.headers
+
+
+def test_debug_headers(make_client):
+    client = make_client(DEBUG=True)
+    assert database.query_stats_enabled()
+
+    response = client.get("/api/late_fee/123456/1")
+    assert response.status_code == 200
+    assert int(response.headers["X-DB-Query-Count"]) >= 2
+    assert float(response.headers["X-DB-Time-Ms"]) > 0
+    assert "\n" not in response.headers["X-DB-Slowest-Query"]
+    assert float(response.headers["X-DB-Slowest-Query-Ms"]) <= float(response.headers["X-DB-Time-Ms"])
+
+
+def test_slow_query_log(make_client, caplog):
+    client = make_client(DB_QUERY_STATS=True, DB_SLOW_QUERY_MS=0)
+
+    with caplog.at_level(logging.WARNING, logger="library.slow_queries"):
+        response = client.get("/api/late_fee/123456/1")
+    # Not in debug mode: the log is written but no headers are sent
+    assert "X-DB-Query-Count" not in response.headers
+
+    records = [json.loads(record.getMessage()) for record in caplog.records]
+    assert records
+    assert {record["event"] for record in records} == {"slow_query"}
+    assert {record["path"] for record in records} == {"/api/late_fee/123456/1"}
+    assert "SELECT * FROM books WHERE id = ?" in [record["sql"] for record in records]
+    assert records == sorted(records, key=lambda record: record["max_ms"], reverse=True)
+
+    caplog.clear()
+    client = make_client(DB_QUERY_STATS=True, DB_SLOW_QUERY_MS=None)
+    with caplog.at_level(logging.WARNING, logger="library.slow_queries"):
+        client.get("/api/late_fee/123456/1")
+    assert not caplog.records
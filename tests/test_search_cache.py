@@ -0,0 +1,108 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+import database
+from services.library_service import search_books_in_catalog
+from services.search_cache import SearchCache, search_cache
+
+
+@pytest.fixture
+def catalog(temp_db):
+    database.insert_book("The Great Gatsby", "F. Scott Fitzgerald", "9780743273565", 2, 2)
+    database.insert_book("Great Expectations", "Charles Dickens", "9780141439563", 1, 1)
+    database.insert_book("Emma", "Jane Austen", "9780141439587", 1, 1)
+    search_cache.clear()
+    yield
+    search_cache.clear()
+
+
+def test_repeated_query_is_served_from_cache(catalog, mocker):
+    first = search_books_in_catalog("great", "title")
+    spy = mocker.patch("services.library_service.search_books", side_effect=AssertionError("recomputed"))
+    hits = search_cache.hits
+
+    assert search_books_in_catalog("GREAT", "title") == first
+    assert search_cache.hits == hits + 1
+    spy.assert_not_called()
+
+
+def test_availability_change_invalidates_only_results_with_that_book(catalog):
+    search_books_in_catalog("great", "title")
+    search_books_in_catalog("emma", "title")
+    invalidations = search_cache.invalidations
+
+    database.borrow_book_transaction("123456", 3, datetime.now(), datetime.now())
+    assert search_cache.invalidations == invalidations + 1
+    assert search_books_in_catalog("emma", "title")[0]["available_copies"] == 0
+
+    hits = search_cache.hits
+    search_books_in_catalog("great", "title")
+    assert search_cache.hits == hits + 1
+
+
+@pytest.mark.parametrize("term, title", [
+    ("great", "A Great Day"),
+    ("gatsby great", "Gatsby the Great"),
+    ("cafe", "Café Society"),
+])
+def test_new_book_invalidates_full_text_results(catalog, term, title):
+    before = len(search_books_in_catalog(term, "title"))
+
+    database.insert_book(title, "Someone", "9780000000001", 1, 1)
+    assert len(search_books_in_catalog(term, "title")) == before + 1
+
+
+def test_new_book_invalidates_only_matching_trigram_results():
+    cache = SearchCache()
+    for term in ("great", "austen"):
+        key = ("trigram", "title", term)
+        cache.put(key, [], cache.get(key)[1])
+
+    cache.book_added({"id": 9, "title": "A Great Day", "author": "Someone", "isbn": "9780000000001"})
+    assert cache.get(("trigram", "title", "great"))[0] is None
+    assert cache.get(("trigram", "title", "austen"))[0] == []
+
+
+def test_writes_by_other_processes_clear_the_cache(catalog, temp_db):
+    assert search_books_in_catalog("emma", "title")[0]["available_copies"] == 1
+
+    conn = sqlite3.connect(temp_db)
+    conn.execute("UPDATE books SET available_copies = 0 WHERE id = 3")
+    conn.commit()
+    conn.close()
+    assert search_books_in_catalog("emma", "title")[0]["available_copies"] == 0
+
+
+def test_result_computed_across_a_write_is_not_stored():
+    cache = SearchCache()
+    key = ("fts", "title", "great")
+    _, generation = cache.get(key)
+    cache.book_changed(1)
+    cache.put(key, [{"id": 1}], generation)
+    assert cache.get(key)[0] is None
+
+
+def test_lru_eviction_and_counters():
+    cache = SearchCache(maxsize=2)
+    for term in ("a", "b"):
+        cache.put(("fts", "title", term), [{"id": 1}], cache.get(("fts", "title", term))[1])
+    cache.get(("fts", "title", "a"))
+    cache.put(("fts", "title", "c"), [], cache.get(("fts", "title", "c"))[1])
+
+    assert cache.get(("fts", "title", "b"))[0] is None
+    stats = cache.stats()
+    assert stats["size"] == 2 and stats["evictions"] == 1
+    assert stats["hits"] == 1
+
+
+def test_cached_results_are_copies(catalog):
+    search_books_in_catalog("emma", "title")[0]["title"] = "changed"
+    assert search_books_in_catalog("emma", "title")[0]["title"] == "Emma"
+
+
+def test_stats_endpoint(client):
+    client.get("/api/search?q=great")
+    client.get("/api/search?q=great")
+    stats = client.get("/api/search/cache").get_json()
+    assert stats["hits"] >= 1 and stats["size"] >= 1
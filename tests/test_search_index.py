@@ -0,0 +1,103 @@
+import pytest
+import database
+from services.library_service import search_books_in_catalog
+
+
+@pytest.fixture
+def catalog(temp_db):
+    database.insert_book("The Great Gatsby", "F. Scott Fitzgerald", "9780743273565", 3, 3)
+    database.insert_book("Great Expectations", "Charles Dickens", "9780141439563", 1, 1)
+    database.insert_book("The Greatest Showman", "Jenny Bicks", "9781234567890", 2, 2)
+    database.insert_book("To Kill a Mockingbird", "Harper Lee", "9780061120084", 2, 2)
+
+
+def titles(books):
+    return [book["title"] for book in books]
+
+
+def test_title_prefix_match_is_case_insensitive(catalog):
+    result = search_books_in_catalog("GREAT", "title")
+    assert set(titles(result)) == {"The Great Gatsby", "Great Expectations", "The Greatest Showman"}
+
+
+def test_all_words_must_match(catalog):
+    assert titles(search_books_in_catalog("great gats", "title")) == ["The Great Gatsby"]
+
+
+def test_author_search(catalog):
+    result = search_books_in_catalog("dickens", "author")
+    assert titles(result) == ["Great Expectations"]
+    assert set(result[0]) == {"id", "title", "author", "isbn", "available_copies", "total_copies"}
+
+
+def test_isbn_exact_and_prefix(catalog):
+    assert titles(search_books_in_catalog("9780743273565", "isbn")) == ["The Great Gatsby"]
+    assert len(search_books_in_catalog("978014", "isbn")) == 1
+    assert search_books_in_catalog("0743273565", "isbn") == []
+
+
+def test_index_follows_writes(catalog):
+    conn = database.get_db_connection()
+    conn.execute("UPDATE books SET title = 'Hard Times' WHERE isbn = '9780141439563'")
+    conn.execute("DELETE FROM books WHERE isbn = '9781234567890'")
+    conn.commit()
+    conn.close()
+    assert titles(search_books_in_catalog("great", "title")) == ["The Great Gatsby"]
+    assert titles(search_books_in_catalog("hard", "title")) == ["Hard Times"]
+
+
+def test_punctuation_only_term(catalog):
+    assert search_books_in_catalog("\"*", "title") == []
+
+
+def test_existing_books_indexed_on_upgrade(temp_db):
+    conn = database.get_db_connection()
+    for trigger in ("books_fts_insert", "books_fts_delete", "books_fts_update"):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("DROP TABLE books_fts")
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) "
+                 "VALUES ('Dune', 'Frank Herbert', '1111111111111', 1, 1)")
+    conn.commit()
+    conn.close()
+    database.init_database()
+    assert titles(search_books_in_catalog("dune", "title")) == ["Dune"]
+
+
+@pytest.fixture
+def search_client(library_db, monkeypatch):
+    """Build a test client for an app with the given SEARCH_BACKEND."""
+    from app import create_app
+    from services import library_service
+    from services.search_index import catalog_index
+
+    monkeypatch.setattr(library_service, "_search_backend", library_service.get_search_backend())
+    yield lambda backend: create_app({"TESTING": True, "SAMPLE_DATA": True, "PAYMENT_WORKERS": 0,
+                                      "SEARCH_BACKEND": backend}).test_client()
+    database.remove_book_listener(catalog_index.add)
+
+
+@pytest.mark.parametrize("backend, term, expected", [
+    ("trigram", "gatsby", ["The Great Gatsby"]),
+    ("trigram", "atsby", ["The Great Gatsby"]),
+    ("fts", "gatsby", ["The Great Gatsby"]),
+    ("fts", "atsby", []),
+])
+def test_search_backend_from_config(search_client, backend, term, expected):
+    client = search_client(backend)
+    body = client.get(f"/api/search?q={term}&type=title").get_json()
+    assert titles(body["results"]) == expected
+
+
+def test_fts_backend_is_used_even_with_the_index_built(search_client, mocker):
+    from services import library_service
+
+    search_client("trigram")
+    client = search_client("fts")
+    spy = mocker.spy(library_service, "search_books")
+    assert client.get("/api/search?q=great&type=title").get_json()["count"] >= 1
+    spy.assert_called_once()
+
+
+def test_unknown_search_backend_rejected(search_client):
+    with pytest.raises(ValueError):
+        search_client("elastic")
@@ -0,0 +1,120 @@
+import importlib
+import json
+import os
+import sys
+
+import pytest
+import database
+from app import create_app, prepare_database
+from services.search_index import catalog_index
+
+
+def _statements(call):
+    statements = []
+    original = database.get_db_connection
+
+    def traced():
+        conn = original()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    database.get_db_connection = traced
+    try:
+        call()
+    finally:
+        database.get_db_connection = original
+    return statements
+
+
+def test_current_schema_costs_one_read(temp_db):
+    assert database.get_schema_version() == (database.SCHEMA_VERSION, "WAL")
+
+    statements = _statements(database.init_database)
+    assert statements == ["SELECT version, journal_mode FROM schema_version"]
+
+
+def test_schema_reapplied_when_outdated_or_forced(temp_db):
+    conn = database.get_db_connection()
+    conn.execute("UPDATE schema_version SET version = 0")
+    conn.commit()
+    conn.close()
+    assert database.init_database()
+    assert database.get_schema_version()[0] == database.SCHEMA_VERSION
+
+    assert not database.init_database()
+    assert database.init_database(force=True)
+
+
+def test_journal_mode_change_reapplies_schema(temp_db):
+    database.set_performance_profile("legacy")
+    try:
+        assert database.init_database()
+        assert database.get_schema_version()[1] == "DELETE"
+    finally:
+        database.set_performance_profile(database.DEFAULT_PROFILE)
+
+
+def test_sample_data_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "library.db"))
+    create_app({"PAYMENT_WORKERS": 0, "SEARCH_INDEX": False})
+    assert database.get_all_books() == []
+
+    prepare_database(sample_data=True)
+    assert len(database.get_all_books()) == 3
+    database.close_pool()
+
+
+def test_init_db_command(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "library.db"))
+    app = create_app({"INIT_DATABASE": False, "PAYMENT_WORKERS": 0, "SEARCH_INDEX": False})
+    result = app.test_cli_runner().invoke(args=["init-db", "--sample-data"])
+    assert result.exit_code == 0 and "Schema applied." in result.output
+    assert len(database.get_all_books()) == 3
+    database.close_pool()
+
+
+def test_database_path_from_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", database.DATABASE)
+    path = str(tmp_path / "configured.db")
+    create_app({"DATABASE": path, "SAMPLE_DATA": True, "PAYMENT_WORKERS": 0, "SEARCH_INDEX": False})
+    assert database.DATABASE == path
+    assert len(database.get_all_books()) == 3
+    assert os.path.exists(path)
+    database.close_pool()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_preloaded_app_serves_from_forked_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "library.db"))
+    prepare_database(sample_data=True)
+    app = create_app({"INIT_DATABASE": False, "PAYMENT_WORKERS": 0})
+    database.close_pool()
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            response = app.test_client().get("/api/search?q=gatsby")
+            os.write(write, json.dumps(response.get_json()).encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        body = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    database.remove_book_listener(catalog_index.add)
+    assert body["count"] == 1
+
+
+def test_wsgi_starts_payment_workers_only_after_fork(temp_db, monkeypatch):
+    from services.payment_jobs import payment_jobs
+
+    monkeypatch.delitem(sys.modules, "wsgi", raising=False)
+    wsgi = importlib.import_module("wsgi")
+    try:
+        assert not payment_jobs.running
+        wsgi.app.test_client().get("/api/books/1")
+        assert payment_jobs.running
+    finally:
+        payment_jobs.stop()
+        database.remove_book_listener(catalog_index.add)
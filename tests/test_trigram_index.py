@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+import database
+from services.library_service import search_books_in_catalog
+from services.search_index import TrigramIndex, build_search_index, catalog_index, trigrams
+
+
+BOOKS = [
+    ("The Great Gatsby", "F. Scott Fitzgerald", "9780743273565"),
+    ("To Kill a Mockingbird", "Harper Lee", "9780061120084"),
+    ("1984", "George Orwell", "9780451524935"),
+    ("Animal Farm", "George Orwell", "9780451526342"),
+]
+
+
+@pytest.fixture
+def index(temp_db):
+    for title, author, isbn in BOOKS:
+        database.insert_book(title, author, isbn, 1, 1)
+    build_search_index()
+    yield catalog_index
+    database.remove_book_listener(catalog_index.add)
+
+
+def linear_scan(term, field):
+    return sorted(b["title"] for b in database.get_all_books() if term.lower() in b[field].lower())
+
+
+def test_trigrams():
+    assert trigrams("Abcd") == {"abc", "bcd"}
+    assert trigrams("ab") == set()
+
+
+def test_substring_inside_word(index):
+    assert [b["author"] for b in search_books_in_catalog("arper", "author")] == ["Harper Lee"]
+
+
+@pytest.mark.parametrize("term,field", [
+    ("orwell", "author"), ("GEORGE", "author"), ("ill a mock", "title"), ("0451", "isbn"),
+    ("84", "title"), ("zzz", "title"), ("ma", "title"),
+])
+def test_matches_linear_scan(index, term, field):
+    assert sorted(b["title"] for b in search_books_in_catalog(term, field)) == linear_scan(term, field)
+
+
+@pytest.mark.parametrize("term", ["éc", "ÉC", "écl", "ÉCLAIR"])
+def test_short_terms_fold_non_ascii_case_like_long_ones(index, term):
+    database.insert_book("Éclair Stories", "Émile Zola", "9780000000002", 1, 1)
+    assert [b["title"] for b in search_books_in_catalog(term, "title")] == ["Éclair Stories"]
+
+
+def test_new_books_are_indexed(index):
+    database.insert_book("Brave New World", "Aldous Huxley", "9780060850524", 1, 1)
+    assert [b["title"] for b in search_books_in_catalog("new wor", "title")] == ["Brave New World"]
+
+
+def test_results_carry_current_availability(index):
+    book = search_books_in_catalog("gatsby", "title")[0]
+    database.update_book_availability(book["id"], -1)
+    assert search_books_in_catalog("gatsby", "title")[0]["available_copies"] == 0
+
+
+def test_index_for_other_database_is_ignored(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "other.db"))
+    assert not catalog_index.ready
+
+
+def test_memory_report(index):
+    report = index.memory_usage()
+    assert report["books"] == len(BOOKS)
+    assert report["trigrams"] > 0
+    assert report["total_bytes"] >= report["posting_bytes"] > 0
+
+
+def test_out_of_order_add_keeps_postings_sorted(temp_db):
+    idx = TrigramIndex()
+    idx.build([])
+    idx.add({"id": 5, "title": "abc", "author": "x", "isbn": "1"})
+    idx.add({"id": 2, "title": "abc", "author": "x", "isbn": "1"})
+    assert idx.candidates("abc", "title") == [2, 5]
+
+
+def test_books_inserted_elsewhere_are_found(index):
+    # Another process (a second worker, the import CLI) writes without notifying this index
+    conn = sqlite3.connect(database.DATABASE)
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) "
+                 "VALUES ('Dune', 'Frank Herbert', '9780441172719', 1, 1)")
+    conn.commit()
+    conn.close()
+
+    assert [b["title"] for b in search_books_in_catalog("dune", "title")] == ["Dune"]
+    assert index.memory_usage()["books"] == len(BOOKS) + 1
+    assert index.refresh() == 0
@@ -0,0 +1,38 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn --workers 4 --preload -c python:wsgi wsgi:app
+
+With --preload the parent process imports this module once: it prepares the
+database and loads the search index, and every worker starts from a copy of
+that state instead of repeating the work. Without --preload each worker
+imports it on its own, which costs one schema read once the database is current.
+
+Payment worker threads do not survive a fork, so they are never started in
+the parent: each worker process starts its own in post_fork() (when this
+module is also gunicorn's config, as above) or else on its first request.
+"""
+
+import database
+from app import create_app, prepare_database
+from services.payment_jobs import payment_jobs, PAYMENT_WORKERS
+
+prepare_database()
+app = create_app({'INIT_DATABASE': False, 'PAYMENT_WORKERS': 0})
+
+# Connections must not be shared across a fork; workers open their own
+database.close_pool()
+
+
+def start_payment_workers():
+    """Start this process's payment workers, resuming the jobs left queued or abandoned."""
+    if not payment_jobs.running:
+        payment_jobs.start(PAYMENT_WORKERS)
+
+
+def post_fork(server, worker):
+    """gunicorn hook, run in each worker process right after it is forked."""
+    start_payment_workers()
+
+
+app.before_request(start_payment_workers)